@@ -8,25 +8,30 @@ def user_type(request):
 def pharmacy_context(request):
     """Context processor para datos específicos de farmacias"""
     if request.user.is_authenticated and request.user.user_type == 'pharmacy':
-        from users.models import PharmacyProfile
-        try:
-            pharmacy = PharmacyProfile.objects.get(user=request.user)
-            # Órdenes pendientes de confirmación
-            pending_orders_count = pharmacy.orders.filter(order_status='paid').count()
-            # Productos con stock bajo
-            low_stock_count = pharmacy.products.filter(stock_quantity__lte=10, is_active=True).count()
+        from users.counters import PharmacyNavCounters
 
-            return {
-                'pending_orders_count': pending_orders_count,
-                'low_stock_count': low_stock_count,
-                'is_pharmacy': True,
-                'pharmacy_name': pharmacy.pharmacy_name,
-            }
-        except PharmacyProfile.DoesNotExist:
-            pass
+        # Valores perezosos: la farmacia y sus contadores salen del cache y solo
+        # se buscan si la plantilla los usa
+        counters = PharmacyNavCounters(request.user.pk)
+        return {
+            'pending_orders_count': counters.pending_orders_count,
+            'low_stock_count': counters.low_stock_count,
+            'is_pharmacy': counters.is_pharmacy,
+            'pharmacy_name': counters.pharmacy_name,
+        }
     elif request.user.is_authenticated:
-        # Contador de items en carrito para clientes
-        cart_items_count = len(request.session.get('cart', {}))
+        from orders.cart_storage import get_cart_storage
+        from orders.pricing import cached_cart_snapshot
+
+        def cart_items_count():
+            # Contador de items en carrito para clientes: si la vista ya revalidó
+            # el carrito se usa esa instantánea; si no, el conteo del backend
+            # (la sesión o un valor cacheado, sin consultas en el caso común)
+            snapshot = cached_cart_snapshot(request)
+            if snapshot is not None:
+                return len(snapshot.available_lines)
+            return get_cart_storage(request).count()
+
         return {
             'is_client': True,
             'cart_items_count': cart_items_count,
@@ -0,0 +1,27 @@
+import base64
+import json
+
+
+def encode_cursor(values):
+    """Codifica una posición de paginación como token opaco para URLs"""
+    data = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decodifica un token generado por encode_cursor.
+
+    Returns:
+        Los valores originales, o None si el token está vacío.
+
+    Raises:
+        ValueError: Si el token no es válido.
+    """
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(token + padding))
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError('Cursor inválido') from exc
@@ -0,0 +1,157 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from django.db.models import Q
+from .cursors import decode_cursor, encode_cursor
+
+# Tope del conteo aproximado: más allá solo se informa "más de N"
+APPROXIMATE_COUNT_LIMIT = 1000
+
+
+def _cursor_value(value):
+    """Valor de una columna de orden en forma serializable a JSON"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPage:
+    """Página de resultados con tokens para la página siguiente y la anterior"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginación por clave (seek) sobre un queryset ordenado.
+
+    En lugar de OFFSET, cada página filtra las filas posteriores a la última
+    mostrada según las columnas de orden, por lo que el costo no crece con la
+    profundidad y no hace falta un COUNT. El id se agrega al orden como
+    desempate; las columnas de orden no deben admitir nulos.
+
+    Los tokens son opacos: guardan los valores de orden de la fila límite y
+    la dirección (siguiente o anterior).
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        ordering = list(ordering)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.fields = [field.lstrip('-') for field in ordering]
+
+    def _seek(self, values, reverse):
+        """Filtro de las filas que van después (o antes, con reverse) de la fila con esos valores"""
+        condition = Q()
+        for position in reversed(range(len(self.fields))):
+            field = self.fields[position]
+            descending = self.ordering[position].startswith('-') != reverse
+            after = Q(**{f'{field}__{"lt" if descending else "gt"}': values[position]})
+            condition = after | (Q(**{field: values[position]}) & condition) if condition else after
+        return condition
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def cursor_for(self, obj, previous=False):
+        """Token de la página que sigue (o precede, con previous) a la fila dada"""
+        values = [_cursor_value(self._value(obj, field)) for field in self.fields]
+        return encode_cursor({'k': values, 'p': previous})
+
+    @staticmethod
+    def _value(obj, field):
+        for attr in field.split('__'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def page(self, cursor=None):
+        """
+        Página que sigue al token dado (la primera si no hay token).
+
+        Raises:
+            ValueError: Si el token no es válido para este orden.
+        """
+        position = decode_cursor(cursor)
+        previous = False
+        queryset = self.queryset
+        if position is not None:
+            try:
+                values, previous = position['k'], bool(position.get('p'))
+            except (TypeError, KeyError, AttributeError) as exc:
+                raise ValueError('Cursor inválido') from exc
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError('Cursor inválido')
+            queryset = queryset.filter(self._seek(values, reverse=previous))
+
+        ordering = self._reversed_ordering() if previous else self.ordering
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if previous:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or previous:
+                next_cursor = self.cursor_for(rows[-1])
+            if position is not None and (has_more or not previous):
+                previous_cursor = self.cursor_for(rows[0], previous=True)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def get_page(self, cursor=None):
+        """Como page(), pero un token inválido devuelve la primera página"""
+        try:
+            return self.page(cursor)
+        except ValueError:
+            return self.page()
+
+    def approximate_count(self, limit=APPROXIMATE_COUNT_LIMIT):
+        """
+        Total de filas contando como máximo ``limit``.
+
+        Returns:
+            tuple: (cantidad, True si es exacta)
+        """
+        count = self.queryset.order_by()[:limit + 1].count()
+        return min(count, limit), count <= limit
+
+
+def cursor_querystring(request, cursor, param='cursor'):
+    """Query string de la petición actual con otro token de paginación"""
+    query = request.GET.copy()
+    query.pop('page', None)
+    query[param] = cursor
+    return f'?{query.urlencode()}'
+
+
+def page_links(request, page):
+    """URLs relativas de la página siguiente y anterior (None si no hay)"""
+    return {
+        'next_url': cursor_querystring(request, page.next_cursor) if page.has_next() else None,
+        'previous_url': cursor_querystring(request, page.previous_cursor) if page.has_previous() else None,
+    }
@@ -162,3 +162,36 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Mapbox settings
 MAPBOX_API_KEY = os.getenv('MAP_BOX_API_KEY')
 
+# Cargo de envío por farmacia (USD) que cobra cada sub-orden con entrega a
+# domicilio y con el que el optimizador del carrito compara planes:
+# cada farmacia distinta del carrito genera una sub-orden con su propio envío
+DELIVERY_FEE_PER_PHARMACY = os.getenv('DELIVERY_FEE_PER_PHARMACY', '2.00')
+
+# Carrito de compras: 'database' guarda las líneas en la tabla CartLine
+# (persisten entre dispositivos y no reescriben la sesión); 'session' lo
+# guarda en la sesión. Los visitantes anónimos siempre usan la sesión; un
+# carrito que haya quedado en la sesión de un usuario se pasa a la base de
+# datos en su primer acceso.
+CART_STORAGE = os.getenv('CART_STORAGE', 'database')
+
+# Pasarela para verificar pagos (comando verify_payments). Por defecto una
+# pasarela local que aprueba al instante; en producción:
+# PAYMENT_GATEWAY=orders.gateways.HTTPGateway y PAYMENT_GATEWAY_URL
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'orders.gateways.StubGateway')
+PAYMENT_GATEWAY_OPTIONS = {
+    'base_url': os.getenv('PAYMENT_GATEWAY_URL', ''),
+    'api_key': os.getenv('PAYMENT_GATEWAY_API_KEY', ''),
+    'timeout': float(os.getenv('PAYMENT_GATEWAY_TIMEOUT', '5')),
+    'pool_size': int(os.getenv('PAYMENT_GATEWAY_POOL_SIZE', '8')),
+}
+
+
+# Cache
+# Las instantáneas en memoria (p. ej. coordenadas de farmacias) se invalidan
+# con claves de versión guardadas aquí. Con varios procesos de aplicación
+# debe usarse un backend compartido (Redis, Memcached o base de datos).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
@@ -0,0 +1,33 @@
+import time
+from django.core.cache import cache
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _new_version():
+    # Un valor nuevo y creciente evita que un proceso confunda una versión
+    # reiniciada (por expiración del cache) con la que ya tenía cargada
+    return time.time_ns()
+
+
+def get_version(name):
+    """Versión actual de un conjunto de datos, compartida entre procesos vía cache"""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Invalida un conjunto de datos en todos los procesos"""
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _new_version()
+        cache.set(key, version, None)
+        return version
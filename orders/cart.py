@@ -1,17 +1,21 @@
-from decimal import Decimal
 from django.conf import settings
-from products.models import Product
+from .cart_storage import get_cart_storage
+from .pricing import get_cart_snapshot, invalidate_cart_snapshot
 
 
 class Cart:
-    """Clase para manejar el carrito de compras"""
+    """
+    Clase para manejar el carrito de compras.
+
+    Las líneas se guardan en el backend configurado en settings.CART_STORAGE
+    (ver orders.cart_storage); cada cambio se persiste línea por línea.
+    """
 
     def __init__(self, request):
+        self.request = request
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.storage = get_cart_storage(request)
+        self.cart = self.storage.load()
 
     def add(self, product, quantity=1, override_quantity=False):
         """Agregar producto al carrito"""
@@ -20,46 +24,56 @@ class Cart:
             self.cart[product_id] = {
                 'quantity': 0,
                 'price': str(product.discounted_price),
-                'pharmacy_id': product.pharmacy.id,
+                'pharmacy_id': product.pharmacy_id,
             }
         if override_quantity:
             self.cart[product_id]['quantity'] = quantity
         else:
             self.cart[product_id]['quantity'] += quantity
+        self.storage.save_lines({product_id: self.cart[product_id]})
         self.save()
 
     def save(self):
-        """Guardar el carrito en la sesión"""
-        self.session.modified = True
+        """Descartar la instantánea de precios tras un cambio en el carrito"""
+        invalidate_cart_snapshot(self.request)
 
     def remove(self, product):
         """Remover producto del carrito"""
         product_id = str(product.id)
         if product_id in self.cart:
             del self.cart[product_id]
+            self.storage.delete_lines([product_id])
             self.save()
 
-    def __iter__(self):
-        """Iterar sobre los items del carrito"""
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-
-        for product in products:
-            cart[str(product.id)]['product'] = product
+    def snapshot(self):
+        """Líneas con precio, stock y estado vigentes (memorizadas por petición)"""
+        return get_cart_snapshot(self.request)
 
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+    def __iter__(self):
+        """Iterar sobre los items del carrito con sus precios vigentes"""
+        return iter(self.snapshot())
 
     def __len__(self):
         """Contar items en el carrito"""
         return sum(item['quantity'] for item in self.cart.values())
 
     def get_total_price(self):
-        """Calcular precio total"""
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        """Calcular precio total con los precios vigentes"""
+        return self.snapshot().total
+
+    def update_prices(self):
+        """Guardar en el carrito los precios vigentes de la instantánea"""
+        changed = {}
+        for line in self.snapshot().available_lines:
+            product_id = str(line['product_id'])
+            item = self.cart[product_id]
+            if line['price_changed'] or item['pharmacy_id'] != line['product'].pharmacy_id:
+                item['price'] = str(line['price'])
+                item['pharmacy_id'] = line['product'].pharmacy_id
+                changed[product_id] = item
+        if changed:
+            # Sin invalidar la instantánea: sus precios ya son los vigentes
+            self.storage.save_lines(changed)
 
     def get_pharmacies(self):
         """Obtener todas las farmacias en el carrito con sus productos"""
@@ -87,7 +101,8 @@ class Cart:
 
     def clear(self):
         """Limpiar el carrito"""
-        del self.session[settings.CART_SESSION_ID]
+        self.cart.clear()
+        self.storage.clear()
         self.save()
 
 
@@ -0,0 +1,154 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from products.models import Product
+from .models import CartLine
+
+# Tiempo que se cachea el contador de líneas de un carrito guardado en la base de datos
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
+
+class SessionCartStorage:
+    """
+    Carrito dentro de la sesión: {product_id: {'quantity', 'price', 'pharmacy_id'}}.
+
+    Cada cambio reescribe la sesión completa; es también el que usan los
+    visitantes anónimos con CART_STORAGE='database'.
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+
+    @property
+    def key(self):
+        return getattr(settings, 'CART_SESSION_ID', 'cart')
+
+    def load(self):
+        cart = self.session.get(self.key)
+        if not cart:
+            cart = self.session[self.key] = {}
+        return cart
+
+    def save_lines(self, lines):
+        self.session.modified = True
+
+    def delete_lines(self, product_ids):
+        self.session.modified = True
+
+    def clear(self):
+        self.session.pop(self.key, None)
+        self.session.modified = True
+
+    def count(self):
+        return len(self.session.get(self.key) or {})
+
+
+class DatabaseCartStorage:
+    """
+    Carrito en la tabla CartLine: una fila (usuario, producto, cantidad, precio)
+    por línea.
+
+    Cada cambio escribe solo las líneas afectadas, sin tocar la sesión, y el
+    carrito es el mismo en todos los dispositivos del usuario. La cantidad de
+    líneas se cachea para el contador de la barra de navegación.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.lines = None
+
+    @property
+    def count_key(self):
+        return f'cart_count:{self.user.pk}'
+
+    def load(self):
+        # Una consulta por petición: el diccionario cargado se modifica en sitio
+        if self.lines is None:
+            self.lines = {
+                str(product_id): {'quantity': quantity, 'price': str(price), 'pharmacy_id': pharmacy_id}
+                for product_id, quantity, price, pharmacy_id in CartLine.objects.filter(user=self.user)
+                .order_by('id')
+                .values_list('product_id', 'quantity', 'price', 'product__pharmacy_id')
+            }
+        return self.lines
+
+    def save_lines(self, lines):
+        """Inserta o actualiza las líneas dadas ({product_id: línea}) con un solo INSERT ... ON CONFLICT"""
+        CartLine.objects.bulk_create(
+            [
+                CartLine(user=self.user, product_id=int(product_id), quantity=line['quantity'], price=Decimal(line['price']))
+                for product_id, line in lines.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['quantity', 'price', 'updated_at'],
+        )
+        self._forget_count()
+
+    def delete_lines(self, product_ids):
+        CartLine.objects.filter(user=self.user, product_id__in=[int(product_id) for product_id in product_ids]).delete()
+        self._forget_count()
+
+    def clear(self):
+        CartLine.objects.filter(user=self.user).delete()
+        self._forget_count()
+
+    def count(self):
+        if self.lines is not None:
+            return len(self.lines)
+        count = cache.get(self.count_key)
+        if count is None:
+            count = CartLine.objects.filter(user=self.user).count()
+            cache.set(self.count_key, count, CART_COUNT_TIMEOUT)
+        return count
+
+    def _forget_count(self):
+        # Tras el commit, para que nadie vuelva a cachear un conteo sin confirmar
+        key = self.count_key
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_cart_storage(request):
+    """
+    Backend del carrito según settings.CART_STORAGE ('session' o 'database').
+
+    Con el backend de base de datos, un carrito que haya quedado en la sesión
+    (p. ej. guardado antes de cambiar de backend) se pasa a la base de datos
+    en el primer acceso (ver migrate_session_cart).
+    """
+    storage = getattr(request, '_cart_storage', None)
+    if storage is None:
+        if getattr(settings, 'CART_STORAGE', 'session') == 'database' and request.user.is_authenticated:
+            storage = DatabaseCartStorage(request.user)
+            migrate_session_cart(request, storage)
+        else:
+            storage = SessionCartStorage(request)
+        request._cart_storage = storage
+    return storage
+
+
+def migrate_session_cart(request, storage):
+    """
+    Pasa el carrito de la sesión a las líneas del usuario en la base de datos,
+    sumando cantidades cuando el producto ya estaba en su carrito, y lo quita
+    de la sesión. Sin carrito en la sesión no hace consultas.
+    """
+    session_storage = SessionCartStorage(request)
+    session_cart = request.session.get(session_storage.key)
+    if session_cart is None:
+        return
+    product_ids = [int(product_id) for product_id in session_cart]
+    if product_ids:
+        existing = dict(
+            CartLine.objects.filter(user=storage.user, product_id__in=product_ids).values_list('product_id', 'quantity')
+        )
+        valid_ids = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        lines = {
+            product_id: {**line, 'quantity': line['quantity'] + existing.get(int(product_id), 0)}
+            for product_id, line in session_cart.items()
+            if int(product_id) in valid_ids
+        }
+        if lines:
+            storage.save_lines(lines)
+    session_storage.clear()
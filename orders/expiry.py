@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.utils import timezone
+from .models import MasterOrder, Order
+from .reservations import release_reservations
+
+EXPIRY_BATCH_SIZE = 500
+
+
+def expire_order_batch(now=None, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Cancela un lote de sub-órdenes pendientes con el plazo de pago vencido.
+
+    El lote sale de un recorrido del índice (order_status, payment_deadline);
+    se cancela con un solo UPDATE, se libera el stock apartado y se
+    recalcula el estado de pago de las órdenes maestras afectadas, todo en
+    una transacción. Las sub-órdenes con un pago en verificación no vencen
+    mientras la pasarela no responda.
+
+    Returns:
+        tuple: (sub-órdenes del lote, sub-órdenes canceladas). Pueden diferir si
+        alguna se pagó entre la lectura y el UPDATE; un lote vacío indica que
+        no quedan vencidas
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        overdue = Order.objects.filter(order_status='pending', payment_deadline__lt=now).exclude(payment_status='processing')
+        rows = list(overdue.order_by('payment_deadline').values_list('id', 'master_order_id')[:batch_size])
+        if not rows:
+            return 0, 0
+        order_ids = [order_id for order_id, _ in rows]
+        # Volver a filtrar: una orden pagada o enviada a verificación entre la lectura y el UPDATE no se toca
+        expired = overdue.filter(id__in=order_ids).update(
+            order_status='cancelled', payment_status='failed', updated_at=now,
+        )
+        release_reservations(Order.objects.filter(id__in=order_ids, order_status='cancelled'))
+        refresh_master_payment_statuses({master_id for _, master_id in rows if master_id is not None}, now)
+    return len(rows), expired
+
+
+def refresh_master_payment_statuses(master_order_ids, now=None):
+    """
+    Recalcula el estado de pago de varias órdenes maestras con una consulta y
+    un bulk_update. bulk_update no aplica auto_now: updated_at se asigna aquí.
+    """
+    if not master_order_ids:
+        return
+    now = now or timezone.now()
+    sub_orders = {}
+    for master_id, order_status, payment_status in Order.objects.filter(master_order_id__in=master_order_ids).values_list(
+        'master_order_id', 'order_status', 'payment_status',
+    ):
+        sub_orders.setdefault(master_id, []).append((order_status, payment_status))
+
+    changed = []
+    for master_order in MasterOrder.objects.filter(id__in=master_order_ids).only('id', 'payment_status', 'updated_at'):
+        status = MasterOrder.payment_status_for(sub_orders.get(master_order.id, []))
+        if status != master_order.payment_status:
+            master_order.payment_status = status
+            master_order.updated_at = now
+            changed.append(master_order)
+    MasterOrder.objects.bulk_update(changed, ['payment_status', 'updated_at'])
+
+
+def expire_overdue_orders(now=None, batch_size=EXPIRY_BATCH_SIZE):
+    """Cancela todas las sub-órdenes vencidas, lote por lote"""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        # Un lote que no canceló nada (todas sus órdenes se pagaron a tiempo) no
+        # significa que no queden vencidas: se sigue mientras el lote traiga órdenes
+        selected, expired = expire_order_batch(now, batch_size)
+        total += expired
+        if selected < batch_size:
+            return total
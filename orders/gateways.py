@@ -0,0 +1,126 @@
+import http.client
+import json
+import queue
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Resultado de verificar un pago: status es 'approved' o 'rejected'
+VerificationResult = namedtuple('VerificationResult', ['status', 'transaction_id', 'message'])
+
+
+class GatewayError(Exception):
+    """Fallo transitorio de la pasarela (red, tiempo de espera, error 5xx o pago aún sin confirmar); se reintenta"""
+
+
+class StubGateway:
+    """
+    Pasarela local para desarrollo y pruebas: responde al instante sin red.
+
+    Aprueba todos los pagos salvo los C2P sin referencia y los que tienen
+    una referencia que empieza por "RECHAZ", que se rechazan.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def verify(self, payment):
+        reference = payment.c2p_reference or ''
+        if payment.payment_method == 'c2p' and not reference:
+            return VerificationResult('rejected', '', 'Pago móvil sin número de referencia')
+        if reference.upper().startswith('RECHAZ'):
+            return VerificationResult('rejected', '', 'Referencia rechazada por el banco')
+        return VerificationResult('approved', f'STUB-{payment.order.order_number}', '')
+
+    def close(self):
+        pass
+
+
+class HTTPGateway:
+    """
+    Cliente de una pasarela bancaria HTTP(S) con un pool de conexiones
+    persistentes y tiempos de espera.
+
+    Envía ``POST {base_url}/payments/verify`` con los datos del pago y
+    espera un JSON ``{"status": "approved" | "rejected" | "pending",
+    "transaction_id": ..., "message": ...}``. El pool se comparte entre los
+    hilos del verificador; cada hilo toma una conexión y la devuelve al
+    terminar.
+    """
+
+    def __init__(self, base_url, api_key='', timeout=5, pool_size=8, **options):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.host = url.netloc
+        self.path = url.path.rstrip('/') + '/payments/verify'
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _acquire(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return self.connection_class(self.host, timeout=self.timeout)
+
+    def _release(self, connection):
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def verify(self, payment):
+        body = json.dumps({
+            'order_number': payment.order.order_number,
+            'method': payment.payment_method,
+            'amount': str(payment.amount),
+            'currency': payment.currency,
+            'phone': payment.c2p_phone,
+            'reference': payment.c2p_reference,
+        })
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.api_key}'}
+        connection = self._acquire()
+        try:
+            connection.request('POST', self.path, body=body, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            # Conexión rota o vencida: se descarta en lugar de volver al pool
+            connection.close()
+            raise GatewayError(f'Error de conexión con la pasarela: {error}')
+        self._release(connection)
+
+        if response.status >= 500:
+            raise GatewayError(f'La pasarela respondió {response.status}')
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            raise GatewayError('Respuesta inválida de la pasarela')
+        if response.status >= 400:
+            return VerificationResult('rejected', '', data.get('message', f'Error {response.status}'))
+        if data.get('status') not in ('approved', 'rejected'):
+            raise GatewayError('El banco aún no confirma el pago')
+        return VerificationResult(data['status'], data.get('transaction_id', ''), data.get('message', ''))
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_payment_gateway():
+    """Cliente de pasarela configurado en settings.PAYMENT_GATEWAY, compartido por el proceso"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            gateway_class = import_string(getattr(settings, 'PAYMENT_GATEWAY', 'orders.gateways.StubGateway'))
+            _gateway = gateway_class(**getattr(settings, 'PAYMENT_GATEWAY_OPTIONS', {}))
+        return _gateway
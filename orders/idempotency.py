@@ -0,0 +1,76 @@
+import uuid
+from datetime import timedelta
+from functools import wraps
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.shortcuts import redirect
+from django.utils import timezone
+from .models import IdempotencyKey
+
+# Campo oculto del formulario y cabecera HTTP (para clientes de API) con la clave
+IDEMPOTENCY_FIELD = 'idempotency_key'
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+# Tiempo que se recuerdan las claves procesadas
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+
+def new_idempotency_key():
+    """Clave nueva para incrustar en un formulario"""
+    return uuid.uuid4().hex
+
+
+def get_idempotency_key(request):
+    return (request.POST.get(IDEMPOTENCY_FIELD) or request.META.get(IDEMPOTENCY_HEADER) or '')[:64]
+
+
+def idempotent(scope):
+    """
+    Hace idempotentes los POST de una vista que termina en redirección.
+
+    El primer envío con una clave la registra como 'processing' antes de
+    ejecutar la vista; si la vista redirige, se guarda la URL de destino.
+    Un reintento con la misma clave no vuelve a ejecutar la vista: se
+    redirige al mismo destino o, si el original aún no termina, a la misma
+    página. Si la vista no redirige (p. ej. un formulario inválido) o falla,
+    la clave se libera para poder reintentar. Los POST sin clave se procesan
+    como siempre.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = get_idempotency_key(request) if request.method == 'POST' else ''
+            if not key:
+                return view_func(request, *args, **kwargs)
+
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(user=request.user, scope=scope, key=key)
+            except IntegrityError:
+                record = IdempotencyKey.objects.get(user=request.user, scope=scope, key=key)
+                if record.status == 'completed':
+                    messages.info(request, 'Esta solicitud ya fue procesada.')
+                    return redirect(record.response_location)
+                messages.info(request, 'Tu solicitud anterior aún se está procesando.')
+                return redirect(request.path)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if response.status_code in (301, 302, 303) and response.get('Location'):
+                record.status = 'completed'
+                record.response_location = response['Location']
+                record.save(update_fields=['status', 'response_location'])
+            else:
+                record.delete()
+            return response
+        return wrapper
+    return decorator
+
+
+def prune_idempotency_keys(now=None):
+    """Borra las claves más viejas que IDEMPOTENCY_KEY_TTL (comando prune_idempotency_keys)"""
+    now = now or timezone.now()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=now - IDEMPOTENCY_KEY_TTL).delete()
+    return deleted
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from orders.expiry import EXPIRY_BATCH_SIZE, expire_overdue_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Cancela las sub-órdenes pendientes con el plazo de pago vencido, libera su stock apartado '
+        'y actualiza el estado de pago de las órdenes maestras'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPIRY_BATCH_SIZE)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Segundos entre barridos; con 0 (por defecto) se ejecuta una sola vez')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_overdue_orders(batch_size=options['batch_size'])
+            self.stdout.write(f'{expired} órdenes vencidas canceladas')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
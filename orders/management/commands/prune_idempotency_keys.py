@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.idempotency import prune_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves de idempotencia de checkout más viejas que IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        pruned = prune_idempotency_keys()
+        self.stdout.write(f'{pruned} claves de idempotencia eliminadas')
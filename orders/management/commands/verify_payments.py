@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from orders.gateways import get_payment_gateway
+from orders.models import Payment
+from orders.verification import check_payment, claim_payments, record_verification
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica contra la pasarela configurada (settings.PAYMENT_GATEWAY) los pagos en cola '
+        'y actualiza el estado de las órdenes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Consultas simultáneas a la pasarela')
+        parser.add_argument('--batch-size', type=int, default=50, help='Pagos tomados de la cola por vuelta')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Segundos de espera con la cola vacía; con 0 (por defecto) termina al vaciarla')
+
+    def handle(self, *args, **options):
+        gateway = get_payment_gateway()
+        totals = {}
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                payment_ids = claim_payments(options['batch_size'])
+                if not payment_ids:
+                    if not options['interval']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                payments = list(
+                    Payment.objects.select_related('order')
+                    .filter(id__in=payment_ids, verification_status='processing')
+                )
+                # Los hilos solo esperan a la pasarela; los resultados se guardan
+                # desde este hilo, con una sola conexión a la base de datos
+                outcomes = executor.map(lambda payment: check_payment(payment, gateway), payments)
+                for payment, outcome in zip(payments, outcomes):
+                    status = record_verification(payment, outcome)
+                    totals[status] = totals.get(status, 0) + 1
+        gateway.close()
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items())) or 'sin pagos en cola'
+        self.stdout.write(self.style.SUCCESS(f'Pagos procesados: {summary}'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_stockreservation'),
+        ('users', '0005_pharmacyprofile_search_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_status', 'payment_deadline'], name='order_status_deadline_idx'),
+        ),
+    ]
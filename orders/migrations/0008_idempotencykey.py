@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_status_deadline_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50, verbose_name='Operación')),
+                ('key', models.CharField(max_length=64, verbose_name='Clave')),
+                ('status', models.CharField(choices=[('processing', 'Procesando'), ('completed', 'Completado')], default='processing', max_length=20, verbose_name='Estado')),
+                ('response_location', models.CharField(blank=True, max_length=500, verbose_name='Redirección')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creado el')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope', 'key'), name='idempotency_user_scope_key_unique')],
+            },
+        ),
+    ]
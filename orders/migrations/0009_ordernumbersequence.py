@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+def create_sequences(apps, schema_editor):
+    # Filas creadas de antemano para que dos procesos no compitan al crearlas
+    OrderNumberSequence = apps.get_model('orders', 'OrderNumberSequence')
+    for name in ('order', 'master_order'):
+        OrderNumberSequence.objects.get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Secuencia')),
+                ('next_value', models.PositiveBigIntegerField(default=1, verbose_name='Siguiente Valor')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Números de Orden',
+                'verbose_name_plural': 'Secuencias de Números de Orden',
+            },
+        ),
+        migrations.RunPython(create_sequences, migrations.RunPython.noop),
+    ]
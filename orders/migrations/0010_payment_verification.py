@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:30
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def queue_existing_payments(apps, schema_editor):
+    # Los pagos ya exitosos quedan verificados; los demás entran a la cola
+    Payment = apps.get_model('orders', 'Payment')
+    Payment.objects.filter(is_successful=True).update(verification_status='verified')
+    Payment.objects.filter(is_successful=False).update(verification_status='pending', next_attempt_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_ordernumbersequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Próximo Intento'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='verification_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Intentos de Verificación'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='verification_message',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Mensaje de Verificación'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='verification_status',
+            field=models.CharField(choices=[('pending', 'En Cola'), ('processing', 'Verificando'), ('verified', 'Verificado'), ('rejected', 'Rechazado'), ('failed', 'Sin Respuesta')], default='pending', max_length=20, verbose_name='Estado de Verificación'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['verification_status', 'next_attempt_at'], name='payment_verification_idx'),
+        ),
+        migrations.RunPython(queue_existing_payments, migrations.RunPython.noop),
+    ]
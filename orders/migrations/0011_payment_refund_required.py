@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_payment_verification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='verification_status',
+            field=models.CharField(choices=[('pending', 'En Cola'), ('processing', 'Verificando'), ('verified', 'Verificado'), ('rejected', 'Rechazado'), ('failed', 'Sin Respuesta'), ('refund_required', 'Reembolso Pendiente')], default='pending', max_length=20, verbose_name='Estado de Verificación'),
+        ),
+    ]
@@ -31,10 +31,43 @@ class MasterOrder(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.master_order_number:
-            import uuid
-            self.master_order_number = f"MORD-{uuid.uuid4().hex[:8].upper()}"
+            self.master_order_number = self.generate_number()
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def generate_number():
+        from .numbering import master_order_numbers
+        return master_order_numbers.next()
+
+    @staticmethod
+    def payment_status_for(sub_orders):
+        """
+        Estado de pago de una orden maestra según sus sub-órdenes.
+
+        Args:
+            sub_orders: Pares (order_status, payment_status) de las sub-órdenes
+
+        Returns:
+            str: 'completed' si todas las sub-órdenes vigentes están pagadas,
+            'processing' si solo algunas, 'failed' si todas se cancelaron y
+            'pending' en otro caso
+        """
+        active = [payment_status for order_status, payment_status in sub_orders if order_status != 'cancelled']
+        if not active:
+            return 'failed' if sub_orders else 'pending'
+        paid = sum(1 for payment_status in active if payment_status == 'completed')
+        if paid == len(active):
+            return 'completed'
+        return 'processing' if paid else 'pending'
+
+    def refresh_payment_status(self):
+        """Recalcula y guarda el estado de pago a partir de las sub-órdenes"""
+        status = self.payment_status_for(list(self.sub_orders.values_list('order_status', 'payment_status')))
+        if status != self.payment_status:
+            self.payment_status = status
+            self.save(update_fields=['payment_status', 'updated_at'])
+        return status
+
 
 class Order(models.Model):
     ORDER_STATUS_CHOICES = (
@@ -96,17 +129,24 @@ class Order(models.Model):
         verbose_name = 'Orden'
         verbose_name_plural = 'Órdenes'
         ordering = ['-created_at']
+        indexes = [
+            # Barrido de órdenes vencidas: rango sobre payment_deadline dentro de un estado
+            models.Index(fields=['order_status', 'payment_deadline'], name='order_status_deadline_idx'),
+        ]
 
     def __str__(self):
         return f"Orden {self.order_number} - {self.client.user.username}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate order number
-            import uuid
-            self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+            self.order_number = self.generate_number()
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def generate_number():
+        from .numbering import order_numbers
+        return order_numbers.next()
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', verbose_name='Orden')
@@ -156,9 +196,27 @@ class Payment(models.Model):
     # Status
     is_successful = models.BooleanField(default=False, verbose_name='Pago Exitoso')
 
+    # Verificación asíncrona contra la pasarela (ver orders.verification)
+    VERIFICATION_STATUS_CHOICES = (
+        ('pending', 'En Cola'),
+        ('processing', 'Verificando'),
+        ('verified', 'Verificado'),
+        ('rejected', 'Rechazado'),
+        ('failed', 'Sin Respuesta'),
+        ('refund_required', 'Reembolso Pendiente'),
+    )
+    verification_status = models.CharField(max_length=20, choices=VERIFICATION_STATUS_CHOICES, default='pending', verbose_name='Estado de Verificación')
+    verification_attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Intentos de Verificación')
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name='Próximo Intento')
+    verification_message = models.CharField(max_length=255, blank=True, verbose_name='Mensaje de Verificación')
+
     class Meta:
         verbose_name = 'Pago'
         verbose_name_plural = 'Pagos'
+        indexes = [
+            # Cola de verificación: pagos de un estado listos para intentar
+            models.Index(fields=['verification_status', 'next_attempt_at'], name='payment_verification_idx'),
+        ]
 
     def __str__(self):
         return f"Pago de {self.order.order_number}"
@@ -234,3 +292,88 @@ class Review(models.Model):
         super().save(*args, **kwargs)
         # Update pharmacy rating
         self.pharmacy.update_rating()
+
+
+class CartLine(models.Model):
+    """Línea del carrito guardada en la base de datos (backend de carrito 'database')"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart_lines', verbose_name='Usuario')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Producto')
+    quantity = models.PositiveIntegerField(verbose_name='Cantidad')
+    # Precio al agregarlo, para avisar si cambió antes del pago
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Precio (USD)')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Actualizado el')
+
+    class Meta:
+        verbose_name = 'Línea de Carrito'
+        verbose_name_plural = 'Líneas de Carrito'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cartline_user_product_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} ({self.user_id})"
+
+
+class StockReservation(models.Model):
+    """Stock apartado para una sub-orden desde el checkout hasta el pago o la cancelación"""
+    STATUS_CHOICES = (
+        ('held', 'Apartado'),
+        ('committed', 'Confirmado'),
+        ('released', 'Liberado'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations', verbose_name='Orden')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations', verbose_name='Producto')
+    quantity = models.PositiveIntegerField(verbose_name='Cantidad')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held', verbose_name='Estado')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Creado el')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Actualizado el')
+
+    class Meta:
+        verbose_name = 'Reserva de Stock'
+        verbose_name_plural = 'Reservas de Stock'
+        indexes = [
+            models.Index(fields=['order', 'status'], name='reservation_order_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} ({self.get_status_display()})"
+
+
+class IdempotencyKey(models.Model):
+    """Envío de formulario ya procesado, para responder igual a los reintentos"""
+    STATUS_CHOICES = (
+        ('processing', 'Procesando'),
+        ('completed', 'Completado'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', verbose_name='Usuario')
+    scope = models.CharField(max_length=50, verbose_name='Operación')
+    key = models.CharField(max_length=64, verbose_name='Clave')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing', verbose_name='Estado')
+    # URL a la que se redirigió el envío original
+    response_location = models.CharField(max_length=500, blank=True, verbose_name='Redirección')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creado el')
+
+    class Meta:
+        verbose_name = 'Clave de Idempotencia'
+        verbose_name_plural = 'Claves de Idempotencia'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='idempotency_user_scope_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+
+class OrderNumberSequence(models.Model):
+    """Contador de números de orden; cada proceso reserva bloques consecutivos (ver orders.numbering)"""
+    name = models.CharField(max_length=50, unique=True, verbose_name='Secuencia')
+    next_value = models.PositiveBigIntegerField(default=1, verbose_name='Siguiente Valor')
+
+    class Meta:
+        verbose_name = 'Secuencia de Números de Orden'
+        verbose_name_plural = 'Secuencias de Números de Orden'
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
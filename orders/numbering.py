@@ -0,0 +1,88 @@
+import os
+import threading
+from django.conf import settings
+from django.db import transaction
+
+# Números que reserva cada proceso de una vez
+ORDER_NUMBER_BLOCK_SIZE = getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 1000)
+
+
+class OrderNumberAllocator:
+    """
+    Asigna números de orden crecientes y legibles ("ORD-000001234").
+
+    Cada proceso reserva un bloque de números en la tabla OrderNumberSequence
+    con una sola transacción corta y luego los reparte desde memoria, así que
+    dos procesos nunca entregan el mismo número y las inserciones caen al
+    final del índice único en lugar de en posiciones aleatorias. Los números
+    de un bloque que no se alcanzan a usar quedan como huecos.
+    """
+
+    def __init__(self, name, prefix, block_size=ORDER_NUMBER_BLOCK_SIZE):
+        self.name = name
+        self.prefix = prefix
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.next_value = self.end_value = 0
+        self.pid = None
+
+    def _reserve(self, size):
+        from .models import OrderNumberSequence
+
+        with transaction.atomic():
+            sequence, _ = OrderNumberSequence.objects.select_for_update().get_or_create(name=self.name)
+            start = sequence.next_value
+            sequence.next_value = start + size
+            sequence.save(update_fields=['next_value'])
+        return start
+
+    def format(self, value):
+        return f'{self.prefix}-{value:09d}'
+
+    def allocate(self, count=1):
+        """
+        Reserva ``count`` números consecutivos del bloque del proceso.
+
+        Los números salen del bloque en memoria aunque haya una transacción
+        en curso: ese bloque ya está confirmado, y si la transacción se
+        revierte sus números solo quedan como huecos. Cuando hay que reservar
+        un bloque nuevo dentro de una transacción, el resto del bloque se
+        adopta recién tras el commit; si se revierte, la reserva también, y
+        el proceso no conserva un bloque que otro podría recibir.
+
+        Returns:
+            list: Números de orden formateados
+        """
+        with self.lock:
+            # Tras un fork el bloque heredado también lo tiene el proceso padre
+            if self.pid != os.getpid():
+                self.next_value = self.end_value = 0
+                self.pid = os.getpid()
+            take = min(count, self.end_value - self.next_value)
+            values = list(range(self.next_value, self.next_value + take))
+            self.next_value += take
+
+            missing = count - take
+            if missing:
+                size = max(self.block_size, missing)
+                start = self._reserve(size)
+                values.extend(range(start, start + missing))
+                if transaction.get_connection().in_atomic_block:
+                    pid = self.pid
+                    transaction.on_commit(lambda: self._adopt(start + missing, start + size, pid))
+                else:
+                    self.next_value, self.end_value = start + missing, start + size
+        return [self.format(value) for value in values]
+
+    def _adopt(self, start, end, pid):
+        """Toma como bloque del proceso el resto de un bloque reservado en una transacción ya confirmada"""
+        with self.lock:
+            if self.pid == pid and self.next_value >= self.end_value:
+                self.next_value, self.end_value = start, end
+
+    def next(self):
+        return self.allocate(1)[0]
+
+
+order_numbers = OrderNumberAllocator('order', 'ORD')
+master_order_numbers = OrderNumberAllocator('master_order', 'MORD')
@@ -0,0 +1,284 @@
+import time
+from decimal import Decimal
+from products.canonical import offer_filter
+from products.models import Product
+from .pricing import delivery_fee
+
+# Presupuesto de tiempo de la búsqueda exacta; al agotarse se usa la mejor asignación encontrada
+OPTIMIZER_TIME_BUDGET = 0.25
+# Farmacias que entran en la búsqueda exacta (las demás solo aportan a la solución voraz)
+MAX_CANDIDATE_PHARMACIES = 16
+
+OBJECTIVES = ('cost', 'pharmacies')
+
+
+def _discounted_price(row):
+    """Precio con descuento de una fila de producto, como Product.discounted_price"""
+    if row['discount_percentage'] > 0:
+        return row['price'] * (1 - row['discount_percentage'] / 100)
+    return row['price']
+
+
+def build_offer_table(cart_items, pharmacy_ids=None):
+    """
+    Tabla de ofertas del carrito: para cada artículo deseado, el precio más
+    bajo en cada farmacia que tiene stock suficiente.
+
+    Las líneas del carrito se agrupan por producto canónico (dos líneas del
+    mismo medicamento en farmacias distintas son un solo artículo); una
+    línea sin producto canónico solo puede cubrirse con su propio producto.
+    Todo sale de dos consultas: los productos del carrito y sus ofertas.
+
+    Args:
+        cart_items: Diccionario de la sesión {product_id: {'quantity', 'price', 'pharmacy_id'}}
+        pharmacy_ids: Farmacias permitidas (p. ej. las cercanas) o None para todas;
+            la farmacia actual de cada línea siempre se permite
+
+    Returns:
+        list: Artículos con 'product_ids', 'quantity', 'offers' {pharmacy_id: (precio, product_id)}
+        y 'lines' (precio vigente, cantidad y farmacia de cada línea del carrito)
+    """
+    current = {
+        row['id']: row
+        for row in Product.objects.filter(id__in=[int(product_id) for product_id in cart_items])
+        .values('id', 'canonical_product_id', 'pharmacy_id', 'price', 'discount_percentage')
+    }
+
+    items = {}
+    for product_id, line in cart_items.items():
+        row = current.get(int(product_id))
+        if row is None:
+            continue
+        key = row['canonical_product_id'] or ('product', row['id'])
+        item = items.setdefault(key, {'product_ids': [], 'quantity': 0, 'pharmacies': set(), 'offers': {}, 'lines': []})
+        item['product_ids'].append(row['id'])
+        item['quantity'] += line['quantity']
+        item['pharmacies'].add(row['pharmacy_id'])
+        item['lines'].append((_discounted_price(row), line['quantity'], row['pharmacy_id']))
+
+    canonical_ids = [key for key in items if not isinstance(key, tuple)]
+    own_ids = [key[1] for key in items if isinstance(key, tuple)]
+    offers = Product.objects.filter(offer_filter()).filter(
+        canonical_product_id__in=canonical_ids
+    ) | Product.objects.filter(offer_filter(), id__in=own_ids)
+
+    for offer in offers.values('id', 'canonical_product_id', 'pharmacy_id', 'price', 'discount_percentage', 'stock_quantity'):
+        key = offer['canonical_product_id'] if offer['canonical_product_id'] in items else ('product', offer['id'])
+        item = items.get(key)
+        if item is None or offer['stock_quantity'] < item['quantity']:
+            continue
+        if pharmacy_ids is not None and offer['pharmacy_id'] not in pharmacy_ids and offer['pharmacy_id'] not in item['pharmacies']:
+            continue
+        price = _discounted_price(offer)
+        best = item['offers'].get(offer['pharmacy_id'])
+        if best is None or (price, offer['id']) < best:
+            item['offers'][offer['pharmacy_id']] = (price, offer['id'])
+
+    return list(items.values())
+
+
+def _assignment_cost(items, open_pharmacies, fee):
+    """Costo de surtir cada artículo en la farmacia abierta más barata (None si alguno queda sin cubrir)"""
+    total = fee * len(open_pharmacies)
+    for item in items:
+        prices = [item['offers'][pharmacy][0] for pharmacy in open_pharmacies if pharmacy in item['offers']]
+        if not prices:
+            return None
+        total += min(prices) * item['quantity']
+    return total
+
+
+def _greedy_cover(items, fee):
+    """
+    Cobertura voraz ponderada: abre la farmacia con menor costo por artículo
+    nuevo cubierto (cargo de envío más precios) hasta cubrir el carrito.
+    """
+    pharmacies = {pharmacy for item in items for pharmacy in item['offers']}
+    uncovered = set(range(len(items)))
+    chosen = set()
+    while uncovered:
+        best = None
+        for pharmacy in pharmacies - chosen:
+            covered = [index for index in uncovered if pharmacy in items[index]['offers']]
+            if not covered:
+                continue
+            cost = fee + sum(items[index]['offers'][pharmacy][0] * items[index]['quantity'] for index in covered)
+            ratio = cost / len(covered)
+            if best is None or (ratio, pharmacy) < best[0]:
+                best = ((ratio, pharmacy), pharmacy, covered)
+        _, pharmacy, covered = best
+        chosen.add(pharmacy)
+        uncovered.difference_update(covered)
+    return chosen
+
+
+def _improve(items, chosen, fee):
+    """Búsqueda local: quita o agrega farmacias mientras el costo baje"""
+    pharmacies = {pharmacy for item in items for pharmacy in item['offers']}
+    best_cost = _assignment_cost(items, chosen, fee)
+    improved = True
+    while improved:
+        improved = False
+        for candidate in [chosen - {pharmacy} for pharmacy in chosen] + [chosen | {pharmacy} for pharmacy in pharmacies - chosen]:
+            cost = _assignment_cost(items, candidate, fee)
+            if cost is not None and cost < best_cost:
+                chosen, best_cost, improved = candidate, cost, True
+                break
+    return chosen, best_cost
+
+
+def _candidate_pharmacies(items, chosen, limit):
+    """
+    Farmacias para la búsqueda exacta: las de la solución voraz, la más
+    barata de cada artículo y luego las que cubren más artículos.
+    """
+    candidates = list(chosen)
+    for item in items:
+        cheapest = min(item['offers'], key=lambda pharmacy: (item['offers'][pharmacy], pharmacy))
+        if cheapest not in candidates:
+            candidates.append(cheapest)
+    coverage = {}
+    for item in items:
+        for pharmacy in item['offers']:
+            coverage[pharmacy] = coverage.get(pharmacy, 0) + 1
+    for pharmacy in sorted(coverage, key=lambda pharmacy: (-coverage[pharmacy], pharmacy)):
+        if len(candidates) >= limit:
+            break
+        if pharmacy not in candidates:
+            candidates.append(pharmacy)
+    return candidates[:max(limit, len(chosen))]
+
+
+def _branch_and_bound(items, candidates, fee, best, deadline):
+    """
+    Ramificación y acotamiento sobre qué farmacias candidatas abrir.
+
+    La cota de un nodo es el cargo de las farmacias ya abiertas más, por
+    artículo, el precio más bajo entre las farmacias no descartadas.
+
+    Returns:
+        tuple: (mejor conjunto de farmacias, su costo, True si la búsqueda terminó)
+    """
+    best_set, best_cost = best
+    options = [
+        sorted((price * item['quantity'], pharmacy) for pharmacy, (price, _) in item['offers'].items() if pharmacy in candidates)
+        for item in items
+    ]
+    finished = True
+
+    def bound(opened, excluded):
+        total = fee * len(opened)
+        for item_options in options:
+            cheapest = next((cost for cost, pharmacy in item_options if pharmacy not in excluded), None)
+            if cheapest is None:
+                return None
+            total += cheapest
+        return total
+
+    def search(depth, opened, excluded):
+        nonlocal best_set, best_cost, finished
+        if time.monotonic() > deadline:
+            finished = False
+            return
+        lower = bound(opened, excluded)
+        if lower is None or lower >= best_cost:
+            return
+        if opened:
+            cost = _assignment_cost(items, opened, fee)
+            if cost is not None and cost < best_cost:
+                best_set, best_cost = set(opened), cost
+        if depth == len(candidates):
+            return
+        pharmacy = candidates[depth]
+        search(depth + 1, opened | {pharmacy}, excluded)
+        search(depth + 1, opened, excluded | {pharmacy})
+
+    search(0, frozenset(), frozenset())
+    return best_set, best_cost, finished
+
+
+def optimize_cart(cart_items, pharmacy_ids=None, objective='cost', time_budget=OPTIMIZER_TIME_BUDGET):
+    """
+    Asignación de los artículos del carrito a farmacias que minimiza el
+    total (precios más un cargo de envío por farmacia) o, con
+    objective='pharmacies', la cantidad de farmacias y luego el total.
+
+    Parte de una cobertura voraz mejorada con búsqueda local y la refina con
+    ramificación y acotamiento sobre un conjunto acotado de farmacias
+    candidatas hasta agotar el presupuesto de tiempo.
+
+    Returns:
+        dict: 'items' (artículos con 'product_id' y 'unit_price' elegidos),
+        'pharmacies', 'total', 'current_total', 'savings', 'unavailable'
+        (ids del carrito sin ofertas, que se dejan como están) y 'complete'
+        (False si se agotó el presupuesto antes de probar la optimalidad)
+    """
+    deadline = time.monotonic() + time_budget
+    fee = delivery_fee()
+    table = build_offer_table(cart_items, pharmacy_ids)
+    items = [item for item in table if item['offers']]
+    unavailable = [product_id for item in table if not item['offers'] for product_id in item['product_ids']]
+
+    # El total actual se calcula con los precios vigentes de los productos del
+    # carrito, no con los guardados al agregarlos, para comparar con el plan
+    current_pharmacies = set()
+    current_total = Decimal(0)
+    for item in items:
+        for unit_price, quantity, pharmacy_id in item['lines']:
+            current_total += unit_price * quantity
+            current_pharmacies.add(pharmacy_id)
+    current_total += fee * len(current_pharmacies)
+
+    if not items:
+        return {
+            'items': [], 'pharmacies': set(), 'total': current_total, 'current_total': current_total,
+            'savings': Decimal(0), 'unavailable': unavailable, 'complete': True,
+        }
+
+    # Con objective='pharmacies' el cargo supera cualquier diferencia de precio posible,
+    # así que abrir una farmacia menos siempre gana
+    search_fee = fee
+    if objective == 'pharmacies':
+        search_fee = fee + sum(max(price for price, _ in item['offers'].values()) * item['quantity'] for item in items) + 1
+
+    chosen, cost = _improve(items, _greedy_cover(items, search_fee), search_fee)
+    candidates = _candidate_pharmacies(items, chosen, MAX_CANDIDATE_PHARMACIES)
+    chosen, cost, complete = _branch_and_bound(items, candidates, search_fee, (chosen, cost), deadline)
+
+    total = fee * len(chosen)
+    for item in items:
+        pharmacy = min(
+            (pharmacy for pharmacy in chosen if pharmacy in item['offers']),
+            key=lambda pharmacy: (item['offers'][pharmacy], pharmacy),
+        )
+        item['unit_price'], item['product_id'] = item['offers'][pharmacy]
+        item['pharmacy_id'] = pharmacy
+        total += item['unit_price'] * item['quantity']
+
+    return {
+        'items': items,
+        'pharmacies': chosen,
+        'total': total,
+        'current_total': current_total,
+        'savings': current_total - total,
+        'unavailable': unavailable,
+        'complete': complete,
+    }
+
+
+def apply_cart_plan(cart, plan):
+    """
+    Reemplaza las líneas del carrito por los productos elegidos.
+
+    Returns:
+        int: Cantidad de artículos que cambiaron de producto
+    """
+    changed = [item for item in plan['items'] if item['product_ids'] != [item['product_id']]]
+    product_ids = {item['product_id'] for item in changed}
+    product_ids.update(product_id for item in changed for product_id in item['product_ids'])
+    products = Product.objects.select_related('pharmacy').in_bulk(product_ids)
+    for item in changed:
+        for product_id in item['product_ids']:
+            cart.remove(products[product_id])
+        cart.add(products[item['product_id']], quantity=item['quantity'], override_quantity=True)
+    return len(changed)
@@ -0,0 +1,116 @@
+from decimal import Decimal
+from django.conf import settings
+from products.models import Product
+from .cart_storage import get_cart_storage
+
+# Atributo de la petición donde se guarda la instantánea del carrito
+SNAPSHOT_ATTRIBUTE = '_cart_snapshot'
+
+CENT = Decimal('0.01')
+
+
+def delivery_fee(delivery_type=None):
+    """Cargo de envío de cada sub-orden (una por farmacia); retirar en la farmacia no tiene cargo"""
+    if delivery_type == 'pickup':
+        return Decimal(0)
+    return Decimal(str(getattr(settings, 'DELIVERY_FEE_PER_PHARMACY', '0')))
+
+
+class CartSnapshot:
+    """
+    Carrito con precios vigentes, calculado en una sola consulta.
+
+    Cada línea es un diccionario con 'product', 'quantity', 'price' (precio
+    actual con descuento), 'added_price' (el guardado al agregarlo),
+    'total_price' y las marcas 'price_changed', 'unavailable' (producto
+    inactivo o eliminado) y 'insufficient_stock'.
+    """
+
+    def __init__(self, cart_items):
+        products = (
+            Product.objects.select_related('pharmacy').in_bulk([int(product_id) for product_id in cart_items])
+            if cart_items else {}
+        )
+        self.lines = []
+        for product_id, item in cart_items.items():
+            product = products.get(int(product_id))
+            added_price = Decimal(item['price'])
+            line = {
+                'product_id': int(product_id),
+                'product': product,
+                'quantity': item['quantity'],
+                'added_price': added_price,
+                'price': added_price,
+                'price_changed': False,
+                'unavailable': product is None or not product.is_active,
+                'insufficient_stock': False,
+            }
+            if product is not None:
+                line['price'] = product.discounted_price
+                # Comparar en centavos: el carrito en base de datos guarda dos decimales
+                line['price_changed'] = line['price'].quantize(CENT) != added_price.quantize(CENT)
+                line['insufficient_stock'] = product.stock_quantity < item['quantity']
+            line['total_price'] = line['price'] * line['quantity']
+            self.lines.append(line)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def available_lines(self):
+        return [line for line in self.lines if not line['unavailable']]
+
+    @property
+    def total(self):
+        return sum((line['total_price'] for line in self.available_lines), Decimal(0))
+
+    @property
+    def item_count(self):
+        return sum(line['quantity'] for line in self.available_lines)
+
+    @property
+    def has_price_changes(self):
+        return any(line['price_changed'] for line in self.available_lines)
+
+    @property
+    def has_problems(self):
+        """True si hay líneas que no se pueden comprar tal como están"""
+        return any(line['unavailable'] or line['insufficient_stock'] for line in self.lines)
+
+    @property
+    def delivery_total(self):
+        """Envío con entrega a domicilio: un cargo por farmacia"""
+        return delivery_fee() * len(self.pharmacies)
+
+    @property
+    def pharmacies(self):
+        """Líneas disponibles agrupadas por farmacia: {pharmacy_id: [líneas]}"""
+        pharmacy_lines = {}
+        for line in self.available_lines:
+            pharmacy_lines.setdefault(line['product'].pharmacy_id, []).append(line)
+        return pharmacy_lines
+
+
+def get_cart_snapshot(request):
+    """
+    Instantánea del carrito de la petición, memorizada en la propia petición
+    para que vistas y plantillas la reutilicen sin repetir la consulta.
+    """
+    snapshot = getattr(request, SNAPSHOT_ATTRIBUTE, None)
+    if snapshot is None:
+        snapshot = CartSnapshot(get_cart_storage(request).load())
+        setattr(request, SNAPSHOT_ATTRIBUTE, snapshot)
+    return snapshot
+
+
+def cached_cart_snapshot(request):
+    """Instantánea ya calculada en esta petición, o None (no consulta la base de datos)"""
+    return getattr(request, SNAPSHOT_ATTRIBUTE, None)
+
+
+def invalidate_cart_snapshot(request):
+    if hasattr(request, SNAPSHOT_ATTRIBUTE):
+        delattr(request, SNAPSHOT_ATTRIBUTE)
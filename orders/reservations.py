@@ -0,0 +1,152 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from farmaya.versioning import bump_version
+from products.autocomplete import record_listing_change
+from products.canonical import refresh_canonical_stats
+from products.facets import PRODUCT_CATALOG_VERSION
+from products.models import Product
+from users.counters import invalidate_pharmacy_counters
+from .models import StockReservation
+
+
+class InsufficientStock(Exception):
+    """Otro checkout se llevó el stock disponible de un producto"""
+
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f'Stock insuficiente para el producto {product_id}')
+
+
+def _stock_changed(quantities, delta_sign):
+    """
+    Los UPDATE con F() no disparan las señales de Product: actualizar a mano
+    lo que depende del stock. Los contadores de la farmacia se invalidan
+    siempre; si un producto se agotó o volvió a tener stock, también se
+    recalculan sus ofertas canónicas, se publica el cambio al autocompletado
+    y se invalida el catálogo cacheado (listados y facetas), estos dos tras
+    el commit.
+
+    Args:
+        quantities: {product_id: unidades movidas}
+        delta_sign: -1 si se descontaron, +1 si se devolvieron
+    """
+    crossed = []
+    pharmacy_ids = set()
+    for product_id, name, is_active, stock, canonical_id, pharmacy_id in Product.objects.filter(
+        pk__in=quantities,
+    ).values_list('id', 'name', 'is_active', 'stock_quantity', 'canonical_product_id', 'pharmacy_id'):
+        pharmacy_ids.add(pharmacy_id)
+        before = stock - delta_sign * quantities[product_id]
+        if is_active and (before > 0) != (stock > 0):
+            crossed.append((name, stock > 0, canonical_id))
+    invalidate_pharmacy_counters(pharmacy_ids)
+    if not crossed:
+        return
+
+    refresh_canonical_stats(canonical_id for _, _, canonical_id in crossed)
+    changes = [(None, name) if listed else (name, None) for name, listed, _ in crossed]
+
+    def publish():
+        for old_name, new_name in changes:
+            record_listing_change(old_name, new_name)
+        bump_version(PRODUCT_CATALOG_VERSION)
+    transaction.on_commit(publish)
+
+
+def _decrement_stock(quantities):
+    """
+    Descuenta el stock de cada producto con un UPDATE condicional
+    (``stock_quantity >= n``), de modo que dos checkouts concurrentes nunca
+    vendan la misma unidad. Los productos se actualizan en orden de id para
+    que las transacciones concurrentes tomen los bloqueos en el mismo orden.
+
+    Raises:
+        InsufficientStock: Si algún producto no tiene stock suficiente
+    """
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        updated = Product.objects.filter(pk=product_id, stock_quantity__gte=quantity).update(
+            stock_quantity=F('stock_quantity') - quantity,
+        )
+        if not updated:
+            raise InsufficientStock(product_id)
+    _stock_changed(quantities, -1)
+
+
+def _increment_stock(quantities):
+    for product_id in sorted(quantities):
+        Product.objects.filter(pk=product_id).update(stock_quantity=F('stock_quantity') + quantities[product_id])
+    _stock_changed(quantities, 1)
+
+
+def reserve_stock(order_items, status='held'):
+    """
+    Aparta el stock de los artículos dados y registra una reserva por
+    artículo. Debe llamarse dentro de una transacción: si un producto no
+    alcanza, la excepción revierte también los descuentos ya hechos.
+
+    Args:
+        order_items: OrderItem ya guardados (con order y product_id)
+        status: 'held' (hasta el pago) o 'committed' (venta ya confirmada)
+
+    Raises:
+        InsufficientStock: Si algún producto no tiene stock suficiente
+    """
+    quantities = {}
+    for item in order_items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    _decrement_stock(quantities)
+    StockReservation.objects.bulk_create([
+        StockReservation(order_id=item.order_id, product_id=item.product_id, quantity=item.quantity, status=status)
+        for item in order_items
+    ])
+
+
+def commit_reservations(orders):
+    """Convierte en definitivas las reservas apartadas de las órdenes pagadas"""
+    return StockReservation.objects.filter(order__in=orders, status='held').update(
+        status='committed', updated_at=timezone.now(),
+    )
+
+
+def release_reservations(orders):
+    """
+    Devuelve al stock las reservas (apartadas o confirmadas) de las órdenes
+    canceladas, con un UPDATE por producto.
+
+    Returns:
+        int: Cantidad de reservas liberadas
+    """
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update(of=('self',))
+            .filter(order__in=orders, status__in=['held', 'committed'])
+            .values_list('id', 'product_id', 'quantity')
+        )
+        if not reservations:
+            return 0
+        quantities = {}
+        for _, product_id, quantity in reservations:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        _increment_stock(quantities)
+        StockReservation.objects.filter(id__in=[row[0] for row in reservations]).update(
+            status='released', updated_at=timezone.now(),
+        )
+    return len(reservations)
+
+
+def confirm_order_stock(order):
+    """
+    Asegura que el stock de una orden confirmada esté descontado: confirma
+    sus reservas o, en órdenes creadas antes de las reservas, descuenta el
+    stock ahora con la misma actualización condicional.
+
+    Raises:
+        InsufficientStock: Si una orden sin reservas ya no tiene stock
+    """
+    with transaction.atomic():
+        if order.reservations.exists():
+            commit_reservations([order])
+        else:
+            reserve_stock(list(order.items.all()), status='committed')
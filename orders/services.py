@@ -0,0 +1,129 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from products.models import Product
+from users.models import PharmacyProfile
+from .models import MasterOrder, Order, OrderItem
+from .numbering import master_order_numbers, order_numbers
+from .pricing import delivery_fee
+from .reservations import InsufficientStock, reserve_stock
+
+# Plazo para pagar cada sub-orden
+PAYMENT_DEADLINE = timedelta(hours=24)
+
+
+class CheckoutError(Exception):
+    """El carrito no se puede convertir en una orden (producto inexistente, inactivo o sin stock)"""
+
+
+def place_order(client, lines, delivery_type, delivery_address='', delivery_instructions=''):
+    """
+    Crea la orden maestra, una sub-orden por farmacia y sus artículos.
+
+    Los productos y farmacias que no vengan ya cargados se traen con
+    ``in_bulk`` (una consulta cada uno); sub-órdenes y artículos se insertan
+    con ``bulk_create`` y todo ocurre en una sola transacción, así que un
+    error no deja órdenes a medio crear.
+
+    Args:
+        client: ClientProfile que compra
+        lines: Iterable de diccionarios con 'product_id', 'quantity' y,
+            opcionalmente, 'product' (ya cargado con su farmacia) y 'price'
+            (precio unitario; por defecto el precio vigente con descuento)
+        delivery_type: Tipo de entrega de las sub-órdenes
+        delivery_address: Dirección de entrega
+        delivery_instructions: Instrucciones de entrega
+
+    Returns:
+        MasterOrder: La orden maestra creada
+
+    El stock de cada artículo queda apartado (ver orders.reservations) hasta
+    que la sub-orden se pague o se cancele.
+
+    Raises:
+        CheckoutError: Si no hay líneas o algún producto no se puede vender
+    """
+    lines = [dict(line) for line in lines]
+    if not lines:
+        raise CheckoutError('El carrito está vacío.')
+
+    missing = [line['product_id'] for line in lines if line.get('product') is None]
+    if missing:
+        products = Product.objects.in_bulk(missing)
+        for line in lines:
+            if line.get('product') is None:
+                line['product'] = products.get(int(line['product_id']))
+
+    for line in lines:
+        product = line['product']
+        if product is None or not product.is_active:
+            raise CheckoutError('Algunos productos ya no están disponibles.')
+        if product.stock_quantity < line['quantity']:
+            raise CheckoutError(f'No hay stock suficiente de {product.name}.')
+        line['price'] = Decimal(line.get('price') or product.discounted_price)
+        line['total_price'] = line['price'] * line['quantity']
+
+    # Farmacias que no vinieron cargadas junto con sus productos
+    unloaded = {line['product'].pharmacy_id for line in lines if not Product.pharmacy.is_cached(line['product'])}
+    pharmacies = PharmacyProfile.objects.in_bulk(unloaded) if unloaded else {}
+
+    pharmacy_lines = {}
+    for line in lines:
+        pharmacy_lines.setdefault(line['product'].pharmacy_id, []).append(line)
+
+    deadline = timezone.now() + PAYMENT_DEADLINE
+    # El mismo cargo por farmacia con el que el optimizador del carrito compara planes
+    fee = delivery_fee(delivery_type)
+    # Números tomados antes de abrir la transacción, del bloque en memoria del proceso;
+    # bulk_create no llama a save(), así que se asignan aquí
+    master_order_number = master_order_numbers.next()
+    order_numbers_iter = iter(order_numbers.allocate(len(pharmacy_lines)))
+    with transaction.atomic():
+        master_order = MasterOrder.objects.create(
+            client=client,
+            master_order_number=master_order_number,
+            total_amount=sum(line['total_price'] for line in lines) + fee * len(pharmacy_lines),
+        )
+
+        sub_orders = []
+        for pharmacy_id, items in pharmacy_lines.items():
+            subtotal = sum(item['total_price'] for item in items)
+            sub_orders.append(Order(
+                master_order=master_order,
+                client=client,
+                pharmacy=pharmacies.get(pharmacy_id) or items[0]['product'].pharmacy,
+                order_number=next(order_numbers_iter),
+                subtotal=subtotal,
+                delivery_fee=fee,
+                total=subtotal + fee,
+                delivery_type=delivery_type,
+                delivery_address=delivery_address,
+                delivery_instructions=delivery_instructions,
+                payment_deadline=deadline,
+            ))
+        # Las órdenes nuevas están pendientes de pago, así que no cambian los
+        # contadores de la farmacia que invalidan las señales de post_save
+        Order.objects.bulk_create(sub_orders)
+
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=sub_order,
+                product=item['product'],
+                quantity=item['quantity'],
+                unit_price=item['price'],
+                total_price=item['total_price'],
+            )
+            for sub_order, items in zip(sub_orders, pharmacy_lines.values())
+            for item in items
+        ])
+
+        # Apartar el stock hasta el pago; si otro checkout se llevó las últimas
+        # unidades, la excepción revierte toda la orden
+        try:
+            reserve_stock(order_items)
+        except InsufficientStock as error:
+            product = next(line['product'] for line in lines if line['product'].pk == error.product_id)
+            raise CheckoutError(f'No hay stock suficiente de {product.name}.')
+
+    return master_order
@@ -1,3 +1,514 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from farmaya.versioning import get_version
+from products.autocomplete import get_autocomplete_index
+from products.facets import PRODUCT_CATALOG_VERSION
+from products.models import Product
+from users.models import ClientProfile, CustomUser, PharmacyProfile
+from .expiry import expire_overdue_orders
+from .gateways import StubGateway, VerificationResult
+from .idempotency import new_idempotency_key, prune_idempotency_keys
+from .models import CartLine, IdempotencyKey, MasterOrder, Order, OrderNumberSequence, Payment, StockReservation
+from .numbering import OrderNumberAllocator
+from .optimizer import _branch_and_bound, _greedy_cover, _improve, optimize_cart
+from .pricing import CartSnapshot
+from .reservations import commit_reservations, release_reservations
+from .services import CheckoutError, place_order
+from .verification import (
+    MAX_VERIFICATION_ATTEMPTS, apply_verification_result, claim_payments, enqueue_payment, schedule_retry,
+    verify_payment,
+)
 
-# Create your tests here.
+
+def create_pharmacy(name):
+    user = CustomUser.objects.create_user(username=name.lower().replace(' ', '_'), password='clave', user_type='pharmacy')
+    return PharmacyProfile.objects.create(
+        user=user, pharmacy_name=name, address='Av. Principal', city='Caracas',
+        state='Distrito Capital', zip_code='1010', latitude=Decimal('10.48'), longitude=Decimal('-66.90'),
+    )
+
+
+def create_client(username='cliente'):
+    user = CustomUser.objects.create_user(username=username, password='clave', user_type='client')
+    return ClientProfile.objects.create(user=user, first_name='Ana', last_name='Pérez')
+
+
+def create_product(pharmacy, name='Acetaminofén 500mg', price='2.50', stock=5):
+    return Product.objects.create(pharmacy=pharmacy, name=name, brand='Genvén', price=Decimal(price), stock_quantity=stock)
+
+
+class OrderTestCase(TestCase):
+    """Farmacia, cliente y producto comunes a las pruebas de órdenes"""
+
+    def setUp(self):
+        cache.clear()
+        self.pharmacy = create_pharmacy('Farmacia Central')
+        self.client_profile = create_client()
+        self.product = create_product(self.pharmacy)
+
+    def place(self, quantity=1, product=None):
+        product = product or self.product
+        return place_order(self.client_profile, [{'product_id': product.id, 'quantity': quantity}], 'pickup')
+
+    def stock(self, product=None):
+        return Product.objects.get(pk=(product or self.product).pk).stock_quantity
+
+
+class StockReservationTests(OrderTestCase):
+
+    def test_place_order_holds_stock(self):
+        master_order = self.place(2)
+
+        self.assertEqual(self.stock(), 3)
+        reservation = StockReservation.objects.get(order__master_order=master_order)
+        self.assertEqual((reservation.quantity, reservation.status), (2, 'held'))
+
+    def test_stock_taken_by_another_checkout_rolls_back_the_order(self):
+        # El producto se cargó antes de que otro checkout se llevara el stock
+        stale_product = Product.objects.get(pk=self.product.pk)
+        self.place(4)
+
+        with self.assertRaises(CheckoutError):
+            place_order(self.client_profile, [{'product_id': stale_product.id, 'quantity': 3, 'product': stale_product}], 'pickup')
+
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(MasterOrder.objects.count(), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_release_returns_stock_once(self):
+        master_order = self.place(2)
+        orders = list(master_order.sub_orders.all())
+
+        self.assertEqual(release_reservations(orders), 1)
+        self.assertEqual(release_reservations(orders), 0)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(StockReservation.objects.get().status, 'released')
+
+    def test_committed_reservations_are_released_on_cancel(self):
+        master_order = self.place(2)
+        orders = list(master_order.sub_orders.all())
+
+        self.assertEqual(commit_reservations(orders), 1)
+        self.assertEqual(StockReservation.objects.get().status, 'committed')
+        release_reservations(orders)
+        self.assertEqual(self.stock(), 5)
+
+    def test_selling_out_updates_catalog_data(self):
+        twin = create_product(create_pharmacy('Farmacia Norte'))
+        canonical = Product.objects.get(pk=self.product.pk).canonical_product
+        self.assertEqual(canonical.offer_count, 2)
+        version = get_version(PRODUCT_CATALOG_VERSION)
+        get_autocomplete_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            master_order = self.place(5, product=twin)
+        canonical.refresh_from_db()
+        self.assertEqual(canonical.offer_count, 1)
+        self.assertNotEqual(get_version(PRODUCT_CATALOG_VERSION), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            master_order = self.place(5)
+        self.assertEqual(get_autocomplete_index().complete('acetam'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_reservations(list(master_order.sub_orders.all()))
+        canonical.refresh_from_db()
+        self.assertEqual(canonical.offer_count, 1)
+        self.assertEqual(get_autocomplete_index().complete('acetam'), ['Acetaminofén 500mg'])
+
+
+class OrderExpiryTests(OrderTestCase):
+
+    def overdue(self):
+        return timezone.now() + timedelta(days=2)
+
+    def test_overdue_orders_are_cancelled_and_release_stock(self):
+        master_order = self.place(2)
+
+        self.assertEqual(expire_overdue_orders(self.overdue()), 1)
+
+        order = master_order.sub_orders.get()
+        self.assertEqual((order.order_status, order.payment_status), ('cancelled', 'failed'))
+        self.assertEqual(self.stock(), 5)
+        master_order.refresh_from_db()
+        self.assertEqual(master_order.payment_status, 'failed')
+        self.assertEqual(master_order.updated_at, order.updated_at)
+
+    def test_orders_within_deadline_or_paid_are_kept(self):
+        pending = self.place(1)
+        paid = self.place(1)
+        paid.sub_orders.update(order_status='paid', payment_status='completed')
+
+        self.assertEqual(expire_overdue_orders(), 0)
+        self.assertEqual(expire_overdue_orders(self.overdue()), 1)
+        self.assertEqual(paid.sub_orders.get().order_status, 'paid')
+        self.assertEqual(pending.sub_orders.get().order_status, 'cancelled')
+        self.assertEqual(self.stock(), 4)
+
+    def test_all_batches_are_swept(self):
+        for _ in range(5):
+            self.place(1)
+
+        self.assertEqual(expire_overdue_orders(self.overdue(), batch_size=2), 5)
+        self.assertFalse(Order.objects.filter(order_status='pending').exists())
+
+    def test_a_batch_with_nothing_cancelled_does_not_stop_the_sweep(self):
+        # Lote completo cuyas órdenes se pagaron entre la lectura y el UPDATE
+        batches = [(2, 0), (2, 2), (1, 1)]
+        with mock.patch('orders.expiry.expire_order_batch', side_effect=batches) as expire_batch:
+            self.assertEqual(expire_overdue_orders(self.overdue(), batch_size=2), 3)
+        self.assertEqual(expire_batch.call_count, 3)
+
+
+@override_settings(CART_STORAGE='database')
+class IdempotentCheckoutTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.client_profile.user)
+        CartLine.objects.create(user=self.client_profile.user, product=self.product, quantity=2, price=self.product.price)
+
+    def checkout(self, key, **data):
+        data = {'delivery_type': 'pickup', 'delivery_address': 'Av. Principal', 'idempotency_key': key, **data}
+        return self.client.post(reverse('orders:checkout'), data)
+
+    def test_retried_checkout_places_one_order(self):
+        key = new_idempotency_key()
+        first = self.checkout(key)
+        retry = self.checkout(key)
+
+        master_order = MasterOrder.objects.get()
+        location = reverse('orders:master_order_detail', args=[master_order.id])
+        self.assertRedirects(first, location, fetch_redirect_response=False)
+        self.assertRedirects(retry, location, fetch_redirect_response=False)
+        self.assertEqual(self.stock(), 3)
+
+    def test_invalid_form_releases_the_key(self):
+        key = new_idempotency_key()
+        response = self.checkout(key, delivery_type='')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.checkout(key)
+        self.assertEqual(MasterOrder.objects.count(), 1)
+
+    def test_key_still_processing_redirects_back(self):
+        key = new_idempotency_key()
+        IdempotencyKey.objects.create(user=self.client_profile.user, scope='checkout', key=key)
+
+        response = self.checkout(key)
+
+        self.assertRedirects(response, reverse('orders:checkout'), fetch_redirect_response=False)
+        self.assertFalse(MasterOrder.objects.exists())
+
+    def test_old_keys_are_pruned(self):
+        IdempotencyKey.objects.create(user=self.client_profile.user, scope='checkout', key='vieja')
+        IdempotencyKey.objects.create(user=self.client_profile.user, scope='checkout', key='nueva')
+        IdempotencyKey.objects.filter(key='vieja').update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(prune_idempotency_keys(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['nueva'])
+
+
+class OrderNumberAllocatorTests(TransactionTestCase):
+    # Sin la transacción que envuelve cada prueba de TestCase, para usar los bloques en memoria
+
+    def sequence(self, name='prueba'):
+        return OrderNumberSequence.objects.get(name=name).next_value
+
+    def test_numbers_come_from_process_blocks(self):
+        allocator = OrderNumberAllocator('prueba', 'PRB', block_size=3)
+
+        numbers = [allocator.next() for _ in range(4)] + allocator.allocate(2)
+
+        start = int(numbers[0].split('-')[1])
+        self.assertEqual(numbers, [allocator.format(start + offset) for offset in range(6)])
+        self.assertRegex(numbers[0], r'^PRB-\d{9}$')
+        self.assertEqual(self.sequence(), start + 6)
+
+    def test_allocators_never_share_numbers(self):
+        first = OrderNumberAllocator('prueba', 'PRB', block_size=3)
+        second = OrderNumberAllocator('prueba', 'PRB', block_size=3)
+
+        numbers = first.allocate(2) + second.allocate(2) + first.allocate(2)
+
+        # El segundo reservó su propio bloque; el primero sigue con el suyo
+        self.assertEqual(len(set(numbers)), 6)
+        self.assertEqual(numbers[2], first.format(int(numbers[0].split('-')[1]) + 3))
+        self.assertEqual(numbers[4], first.format(int(numbers[1].split('-')[1]) + 1))
+
+    def number(self, formatted):
+        return int(formatted.split('-')[1])
+
+    def test_inside_a_transaction_numbers_come_from_the_process_block(self):
+        allocator = OrderNumberAllocator('prueba', 'PRB', block_size=100)
+        first = self.number(allocator.next())
+        end = self.sequence()
+
+        with transaction.atomic():
+            numbers = allocator.allocate(2)
+            self.assertEqual(self.sequence(), end)
+            transaction.set_rollback(True)
+
+        # Los números de una transacción revertida quedan como huecos
+        self.assertEqual(numbers, [allocator.format(first + 1), allocator.format(first + 2)])
+        self.assertEqual(self.number(allocator.next()), first + 3)
+
+    def test_block_reserved_in_a_transaction_is_adopted_after_commit(self):
+        allocator = OrderNumberAllocator('prueba', 'PRB', block_size=100)
+
+        with transaction.atomic():
+            first = self.number(allocator.next())
+        end = self.sequence()
+
+        self.assertEqual(end, first + 100)
+        self.assertEqual(self.number(allocator.next()), first + 1)
+        self.assertEqual(self.sequence(), end)
+
+    def test_block_reserved_in_a_rolled_back_transaction_is_dropped(self):
+        allocator = OrderNumberAllocator('prueba', 'PRB', block_size=100)
+        allocator.next()
+        start = self.sequence()
+        allocator.next_value = allocator.end_value
+
+        with transaction.atomic():
+            allocator.next()
+            transaction.set_rollback(True)
+
+        self.assertEqual(self.sequence(), start)
+        # Otro proceso recibe ese mismo bloque; este reserva uno nuevo
+        other = OrderNumberAllocator('prueba', 'PRB', block_size=100)
+        self.assertEqual(self.number(other.next()), start)
+        self.assertEqual(self.number(allocator.next()), start + 100)
+
+    def test_orders_get_unique_numbers(self):
+        pharmacy = create_pharmacy('Farmacia Central')
+        client_profile = create_client()
+        product = create_product(pharmacy)
+        master_orders = [
+            place_order(client_profile, [{'product_id': product.id, 'quantity': 1}], 'pickup') for _ in range(3)
+        ]
+
+        master_numbers = [master_order.master_order_number for master_order in master_orders]
+        order_numbers = list(Order.objects.values_list('order_number', flat=True))
+        self.assertEqual(len(set(master_numbers)), 3)
+        self.assertEqual(len(set(order_numbers)), 3)
+        self.assertTrue(all(number.startswith('MORD-') for number in master_numbers))
+        self.assertTrue(all(number.startswith('ORD-') for number in order_numbers))
+
+
+class PaymentVerificationTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.master_order = self.place(2)
+        self.order = self.master_order.sub_orders.get()
+        enqueue_payment(Payment(order=self.order, payment_method='c2p', amount=self.order.total, c2p_reference='123456'))
+        claim_payments(1)
+
+    def claimed_payment(self):
+        return Payment.objects.select_related('order').get(order=self.order)
+
+    def test_approved_payment_marks_order_paid(self):
+        status = apply_verification_result(self.claimed_payment(), VerificationResult('approved', 'TX-1', ''))
+
+        self.assertEqual(status, 'verified')
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.order_status, self.order.payment_status), ('paid', 'completed'))
+        self.assertEqual(StockReservation.objects.get().status, 'committed')
+
+    def test_orders_being_verified_do_not_expire(self):
+        self.assertEqual(expire_overdue_orders(timezone.now() + timedelta(days=2)), 0)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 'pending')
+        self.assertEqual(self.stock(), 3)
+
+    def test_approval_for_cancelled_order_requires_refund(self):
+        Order.objects.filter(id=self.order.id).update(order_status='cancelled', payment_status='failed')
+        release_reservations([self.order])
+
+        status = apply_verification_result(self.claimed_payment(), VerificationResult('approved', 'TX-1', ''))
+
+        self.assertEqual(status, 'refund_required')
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.order_status, self.order.payment_status), ('cancelled', 'failed'))
+        self.assertEqual(StockReservation.objects.get().status, 'released')
+        self.assertEqual(self.stock(), 5)
+
+    def test_result_is_applied_once(self):
+        payment = self.claimed_payment()
+        apply_verification_result(payment, VerificationResult('approved', 'TX-1', ''))
+
+        # Un verificador que retomó el pago con el plazo vencido llega tarde con otro resultado
+        status = apply_verification_result(payment, VerificationResult('rejected', '', 'Referencia rechazada'))
+
+        self.assertEqual(status, 'verified')
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.order_status, self.order.payment_status), ('paid', 'completed'))
+
+    def test_exhausted_retries_let_the_order_expire(self):
+        payment = self.claimed_payment()
+        payment.verification_attempts = MAX_VERIFICATION_ATTEMPTS
+
+        self.assertEqual(schedule_retry(payment, 'Sin respuesta'), 'failed')
+        self.assertEqual(expire_overdue_orders(timezone.now() + timedelta(days=2)), 1)
+        self.assertEqual(self.stock(), 5)
+
+    def test_client_pays_again_after_the_gateway_gives_up(self):
+        payment = self.claimed_payment()
+        payment.verification_attempts = MAX_VERIFICATION_ATTEMPTS
+        schedule_retry(payment, 'Sin respuesta')
+        self.client.force_login(self.client_profile.user)
+
+        response = self.client.post(reverse('orders:payment', args=[self.order.id]), {
+            'payment_method': 'c2p', 'c2p_phone': '+584121234567', 'c2p_reference': '654321',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Payment.objects.get().verification_status, 'pending')
+        (payment_id,) = claim_payments(1)
+        self.assertEqual(verify_payment(payment_id, StubGateway()), 'verified')
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.order_status, self.order.payment_status), ('paid', 'completed'))
+
+    def test_cancelled_orders_do_not_take_payments(self):
+        Order.objects.filter(id=self.order.id).update(order_status='cancelled', payment_status='failed')
+        Payment.objects.update(verification_status='rejected')
+        self.client.force_login(self.client_profile.user)
+
+        self.client.post(reverse('orders:payment', args=[self.order.id]), {'payment_method': 'paypal'})
+
+        self.assertEqual(Payment.objects.get().verification_status, 'rejected')
+
+
+class CartOptimizerTests(SimpleTestCase):
+
+    def test_branch_and_bound_improves_on_the_greedy_cover(self):
+        # Farmacias 2, 3 y 4; la cobertura voraz abre 3 y 4 (25) y lo óptimo es 2 y 3 (23)
+        fee = Decimal(3)
+        items = [
+            {'quantity': 1, 'offers': {3: (Decimal(3), 10), 4: (Decimal(4), 11)}},
+            {'quantity': 1, 'offers': {2: (Decimal(5), 12), 3: (Decimal(8), 13)}},
+            {'quantity': 1, 'offers': {2: (Decimal(9), 14), 4: (Decimal(8), 15)}},
+        ]
+        greedy, greedy_cost = _improve(items, _greedy_cover(items, fee), fee)
+        self.assertEqual((greedy, greedy_cost), ({3, 4}, Decimal(25)))
+
+        chosen, cost, complete = _branch_and_bound(items, [2, 3, 4], fee, (greedy, greedy_cost), time.monotonic() + 5)
+
+        self.assertEqual((chosen, cost, complete), ({2, 3}, Decimal(23), True))
+
+
+@override_settings(DELIVERY_FEE_PER_PHARMACY='2.00')
+class DeliveryFeeTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        north = create_pharmacy('Farmacia Norte')
+        self.cheaper = create_product(north, price='2.00')
+        self.other = create_product(north, name='Loratadina 10mg', price='4.00')
+        self.cart = {
+            str(self.product.pk): {'quantity': 1, 'price': '2.50', 'pharmacy_id': self.pharmacy.pk},
+            str(self.other.pk): {'quantity': 1, 'price': '4.00', 'pharmacy_id': self.other.pharmacy_id},
+        }
+
+    def test_the_plan_total_is_what_checkout_charges(self):
+        plan = optimize_cart(self.cart)
+        self.assertEqual(plan['current_total'], Decimal('10.50'))
+        self.assertEqual(plan['pharmacies'], {self.other.pharmacy_id})
+
+        master_order = place_order(
+            self.client_profile,
+            [{'product_id': item['product_id'], 'quantity': item['quantity']} for item in plan['items']],
+            'internal',
+        )
+
+        self.assertEqual(master_order.total_amount, plan['total'])
+        self.assertEqual(plan['total'], Decimal('8.00'))
+        order = master_order.sub_orders.get()
+        self.assertEqual((order.subtotal, order.delivery_fee, order.total), (Decimal('6.00'), Decimal('2.00'), Decimal('8.00')))
+
+    def test_pickup_has_no_delivery_fee(self):
+        master_order = place_order(
+            self.client_profile, [{'product_id': int(product_id), 'quantity': 1} for product_id in self.cart], 'pickup',
+        )
+
+        self.assertEqual(master_order.total_amount, Decimal('6.50'))
+        self.assertEqual(sum(order.delivery_fee for order in master_order.sub_orders.all()), 0)
+
+
+class CartSnapshotTests(OrderTestCase):
+
+    def line(self, price='2.50', quantity=1):
+        return {'quantity': quantity, 'price': price, 'pharmacy_id': self.pharmacy.pk}
+
+    def test_unchanged_prices(self):
+        snapshot = CartSnapshot({str(self.product.pk): self.line(quantity=2)})
+
+        self.assertFalse(snapshot.has_price_changes)
+        self.assertFalse(snapshot.has_problems)
+        self.assertEqual(snapshot.total, Decimal('5.00'))
+
+    def test_price_changes_use_the_current_discounted_price(self):
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('3.00'), discount_percentage=Decimal('10'))
+
+        snapshot = CartSnapshot({str(self.product.pk): self.line(quantity=2)})
+
+        (line,) = snapshot
+        self.assertTrue(line['price_changed'])
+        self.assertEqual((line['added_price'], line['price']), (Decimal('2.50'), Decimal('2.70')))
+        self.assertEqual(snapshot.total, Decimal('5.40'))
+        # El precio guardado con más decimales no cuenta como cambio
+        self.assertFalse(CartSnapshot({str(self.product.pk): self.line('2.7000')}).has_price_changes)
+
+    def test_unavailable_lines_are_flagged_and_left_out_of_the_total(self):
+        inactive = create_product(self.pharmacy, name='Loratadina 10mg', price='4.00')
+        Product.objects.filter(pk=inactive.pk).update(is_active=False)
+
+        snapshot = CartSnapshot({
+            str(self.product.pk): self.line(quantity=6),
+            str(inactive.pk): self.line('4.00'),
+            '999999': self.line('1.00'),
+        })
+
+        self.assertTrue(snapshot.has_problems)
+        self.assertEqual([line['insufficient_stock'] for line in snapshot], [True, False, False])
+        self.assertEqual([line['unavailable'] for line in snapshot], [False, True, True])
+        self.assertEqual(snapshot.total, Decimal('15.00'))
+
+
+@override_settings(CART_STORAGE='database')
+class SessionCartMigrationTests(OrderTestCase):
+
+    def test_session_cart_moves_to_the_database_on_first_access(self):
+        user = self.client_profile.user
+        other = create_product(self.pharmacy, name='Loratadina 10mg', price='4.00')
+        CartLine.objects.create(user=user, product=self.product, quantity=1, price=self.product.price)
+        self.client.force_login(user)
+        session = self.client.session
+        session['cart'] = {
+            str(self.product.pk): {'quantity': 2, 'price': '2.50', 'pharmacy_id': self.pharmacy.pk},
+            str(other.pk): {'quantity': 1, 'price': '4.00', 'pharmacy_id': self.pharmacy.pk},
+            '999999': {'quantity': 1, 'price': '1.00', 'pharmacy_id': self.pharmacy.pk},
+        }
+        session.save()
+
+        self.client.get(reverse('orders:cart_detail'))
+
+        self.assertEqual(
+            dict(CartLine.objects.filter(user=user).values_list('product_id', 'quantity')),
+            {self.product.pk: 3, other.pk: 1},
+        )
+        self.assertNotIn('cart', self.client.session)
+
+        # Sin carrito en la sesión no se vuelve a migrar
+        self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(CartLine.objects.get(product=self.product).quantity, 3)
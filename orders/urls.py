@@ -7,6 +7,7 @@ urlpatterns = [
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:product_id>/', views.cart_add, name='cart_add'),
     path('cart/remove/<int:product_id>/', views.cart_remove, name='cart_remove'),
+    path('cart/optimize/', views.cart_optimize, name='cart_optimize'),
     path('checkout/', views.checkout, name='checkout'),
     path('payment/<int:order_id>/', views.payment, name='payment'),
     path('master-order/<int:master_order_id>/', views.master_order_detail, name='master_order_detail'),
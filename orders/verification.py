@@ -0,0 +1,164 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .gateways import GatewayError, get_payment_gateway
+from .models import Order, Payment
+from .reservations import commit_reservations
+
+# Tiempo que un verificador retiene un pago; si muere a mitad, otro lo retoma después
+VERIFICATION_LEASE = timedelta(minutes=2)
+# Reintentos ante fallos transitorios, con espera creciente (1, 2, 4, ... minutos)
+MAX_VERIFICATION_ATTEMPTS = 8
+RETRY_BASE_DELAY = timedelta(minutes=1)
+
+
+def enqueue_payment(payment):
+    """Pone un pago en la cola de verificación y deja su sub-orden en 'processing'"""
+    now = timezone.now()
+    payment.verification_status = 'pending'
+    payment.verification_attempts = 0
+    payment.verification_message = ''
+    payment.next_attempt_at = now
+    payment.save()
+
+    order = payment.order
+    order.payment_status = 'processing'
+    order.save(update_fields=['payment_status', 'updated_at'])
+    if order.master_order_id:
+        order.master_order.refresh_payment_status()
+
+
+def claim_payments(limit):
+    """
+    Toma hasta ``limit`` pagos listos para verificar (en cola, o en
+    verificación con el plazo vencido) y los marca como propios.
+
+    En PostgreSQL ``skip_locked`` permite que varios verificadores tomen
+    lotes distintos sin esperarse.
+
+    Returns:
+        list: ids de los pagos tomados
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        payment_ids = list(
+            Payment.objects.select_for_update(skip_locked=True)
+            .filter(verification_status__in=['pending', 'processing'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        Payment.objects.filter(id__in=payment_ids).update(
+            verification_status='processing',
+            verification_attempts=F('verification_attempts') + 1,
+            next_attempt_at=now + VERIFICATION_LEASE,
+        )
+    return payment_ids
+
+
+def check_payment(payment, gateway=None):
+    """
+    Consulta a la pasarela por un pago sin tocar la base de datos, de modo
+    que se pueda llamar desde varios hilos a la vez (la sub-orden debe venir
+    ya cargada).
+
+    Returns:
+        VerificationResult, o el GatewayError si el fallo es transitorio
+    """
+    gateway = gateway or get_payment_gateway()
+    try:
+        return gateway.verify(payment)
+    except GatewayError as error:
+        return error
+
+
+def record_verification(payment, outcome):
+    """
+    Aplica lo que devolvió check_payment: el resultado de la pasarela o un
+    reintento programado.
+
+    Returns:
+        str: Nuevo estado de verificación del pago
+    """
+    if isinstance(outcome, GatewayError):
+        return schedule_retry(payment, str(outcome))
+    return apply_verification_result(payment, outcome)
+
+
+def verify_payment(payment_id, gateway=None):
+    """
+    Verifica un pago tomado con claim_payments y aplica el resultado.
+
+    Returns:
+        str: Nuevo estado de verificación del pago
+    """
+    payment = Payment.objects.select_related('order').get(id=payment_id, verification_status='processing')
+    return record_verification(payment, check_payment(payment, gateway))
+
+
+def schedule_retry(payment, message):
+    if payment.verification_attempts >= MAX_VERIFICATION_ATTEMPTS:
+        status = 'failed'
+        next_attempt_at = None
+    else:
+        status = 'pending'
+        next_attempt_at = timezone.now() + RETRY_BASE_DELAY * 2 ** (payment.verification_attempts - 1)
+    with transaction.atomic():
+        updated = Payment.objects.filter(id=payment.id, verification_status='processing').update(
+            verification_status=status, next_attempt_at=next_attempt_at, verification_message=message[:255],
+        )
+        if updated and status == 'failed':
+            # Sin respuesta de la pasarela la sub-orden deja de estar en verificación y puede vencer
+            order = Order.objects.select_for_update().select_related('master_order').get(id=payment.order_id)
+            if order.payment_status == 'processing':
+                order.payment_status = 'failed'
+                order.save(update_fields=['payment_status', 'updated_at'])
+                if order.master_order:
+                    order.master_order.refresh_payment_status()
+    return status
+
+
+def apply_verification_result(payment, result):
+    """
+    Guarda el resultado de la pasarela y actualiza la sub-orden y la orden
+    maestra: un pago aprobado deja la sub-orden pagada y confirma su stock
+    apartado; uno rechazado permite volver a pagar. Un pago aprobado para una
+    sub-orden que ya no está pendiente (p. ej. cancelada) no la reactiva:
+    queda marcado para reembolso.
+
+    El resultado se aplica una sola vez: si otro verificador ya lo guardó
+    (p. ej. tras retomar el pago con el plazo vencido), no se hace nada.
+
+    Returns:
+        str: Estado de verificación del pago
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().select_related('master_order').get(id=payment.order_id)
+        now = timezone.now()
+        changes = {'verification_message': result.message[:255], 'next_attempt_at': None}
+        if result.status == 'approved':
+            changes.update(is_successful=True, payment_date=now, transaction_id=result.transaction_id)
+            if order.order_status == 'pending':
+                changes['verification_status'] = 'verified'
+            else:
+                changes['verification_status'] = 'refund_required'
+        else:
+            changes['verification_status'] = 'rejected'
+        updated = Payment.objects.filter(id=payment.id, verification_status='processing').update(**changes)
+        if not updated:
+            return Payment.objects.values_list('verification_status', flat=True).get(id=payment.id)
+        for field, value in changes.items():
+            setattr(payment, field, value)
+
+        # Con 'refund_required' la sub-orden queda como estaba: su stock ya se liberó
+        if payment.verification_status != 'refund_required':
+            if payment.verification_status == 'verified':
+                order.order_status = 'paid'
+                order.payment_status = 'completed'
+                commit_reservations([order])
+            else:
+                order.payment_status = 'failed'
+            order.save(update_fields=['order_status', 'payment_status', 'updated_at'])
+            if order.master_order:
+                order.master_order.refresh_payment_status()
+    return payment.verification_status
@@ -1,14 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import Http404
 from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
-from decimal import Decimal
 from .models import MasterOrder, Order, OrderItem, Payment, Delivery, Review
 from .forms import OrderForm, PaymentForm, ReviewForm
 from .cart import Cart
+from .idempotency import get_idempotency_key, idempotent, new_idempotency_key
+from .optimizer import OBJECTIVES, apply_cart_plan, optimize_cart
+from .reservations import InsufficientStock, confirm_order_stock, release_reservations
+from .services import CheckoutError, place_order
+from .verification import enqueue_payment
+from farmaya.pagination import KeysetPaginator, page_links
 from products.models import Product
+from users.geo import nearby_pharmacy_distances
 from users.models import ClientProfile
 from users.decorators import pharmacy_required
 
@@ -17,10 +23,16 @@ from users.decorators import pharmacy_required
 def cart_detail(request):
     """Vista del carrito de compras"""
     cart = Cart(request)
-    cart_total = cart.get_total_price()
+    snapshot = cart.snapshot()
+    # Las marcas de cambio ya quedaron en la instantánea; la sesión guarda los precios nuevos
+    cart.update_prices()
     return render(request, 'orders/cart_detail.html', {
-        'cart': cart,
-        'cart_total': cart_total,
+        'cart': snapshot,
+        'cart_total': snapshot.total,
+        'delivery_total': snapshot.delivery_total,
+        'order_total': snapshot.total + snapshot.delivery_total,
+        'price_changes': snapshot.has_price_changes,
+        'cart_problems': snapshot.has_problems,
     })
 
 
@@ -43,13 +55,59 @@ def cart_add(request, product_id):
 def cart_remove(request, product_id):
     """Remover producto del carrito"""
     cart = Cart(request)
-    product = get_object_or_404(Product, id=product_id)
-    cart.remove(product)
-    messages.success(request, f'{product.name} removido del carrito.')
+    product = Product.objects.filter(id=product_id).first()
+    if product is None and str(product_id) not in cart.cart:
+        raise Http404('Producto no encontrado')
+    # Un producto eliminado también debe poder quitarse del carrito
+    cart.remove(product or Product(id=product_id))
+    messages.success(request, f'{product.name if product else "Producto"} removido del carrito.')
+    return redirect('orders:cart_detail')
+
+
+@login_required
+def cart_optimize(request):
+    """Reasignar el carrito a las farmacias con el menor total (precios más envío)"""
+    if request.method != 'POST':
+        return redirect('orders:cart_detail')
+
+    cart = Cart(request)
+    if not cart:
+        messages.error(request, 'Tu carrito está vacío.')
+        return redirect('orders:cart_detail')
+
+    # Solo farmacias dentro del radio elegido, si el usuario compartió su ubicación
+    pharmacy_ids = None
+    user_lat = request.session.get('user_lat')
+    user_lng = request.session.get('user_lng')
+    if user_lat is not None and user_lng is not None:
+        try:
+            pharmacy_ids = set(nearby_pharmacy_distances(
+                float(user_lat), float(user_lng), float(request.session.get('max_distance', 10)),
+            ))
+        except (ValueError, TypeError):
+            pass
+
+    objective = request.POST.get('objective', 'cost')
+    if objective not in OBJECTIVES:
+        objective = 'cost'
+    plan = optimize_cart(cart.cart, pharmacy_ids=pharmacy_ids, objective=objective)
+
+    if plan['savings'] > 0 or (objective == 'pharmacies' and len(plan['pharmacies']) < len(cart.get_pharmacies())):
+        changed = apply_cart_plan(cart, plan)
+        messages.success(
+            request,
+            f'Carrito optimizado: {changed} producto(s) cambiados, {len(plan["pharmacies"])} farmacia(s). '
+            f'Total estimado con envío: {plan["total"]:.2f} USD (ahorro de {max(plan["savings"], 0):.2f} USD).',
+        )
+    else:
+        messages.info(request, 'Tu carrito ya tiene la combinación de farmacias más conveniente.')
+    if plan['unavailable']:
+        messages.warning(request, 'Algunos productos ya no están disponibles y no se pudieron reasignar.')
     return redirect('orders:cart_detail')
 
 
 @login_required
+@idempotent('checkout')
 def checkout(request):
     """Vista de checkout"""
     cart = Cart(request)
@@ -58,57 +116,32 @@ def checkout(request):
         return redirect('products:product_list')
 
     client_profile = get_object_or_404(ClientProfile, user=request.user)
+    snapshot = cart.snapshot()
+
+    if snapshot.has_problems:
+        messages.error(request, 'Algunos productos de tu carrito ya no están disponibles o no tienen stock suficiente.')
+        return redirect('orders:cart_detail')
+
+    if request.method == 'POST' and snapshot.has_price_changes:
+        # No cobrar un total distinto al que vio el cliente: mostrar los precios nuevos primero
+        cart.update_prices()
+        messages.warning(request, 'Algunos precios cambiaron. Revisa el total antes de confirmar.')
+        return redirect('orders:checkout')
 
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
-            # Crear orden maestra
-            master_order = MasterOrder.objects.create(
-                client=client_profile,
-                total_amount=cart.get_total_price(),
-            )
-
-            # Agrupar productos por farmacia
-            pharmacies = cart.get_pharmacies()
-
-            for pharmacy_id, items in pharmacies.items():
-                from users.models import PharmacyProfile
-                pharmacy = PharmacyProfile.objects.get(id=pharmacy_id)
-
-                # Calcular subtotal para esta farmacia
-                subtotal = sum(Decimal(item['price']) * item['quantity'] for item in items)
-
-                # Crear sub-orden
-                sub_order = Order.objects.create(
-                    master_order=master_order,
-                    client=client_profile,
-                    pharmacy=pharmacy,
-                    subtotal=subtotal,
-                    total=subtotal,  # Sin delivery fee por ahora
+            try:
+                master_order = place_order(
+                    client_profile,
+                    snapshot.available_lines,
                     delivery_type=form.cleaned_data['delivery_type'],
                     delivery_address=form.cleaned_data['delivery_address'],
                     delivery_instructions=form.cleaned_data.get('delivery_instructions', ''),
-                    payment_deadline=timezone.now() + timedelta(hours=24),
                 )
-
-                # Crear items para esta sub-orden
-                for item in items:
-                    # Obtener el producto desde la base de datos usando el product_id
-                    product_id = item['product_id']
-                    product = Product.objects.get(id=product_id)
-
-                    # Calcular total_price si no existe
-                    unit_price = Decimal(item['price'])
-                    quantity = item['quantity']
-                    total_price = unit_price * quantity
-
-                    OrderItem.objects.create(
-                        order=sub_order,
-                        product=product,
-                        quantity=quantity,
-                        unit_price=unit_price,
-                        total_price=total_price,
-                    )
+            except CheckoutError as error:
+                messages.error(request, str(error))
+                return redirect('orders:cart_detail')
 
             # Limpiar carrito
             cart.clear()
@@ -119,19 +152,23 @@ def checkout(request):
         form = OrderForm()
 
     # Variables calculadas para el template
-    cart_total = cart.get_total_price()
-    pharmacy_info = cart.get_pharmacies()  # Mostrar todas las farmacias
+    cart_total = snapshot.total
+    pharmacy_info = snapshot.pharmacies  # Mostrar todas las farmacias
 
     return render(request, 'orders/checkout.html', {
-        'cart': cart,
+        'cart': snapshot,
         'form': form,
         'client_profile': client_profile,
         'cart_total': cart_total,
+        'delivery_total': snapshot.delivery_total,
+        'order_total': cart_total + snapshot.delivery_total,
         'pharmacy_info': pharmacy_info,
+        'idempotency_key': get_idempotency_key(request) or new_idempotency_key(),
     })
 
 
 @login_required
+@idempotent('payment')
 def payment(request, order_id):
     """Vista de pago de orden"""
     order = get_object_or_404(Order, id=order_id)
@@ -140,58 +177,40 @@ def payment(request, order_id):
         from django.http import Http404
         raise Http404("No tienes permiso para ver esta orden")
 
+    if order.order_status != 'pending':
+        # Un pago para una orden cancelada o ya pagada terminaría en reembolso
+        messages.error(request, 'Esta orden ya no admite pagos.')
+        return redirect('orders:order_detail', order_id=order.id)
+
+    existing_payment = Payment.objects.filter(order=order).first()
+    if existing_payment and existing_payment.verification_status not in ('rejected', 'failed'):
+        # Un segundo pago chocaría con el OneToOneField Payment.order
+        messages.info(request, 'Esta orden ya tiene un pago registrado.')
+        return redirect('orders:order_detail', order_id=order.id)
+
     if request.method == 'POST':
         form = PaymentForm(request.POST)
         if form.is_valid():
-            payment_method = form.cleaned_data['payment_method']
-
-            # Crear pago
-            payment = Payment.objects.create(
-                order=order,
-                payment_method=payment_method,
-                amount=order.total,
-                c2p_phone=form.cleaned_data.get('c2p_phone'),
-                c2p_reference=form.cleaned_data.get('c2p_reference'),
-            )
-
-            # Simular procesamiento de pago
-            if payment_method == 'c2p':
-                # En producción, aquí iría la integración real con C2P
-                payment.is_successful = True
-                payment.payment_date = timezone.now()
-                payment.transaction_id = f"C2P-{order.order_number}"
-                payment.save()
-
-                # Actualizar estado de la orden
-                order.payment_status = 'completed'
-                order.order_status = 'paid'
-                order.save()
-
-                # Si es una sub-orden, actualizar el estado de pago de la orden maestra
-                if order.master_order:
-                    # Verificar si todas las sub-órdenes están pagadas
-                    all_sub_orders_paid = all(
-                        sub_order.payment_status == 'completed'
-                        for sub_order in order.master_order.sub_orders.all()
-                    )
-                    if all_sub_orders_paid:
-                        order.master_order.payment_status = 'completed'
-                        order.master_order.save()
-
-                messages.success(request, 'Pago procesado exitosamente.')
-                if order.master_order:
-                    return redirect('orders:master_order_detail', master_order_id=order.master_order.id)
-                else:
-                    return redirect('orders:order_detail', order_id=order.id)
-            else:
-                messages.info(request, 'Pago pendiente de verificación.')
-                return redirect('orders:order_detail', order_id=order.id)
+            # Crear pago (o reutilizar el rechazado o sin respuesta) y encolarlo: la verificación
+            # contra la pasarela ocurre en el comando verify_payments
+            payment = existing_payment or Payment(order=order)
+            payment.payment_method = form.cleaned_data['payment_method']
+            payment.amount = order.total
+            payment.c2p_phone = form.cleaned_data.get('c2p_phone') or ''
+            payment.c2p_reference = form.cleaned_data.get('c2p_reference') or ''
+            enqueue_payment(payment)
+
+            messages.info(request, 'Pago recibido. Te avisaremos cuando el banco lo confirme.')
+            if order.master_order:
+                return redirect('orders:master_order_detail', master_order_id=order.master_order.id)
+            return redirect('orders:order_detail', order_id=order.id)
     else:
         form = PaymentForm()
 
     return render(request, 'orders/payment.html', {
         'order': order,
         'form': form,
+        'idempotency_key': get_idempotency_key(request) or new_idempotency_key(),
     })
 
 
@@ -203,7 +222,8 @@ def order_detail(request, order_id):
         order = get_object_or_404(Order, id=order_id, client__user=request.user)
         # Para clientes: mostrar opciones de pago y reseña
         can_review = (order.order_status == 'delivered' and not hasattr(order, 'review'))
-        can_pay = (order.payment_status == 'pending' and order.order_status == 'pending')
+        # Tras un pago rechazado o sin respuesta de la pasarela se puede volver a pagar
+        can_pay = (order.payment_status in ('pending', 'failed') and order.order_status == 'pending')
         is_pharmacy_view = False
         is_client_view = True
         order_status_choices = []  # Clientes no pueden cambiar estado
@@ -254,6 +274,9 @@ def master_order_detail(request, master_order_id):
     })
 
 
+ORDER_LIST_PAGE_SIZE = 20
+
+
 @login_required
 def order_list(request):
     """Lista de órdenes del usuario"""
@@ -265,12 +288,20 @@ def order_list(request):
     else:
         # Para farmacias, mostrar órdenes de sus productos
         pharmacy_profile = get_object_or_404(PharmacyProfile, user=request.user)
-        orders = Order.objects.filter(pharmacy=pharmacy_profile).order_by('-created_at')
+        orders = Order.objects.filter(pharmacy=pharmacy_profile)
         is_client = False
         is_pharmacy = True
 
+    # Paginación por cursor sobre (-created_at, -id), con total aproximado
+    paginator = KeysetPaginator(orders, ['-created_at'], ORDER_LIST_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('cursor'))
+    order_count, order_count_exact = paginator.approximate_count()
+
     context = {
-        'orders': orders,
+        'orders': page,
+        **page_links(request, page),
+        'order_count': order_count,
+        'order_count_exact': order_count_exact,
         'is_client': is_client,
         'is_pharmacy': is_pharmacy,
     }
@@ -321,18 +352,18 @@ def update_order_status(request, order_id):
                     messages.warning(request, f'La orden ya está en estado final: {order.get_order_status_display()}. No se puede actualizar más.')
                     return redirect('orders:order_detail', order_id=order.id)
 
-            # Si la orden se confirma (pago confirmado), descontar stock automáticamente
+            # Si la orden se confirma (pago confirmado), el stock apartado en el checkout queda descontado
             if new_status == 'confirmed' and order.order_status == 'paid':
-                # Descontar stock de cada producto en la orden
-                for item in order.items.all():
-                    product = item.product
-                    if product.stock_quantity >= item.quantity:
-                        product.stock_quantity -= item.quantity
-                        product.save()
-                        messages.info(request, f'Stock actualizado: {product.name} (-{item.quantity})')
-                    else:
-                        messages.error(request, f'Stock insuficiente para {product.name}. Stock disponible: {product.stock_quantity}')
-                        return redirect('orders:order_detail', order_id=order.id)
+                try:
+                    confirm_order_stock(order)
+                except InsufficientStock as error:
+                    product = Product.objects.get(pk=error.product_id)
+                    messages.error(request, f'Stock insuficiente para {product.name}. Stock disponible: {product.stock_quantity}')
+                    return redirect('orders:order_detail', order_id=order.id)
+
+            # Al cancelar, el stock apartado vuelve a estar disponible
+            if new_status == 'cancelled' and order.order_status != 'cancelled':
+                release_reservations([order])
 
             order.order_status = new_status
             order.save()
@@ -0,0 +1,183 @@
+import copy
+import threading
+import time
+from bisect import bisect_left, insort
+from functools import lru_cache
+from django.core.cache import cache
+from django.db.models import Count, Min, Sum
+from farmaya.versioning import bump_version, get_version
+from users.utils import normalize_search_text
+
+AUTOCOMPLETE_VERSION = 'product_autocomplete'
+AUTOCOMPLETE_MAX_RESULTS = 8
+# Consultas distintas cuyos resultados se recuerdan por índice
+AUTOCOMPLETE_MEMO_SIZE = 1024
+# Los cambios se publican en cache para que otros procesos los apliquen
+AUTOCOMPLETE_CHANGE_TIMEOUT = 60 * 60
+AUTOCOMPLETE_MAX_PENDING_CHANGES = 500
+# La popularidad (volumen de pedidos) se refresca con una reconstrucción periódica
+AUTOCOMPLETE_REBUILD_INTERVAL = 60 * 60
+
+
+def _change_key(version):
+    return f'{AUTOCOMPLETE_VERSION}:change:{version}'
+
+
+class AutocompleteIndex:
+    """
+    Índice de prefijos sobre los nombres normalizados de productos activos.
+
+    Cada palabra de un nombre genera una entrada (sufijo desde esa palabra,
+    nombre), de modo que "forte" completa "Atamel Forte". Las entradas se
+    guardan en una lista ordenada y un prefijo se resuelve con dos búsquedas
+    binarias; los resultados se ordenan por volumen de pedidos.
+
+    Un índice publicado no se modifica: los cambios se aplican a una copia
+    (ver with_changes), así que se puede leer sin bloqueo desde varios hilos.
+    """
+
+    def __init__(self, listings, popularity, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.entries = []
+        self.display_names = {}
+        self.listings = {}
+        self.popularity = {}
+        self._ranked = lru_cache(maxsize=AUTOCOMPLETE_MEMO_SIZE)(self._rank)
+
+        for key, name, count in listings:
+            self._add(name, count, key=key)
+        for key, total in popularity:
+            self.popularity[key] = total or 0
+        self.entries.sort()
+
+    @classmethod
+    def build(cls, version):
+        from orders.models import OrderItem
+        from .models import Product
+
+        # Agrupado por la clave normalizada: sin normalizar fila por fila
+        listings = Product.objects.filter(
+            is_active=True, stock_quantity__gt=0
+        ).values_list('search_name').annotate(name=Min('name'), count=Count('id')).order_by()
+        popularity = OrderItem.objects.values_list('product__search_name').annotate(
+            total=Sum('quantity')
+        ).order_by()
+        return cls(listings, popularity, version)
+
+    @staticmethod
+    def _terms(key):
+        words = key.split(' ')
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def _add(self, name, count=1, sort=False, key=None):
+        if key is None:
+            key = normalize_search_text(name)
+        if not key:
+            return
+        if key not in self.listings:
+            self.listings[key] = 0
+            self.display_names[key] = name
+            for term in self._terms(key):
+                if sort:
+                    insort(self.entries, (term, key))
+                else:
+                    self.entries.append((term, key))
+        self.listings[key] += count
+
+    def _remove(self, name):
+        key = normalize_search_text(name)
+        if key not in self.listings:
+            return
+        self.listings[key] -= 1
+        if self.listings[key] <= 0:
+            del self.listings[key]
+            del self.display_names[key]
+            for term in self._terms(key):
+                position = bisect_left(self.entries, (term, key))
+                if position < len(self.entries) and self.entries[position] == (term, key):
+                    del self.entries[position]
+
+    def apply_change(self, old_name, new_name):
+        """Aplica el cambio de un producto listado: nombre anterior y nuevo (None si no aplica)"""
+        if old_name:
+            self._remove(old_name)
+        if new_name:
+            self._add(new_name, sort=True)
+
+    def with_changes(self, changes, version):
+        """Copia del índice con los cambios aplicados; este índice no se toca"""
+        index = copy.copy(self)
+        index.entries = list(self.entries)
+        index.display_names = dict(self.display_names)
+        index.listings = dict(self.listings)
+        index._ranked = lru_cache(maxsize=AUTOCOMPLETE_MEMO_SIZE)(index._rank)
+        for old_name, new_name in changes:
+            index.apply_change(old_name, new_name)
+        index.version = version
+        return index
+
+    def _rank(self, prefix, limit):
+        start = bisect_left(self.entries, (prefix,))
+        end = bisect_left(self.entries, (prefix + '\uffff',))
+        keys = {key for _, key in self.entries[start:end]}
+        ranked = sorted(keys, key=lambda key: (-self.popularity.get(key, 0), -self.listings[key], key))
+        return tuple(self.display_names[key] for key in ranked[:limit])
+
+    def complete(self, query, limit=AUTOCOMPLETE_MAX_RESULTS):
+        """
+        Nombres de productos que completan la consulta.
+
+        Returns:
+            list: Nombres para mostrar, el más pedido primero
+        """
+        prefix = normalize_search_text(query)
+        if not prefix:
+            return []
+        return list(self._ranked(prefix, limit))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def record_listing_change(old_name, new_name):
+    """
+    Publica el cambio de un producto listado para todos los procesos.
+
+    Cada cambio ocupa un número de versión; los procesos aplican los cambios
+    pendientes en orden y, si falta alguno, reconstruyen el índice completo.
+    """
+    if old_name == new_name:
+        return
+    version = bump_version(AUTOCOMPLETE_VERSION)
+    cache.set(_change_key(version), (old_name, new_name), AUTOCOMPLETE_CHANGE_TIMEOUT)
+
+
+def _catch_up(index, version):
+    """Índice nuevo con los cambios pendientes, o None si hay que reconstruirlo"""
+    pending = version - index.version
+    if pending <= 0 or pending > AUTOCOMPLETE_MAX_PENDING_CHANGES:
+        return None
+    keys = [_change_key(v) for v in range(index.version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    return index.with_changes([changes[key] for key in keys], version)
+
+
+def get_autocomplete_index():
+    """Índice vigente para este proceso, actualizado de forma incremental"""
+    global _index
+    version = get_version(AUTOCOMPLETE_VERSION)
+    index = _index
+    expired = index is None or time.monotonic() - index.built_at > AUTOCOMPLETE_REBUILD_INTERVAL
+    if expired or index.version != version:
+        with _index_lock:
+            index = _index
+            expired = index is None or time.monotonic() - index.built_at > AUTOCOMPLETE_REBUILD_INTERVAL
+            if expired:
+                index = _index = AutocompleteIndex.build(version)
+            elif index.version != version:
+                index = _index = _catch_up(index, version) or AutocompleteIndex.build(version)
+    return index
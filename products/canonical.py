@@ -0,0 +1,193 @@
+import re
+from decimal import Decimal, InvalidOperation
+from django.db.models import Count, Max, Min, Q
+from users.utils import calculate_distances, normalize_search_text
+
+# Concentraciones: "500mg", "1 g", "100 mcg", "1%", "30mg/5ml"
+STRENGTH_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(mg|g|mcg|ug|ml|ui|%)(?:\s*/\s*(\d+(?:[.,]\d+)?)?\s*(ml))?(?![a-z0-9])')
+# Tamaños de empaque que no cambian el producto: "x10", "x 30", "10 tabletas"
+PACK_PATTERN = re.compile(r'\bx\s*\d+\b|\b\d+\s*(?:tabletas|tab|capsulas|caps|comprimidos|sobres|unidades|und)\b')
+
+# Conversión a la unidad base para que "1g" y "1000mg" coincidan
+UNIT_FACTORS = {'g': (Decimal(1000), 'mg'), 'ug': (Decimal(1), 'mcg')}
+
+
+def _number(text):
+    try:
+        value = Decimal(text.replace(',', '.'))
+    except InvalidOperation:
+        return None
+    return value
+
+
+def _format(value):
+    return format(value.normalize(), 'f')
+
+
+def extract_strength(text):
+    """
+    Concentración normalizada presente en un texto ("1 g" -> "1000mg").
+
+    Returns:
+        str: Concentración en forma canónica, o '' si el texto no la indica
+    """
+    match = STRENGTH_PATTERN.search(normalize_search_text(text))
+    if not match:
+        return ''
+    amount, unit, per_amount, per_unit = match.groups()
+    value = _number(amount)
+    if value is None:
+        return ''
+    factor, unit = UNIT_FACTORS.get(unit, (Decimal(1), unit))
+    strength = f'{_format(value * factor)}{unit}'
+    if per_unit:
+        strength += f'/{_format(_number(per_amount or "1"))}{per_unit}'
+    return strength
+
+
+def canonical_parts(name, brand='', variant_names=()):
+    """
+    Nombre base, marca y concentración que identifican un producto entre farmacias.
+
+    La concentración sale del nombre o, si no la trae, de la primera
+    variante que la indique; el nombre base es el nombre sin concentración
+    ni tamaño de empaque.
+
+    Returns:
+        tuple: (nombre base, marca, concentración), todos normalizados
+    """
+    normalized = normalize_search_text(name)
+    strength = extract_strength(normalized)
+    if not strength:
+        strength = next(filter(None, (extract_strength(variant) for variant in variant_names)), '')
+    base = PACK_PATTERN.sub(' ', STRENGTH_PATTERN.sub(' ', normalized))
+    base = ' '.join(base.split())
+    return base or normalized, normalize_search_text(brand), strength
+
+
+def canonical_key(base, brand, strength):
+    return f'{base}|{brand}|{strength}'
+
+
+def offer_filter():
+    """Ofertas vigentes: productos activos con stock"""
+    return Q(is_active=True, stock_quantity__gt=0)
+
+
+def canonical_offers(canonical, latitude=None, longitude=None, sort='price'):
+    """
+    Ofertas vigentes de un producto canónico, con la distancia a cada farmacia.
+
+    Una sola consulta sobre el índice (canonical_product, price) trae las
+    ofertas ya ordenadas por precio; con sort='nearest' y una ubicación se
+    reordenan por distancia en memoria.
+
+    Returns:
+        list: Productos con el atributo ``distance`` (km o None)
+    """
+    offers = list(
+        canonical.products.filter(offer_filter())
+        .select_related('pharmacy')
+        .order_by('price', 'id')
+    )
+    for offer in offers:
+        offer.distance = None
+    if latitude is not None and longitude is not None:
+        located = [offer for offer in offers if offer.pharmacy.latitude is not None and offer.pharmacy.longitude is not None]
+        distances = calculate_distances(
+            latitude, longitude,
+            [offer.pharmacy.latitude for offer in located],
+            [offer.pharmacy.longitude for offer in located],
+        )
+        for offer, distance in zip(located, distances):
+            offer.distance = float(distance)
+        if sort == 'nearest':
+            offers.sort(key=lambda offer: (offer.distance is None, offer.distance or 0, offer.price))
+    return offers
+
+
+def refresh_canonical_stats(canonical_ids):
+    """Recalcula precio mínimo, máximo y cantidad de ofertas de los productos canónicos dados"""
+    from .models import CanonicalProduct, Product
+
+    canonical_ids = {canonical_id for canonical_id in canonical_ids if canonical_id is not None}
+    if not canonical_ids:
+        return
+    stats = {
+        row['canonical_product_id']: row
+        for row in Product.objects.filter(offer_filter(), canonical_product_id__in=canonical_ids)
+        .values('canonical_product_id')
+        .annotate(min_price=Min('price'), max_price=Max('price'), offer_count=Count('id'))
+        .order_by()
+    }
+    canonicals = list(CanonicalProduct.objects.filter(id__in=canonical_ids))
+    for canonical in canonicals:
+        row = stats.get(canonical.id, {})
+        canonical.min_price = row.get('min_price')
+        canonical.max_price = row.get('max_price')
+        canonical.offer_count = row.get('offer_count', 0)
+    CanonicalProduct.objects.bulk_update(canonicals, ['min_price', 'max_price', 'offer_count'])
+
+
+def get_or_create_canonical(name, brand='', variant_names=()):
+    from .models import CanonicalProduct
+
+    base, brand_key, strength = canonical_parts(name, brand, variant_names)
+    canonical, _ = CanonicalProduct.objects.get_or_create(
+        key=canonical_key(base, brand_key, strength),
+        defaults={'name': base, 'brand': brand_key, 'strength': strength},
+    )
+    return canonical
+
+
+def assign_canonical_product(product, variant_names=None):
+    """
+    Asocia un producto a su producto canónico y actualiza los precios de
+    ese canónico (y del anterior, si cambió).
+    """
+    from .models import Product
+
+    if variant_names is None:
+        variant_names = list(product.variants.order_by('id').values_list('name', flat=True)) if product.pk else []
+    previous_id = product.canonical_product_id
+    canonical = get_or_create_canonical(product.name, product.brand, variant_names)
+    if canonical.id != previous_id:
+        # update() para no volver a disparar las señales de guardado
+        Product.objects.filter(pk=product.pk).update(canonical_product=canonical)
+        product.canonical_product = canonical
+    refresh_canonical_stats({previous_id, canonical.id})
+    return canonical
+
+
+def rebuild_canonical_products(batch_size=2000):
+    """Reasigna todos los productos y recalcula los precios de todos los canónicos"""
+    from .models import CanonicalProduct, Product, ProductVariant
+
+    variants = {}
+    for product_id, name in ProductVariant.objects.order_by('id').values_list('product_id', 'name').iterator():
+        variants.setdefault(product_id, []).append(name)
+
+    canonical_ids = dict(CanonicalProduct.objects.values_list('key', 'id'))
+    pending = []
+    for product_id, name, brand, current_id in (
+        Product.objects.order_by('id').values_list('id', 'name', 'brand', 'canonical_product_id').iterator()
+    ):
+        base, brand_key, strength = canonical_parts(name, brand, variants.get(product_id, ()))
+        key = canonical_key(base, brand_key, strength)
+        if key not in canonical_ids:
+            canonical_ids[key] = CanonicalProduct.objects.create(
+                key=key, name=base, brand=brand_key, strength=strength,
+            ).id
+        if canonical_ids[key] != current_id:
+            pending.append(Product(id=product_id, canonical_product_id=canonical_ids[key]))
+        if len(pending) >= batch_size:
+            Product.objects.bulk_update(pending, ['canonical_product'])
+            pending = []
+    if pending:
+        Product.objects.bulk_update(pending, ['canonical_product'])
+
+    all_ids = list(CanonicalProduct.objects.values_list('id', flat=True))
+    for start in range(0, len(all_ids), batch_size):
+        refresh_canonical_stats(all_ids[start:start + batch_size])
+    # Canónicos que quedaron sin productos
+    CanonicalProduct.objects.filter(products__isnull=True).delete()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+from farmaya.versioning import get_version
+from users.geo import PHARMACY_GEO_VERSION
+from users.utils import normalize_search_text
+
+# Se invalida con cualquier cambio de productos, categorías o farmacias (ver products.signals)
+PRODUCT_CATALOG_VERSION = 'product_catalog'
+
+FACET_CACHE_TIMEOUT = 60 * 15
+
+# Rangos de precio en USD: (desde, hasta); el último no tiene tope
+PRICE_BUCKETS = [(0, 5), (5, 10), (10, 25), (25, 50), (50, None)]
+
+# Decimales de las coordenadas en la clave (~110 m)
+LOCATION_KEY_DECIMALS = 3
+
+
+def listing_filters(search_query=None, category=None, user_lat=None, user_lng=None, max_distance=None):
+    """
+    Filtros de un listado en forma canónica, para usarlos como clave de cache.
+
+    La consulta se normaliza y las coordenadas se redondean, así variantes
+    equivalentes de la misma búsqueda comparten entrada.
+    """
+    location = None
+    if user_lat is not None and user_lng is not None:
+        location = [
+            round(float(user_lat), LOCATION_KEY_DECIMALS),
+            round(float(user_lng), LOCATION_KEY_DECIMALS),
+            float(max_distance),
+        ]
+    return {
+        'q': normalize_search_text(search_query or ''),
+        'category': category.pk if category else None,
+        'location': location,
+    }
+
+
+def listing_cache_key(prefix, filters, *versions):
+    """Clave de cache para unos filtros canónicos y las versiones de los datos de los que dependen"""
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return ':'.join([prefix, *(str(version) for version in versions), digest])
+
+
+def price_bucket_label(low, high):
+    if high is None:
+        return f'Más de ${low}'
+    return f'${low} - ${high}'
+
+
+def _price_bucket():
+    return Case(
+        *[
+            When(price__lt=high, then=Value(index))
+            for index, (low, high) in enumerate(PRICE_BUCKETS) if high is not None
+        ],
+        default=Value(len(PRICE_BUCKETS) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def compute_facets(products):
+    """
+    Conteos por categoría, marca, farmacia, receta y rango de precio.
+
+    Una sola consulta agrupa por la combinación de todos los campos; los
+    conteos de cada faceta se obtienen sumando esos grupos en Python.
+
+    Returns:
+        dict: {faceta: [{'value', 'label', 'count'}, ...]} del más frecuente al menos
+    """
+    groups = products.order_by().annotate(price_bucket=_price_bucket()).values(
+        'category_id', 'category__name', 'brand', 'pharmacy_id', 'pharmacy__pharmacy_name',
+        'requires_prescription', 'price_bucket',
+    ).annotate(count=Count('id'))
+
+    facets = {name: {} for name in ('category', 'brand', 'pharmacy', 'requires_prescription', 'price')}
+
+    def add(facet, value, label, count):
+        entry = facets[facet].setdefault(value, {'value': value, 'label': label, 'count': 0})
+        entry['count'] += count
+
+    for group in groups:
+        count = group['count']
+        if group['category_id'] is not None:
+            add('category', group['category_id'], group['category__name'], count)
+        if group['brand']:
+            # Marcas escritas distinto ("Bayer", "BAYER") cuentan juntas
+            add('brand', normalize_search_text(group['brand']), group['brand'], count)
+        add('pharmacy', group['pharmacy_id'], group['pharmacy__pharmacy_name'], count)
+        add(
+            'requires_prescription', group['requires_prescription'],
+            'Requiere receta' if group['requires_prescription'] else 'Venta libre', count,
+        )
+        low, high = PRICE_BUCKETS[group['price_bucket']]
+        add('price', group['price_bucket'], price_bucket_label(low, high), count)
+
+    result = {
+        facet: sorted(values.values(), key=lambda entry: (-entry['count'], str(entry['label'])))
+        for facet, values in facets.items()
+    }
+    # Los rangos de precio se muestran en su orden natural
+    result['price'].sort(key=lambda entry: entry['value'])
+    return result
+
+
+def get_facets(products, filters):
+    """
+    Facetas del listado filtrado, guardadas en cache por filtros canónicos.
+
+    La clave incluye las versiones del catálogo y de las coordenadas de
+    farmacias, de modo que cualquier cambio las invalida sin borrado explícito.
+    """
+    key = listing_cache_key(
+        'product_facets', filters,
+        get_version(PRODUCT_CATALOG_VERSION), get_version(PHARMACY_GEO_VERSION),
+    )
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(products)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,274 @@
+import json
+import platform
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from orders.cart_storage import DatabaseCartStorage
+from orders.models import MasterOrder, Order
+from orders.reservations import release_reservations
+from products.models import Product
+from users.models import ClientProfile, PharmacyProfile
+
+SCENARIOS = [
+    'product_list', 'product_list_location', 'product_search', 'autocomplete',
+    'nearby_pharmacies', 'checkout', 'pharmacy_dashboard',
+]
+
+# Punto de referencia para las consultas por ubicación (Caracas)
+BENCHMARK_LAT = 10.4806
+BENCHMARK_LNG = -66.9036
+
+SEARCH_TERMS = ['acetaminofen', 'ibuprofeno 400mg', 'amoxicilina', 'loratadina', 'omeprasol', 'vitamina c']
+AUTOCOMPLETE_PREFIXES = ['ace', 'ibu', 'amox', 'lor', 'ome', 'vit']
+
+
+def percentile(values, fraction):
+    """Percentil con interpolación lineal sobre valores ya ordenados"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(timings, queries):
+    timings = sorted(timings)
+    return {
+        'iterations': len(timings),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p90_ms': round(percentile(timings, 0.90), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(timings[-1], 3),
+        'queries_min': min(queries),
+        'queries_max': max(queries),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia y cantidad de consultas de las vistas principales con el cliente de pruebas '
+        'de Django y reporta percentiles en JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3, help='Peticiones descartadas antes de medir')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Escenario a medir (repetible); por defecto todos')
+        parser.add_argument('--scales', default='',
+                            help='Tamaños de catálogo separados por coma (p. ej. 10000,100000,1000000); '
+                                 'antes de cada uno se generan productos con generate_catalog hasta alcanzarlo')
+        parser.add_argument('--cold', action='store_true', help='Vaciar el cache antes de cada petición')
+        parser.add_argument('--seed', type=int, default=None, help='Semilla para generate_catalog')
+        parser.add_argument('--output', help='Archivo JSON de salida (por defecto, salida estándar)')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or SCENARIOS
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        except ValueError:
+            raise CommandError('--scales debe ser una lista de enteros separados por coma')
+
+        setup_test_environment()
+        try:
+            runs = []
+            for scale in scales or [None]:
+                if scale is not None:
+                    self.grow_catalog(scale, options['seed'])
+                runs.append(self.run_scale(scenarios, options))
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'environment': {
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'python': platform.python_version(),
+                'debug': settings.DEBUG,
+            },
+            'runs': runs,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                handle.write(output + '\n')
+            self.stderr.write(f'Reporte guardado en {options["output"]}')
+        else:
+            self.stdout.write(output)
+
+    def grow_catalog(self, scale, seed):
+        missing = scale - Product.objects.count()
+        if missing > 0:
+            self.stderr.write(f'Generando {missing} productos para llegar a {scale}')
+            # Una farmacia cada ~100 productos, como en una cadena real
+            call_command(
+                'generate_catalog', products=missing, pharmacies=max(1, missing // 100),
+                clients=max(1, missing // 1000), orders=max(1, missing // 100), seed=seed,
+                stdout=self.stderr,
+            )
+
+    def run_scale(self, scenarios, options):
+        client_user = ClientProfile.objects.select_related('user').order_by('id').first()
+        pharmacy = (
+            PharmacyProfile.objects.filter(orders__isnull=False).select_related('user').order_by('id').first()
+            or PharmacyProfile.objects.select_related('user').order_by('id').first()
+        )
+        # Con el precio vigente (con descuento), el mismo que guarda el carrito:
+        # un precio distinto haría que el checkout redirija sin crear la orden
+        cart_products = [
+            (product.id, product.pharmacy_id, product.discounted_price)
+            for product in Product.objects.filter(is_active=True, stock_quantity__gt=0).order_by('id')
+            .only('id', 'pharmacy_id', 'price', 'discount_percentage')[:3]
+        ]
+
+        results = {}
+        for scenario in scenarios:
+            requests = getattr(self, f'requests_{scenario}')(client_user, pharmacy, cart_products)
+            if requests is None:
+                self.stderr.write(f'{scenario}: sin datos suficientes, se omite')
+                continue
+            results[scenario] = self.measure(scenario, requests, options)
+            self.stderr.write(
+                f"{scenario}: p50 {results[scenario]['p50_ms']} ms, "
+                f"p95 {results[scenario]['p95_ms']} ms, {results[scenario]['queries_mean']} consultas"
+            )
+
+        return {
+            'catalog': {
+                'products': Product.objects.count(),
+                'pharmacies': PharmacyProfile.objects.count(),
+                'orders': Order.objects.count(),
+            },
+            'scenarios': results,
+        }
+
+    def measure(self, scenario, requests, options):
+        timings = []
+        queries = []
+        statuses = {}
+        total = options['warmup'] + options['iterations']
+        prepare = getattr(requests, 'prepare', None)
+        cleanup = getattr(requests, 'cleanup', None)
+        for i in range(total):
+            if options['cold']:
+                cache.clear()
+            if prepare is not None:
+                prepare(i)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                status = requests(i)
+                elapsed = (time.perf_counter() - start) * 1000
+            if cleanup is not None:
+                cleanup(i)
+            if i < options['warmup']:
+                continue
+            timings.append(elapsed)
+            queries.append(len(captured.captured_queries))
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {**summarize(timings, queries), 'status_codes': statuses}
+
+    # Cada escenario devuelve una función que hace la petición i y retorna su código HTTP;
+    # sus atributos opcionales ``prepare`` y ``cleanup`` se ejecutan antes y después,
+    # fuera de la medición
+
+    def requests_product_list(self, client_user, pharmacy, cart_products):
+        client = Client()
+        url = reverse('products:product_list')
+        sorts = ['name', 'price_low', 'rating', 'best_value']
+        return lambda i: client.get(url, {'sort': sorts[i % len(sorts)]}).status_code
+
+    def requests_product_list_location(self, client_user, pharmacy, cart_products):
+        client = Client()
+        url = reverse('products:product_list')
+        params = {'lat': BENCHMARK_LAT, 'lng': BENCHMARK_LNG, 'distance': 10}
+        sorts = ['nearest', 'best_value', 'price_low']
+        return lambda i: client.get(url, {**params, 'sort': sorts[i % len(sorts)]}).status_code
+
+    def requests_product_search(self, client_user, pharmacy, cart_products):
+        client = Client()
+        url = reverse('products:product_search')
+        return lambda i: client.get(url, {'q': SEARCH_TERMS[i % len(SEARCH_TERMS)]}).status_code
+
+    def requests_autocomplete(self, client_user, pharmacy, cart_products):
+        client = Client()
+        url = reverse('products:autocomplete')
+        return lambda i: client.get(url, {'q': AUTOCOMPLETE_PREFIXES[i % len(AUTOCOMPLETE_PREFIXES)]}).status_code
+
+    def requests_nearby_pharmacies(self, client_user, pharmacy, cart_products):
+        client = Client()
+        url = reverse('products:nearby_pharmacies')
+        params = {'lat': BENCHMARK_LAT, 'lng': BENCHMARK_LNG}
+        variants = [{'distance': 5}, {'distance': 20}, {'k': 20}]
+        return lambda i: client.get(url, {**params, **variants[i % len(variants)]}).status_code
+
+    def requests_checkout(self, client_user, pharmacy, cart_products):
+        if client_user is None or not cart_products:
+            return None
+        client = Client()
+        client.force_login(client_user.user)
+        url = reverse('orders:checkout')
+        data = {'delivery_type': 'pickup', 'delivery_address': 'Benchmark', 'delivery_instructions': ''}
+
+        lines = {
+            str(product_id): {'quantity': 1, 'price': str(price), 'pharmacy_id': pharmacy_id}
+            for product_id, pharmacy_id, price in cart_products
+        }
+        state = {}
+
+        def prepare(i):
+            state['last_id'] = MasterOrder.objects.filter(client=client_user).aggregate(last_id=Max('id'))['last_id'] or 0
+            # El carrito se vuelve a cargar antes de cada petición porque el checkout lo vacía
+            if settings.CART_STORAGE == 'database':
+                DatabaseCartStorage(client_user.user).save_lines(lines)
+            else:
+                session = client.session
+                session[settings.CART_SESSION_ID] = dict(lines)
+                session.save()
+
+        def request(i):
+            # Sin transacción externa: la petición toma el mismo camino que en
+            # producción (p. ej. la numeración de órdenes por bloques)
+            state['response'] = client.post(url, data)
+            return state['response'].status_code
+
+        def cleanup(i):
+            # Comprobar que se creó exactamente una orden y deshacerla para no
+            # alterar los datos (ni el stock) entre iteraciones
+            master_orders = list(MasterOrder.objects.filter(client=client_user, id__gt=state['last_id']))
+            expected = len(master_orders) == 1 and state['response'].get('Location') == reverse(
+                'orders:master_order_detail', args=[master_orders[0].id],
+            )
+            for master_order in master_orders:
+                release_reservations(list(master_order.sub_orders.all()))
+                master_order.delete()
+            if not expected:
+                raise CommandError(
+                    f"checkout: se esperaba una orden nueva y la redirección a su detalle; se crearon "
+                    f"{len(master_orders)} y la respuesta fue {state['response'].status_code} "
+                    f"{state['response'].get('Location', '')}"
+                )
+
+        request.prepare = prepare
+        request.cleanup = cleanup
+        return request
+
+    def requests_pharmacy_dashboard(self, client_user, pharmacy, cart_products):
+        if pharmacy is None:
+            return None
+        client = Client()
+        client.force_login(pharmacy.user)
+        url = reverse('users:pharmacy_dashboard')
+        return lambda i: client.get(url).status_code
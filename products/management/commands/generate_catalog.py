@@ -0,0 +1,343 @@
+import random
+from datetime import time, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min
+from django.utils import timezone
+from django.utils.text import slugify
+from farmaya.versioning import bump_version
+from orders.models import MasterOrder, Order, OrderItem, Review
+from products.autocomplete import AUTOCOMPLETE_VERSION
+from products.facets import PRODUCT_CATALOG_VERSION
+from products.models import Category, Product
+from users.geo import PHARMACY_GEO_VERSION
+from users.models import ClientProfile, CustomUser, PharmacyProfile
+from users.utils import KM_PER_DEGREE, encode_geohash, normalize_search_text
+
+# Ciudad, estado, latitud, longitud y radio aproximado del área urbana (km)
+CITIES = [
+    ('Caracas', 'Distrito Capital', 10.4806, -66.9036, 12),
+    ('Maracaibo', 'Zulia', 10.6427, -71.6125, 10),
+    ('Valencia', 'Carabobo', 10.1620, -68.0077, 9),
+    ('Barquisimeto', 'Lara', 10.0678, -69.3474, 8),
+    ('Maracay', 'Aragua', 10.2469, -67.5958, 7),
+    ('Ciudad Guayana', 'Bolívar', 8.3533, -62.6525, 9),
+    ('Barcelona', 'Anzoátegui', 10.1364, -64.6862, 6),
+    ('Maturín', 'Monagas', 9.7457, -63.1832, 6),
+    ('Puerto La Cruz', 'Anzoátegui', 10.2142, -64.6328, 5),
+    ('Mérida', 'Mérida', 8.5897, -71.1561, 5),
+    ('San Cristóbal', 'Táchira', 7.7669, -72.2250, 6),
+    ('Cumaná', 'Sucre', 10.4565, -64.1675, 5),
+]
+# Peso de cada ciudad al repartir farmacias (aprox. población)
+CITY_WEIGHTS = [30, 15, 12, 10, 9, 7, 4, 4, 3, 2, 3, 2]
+
+PHARMACY_CHAINS = ['Farmatodo', 'Locatel', 'FarmaSigo', 'Farmacia SAAS', 'Farmahorro', 'Farmacia', 'Botica']
+
+CATEGORIES = [
+    'Analgésicos', 'Antibióticos', 'Antialérgicos', 'Antiácidos', 'Antihipertensivos',
+    'Vitaminas', 'Dermatología', 'Cuidado Personal', 'Respiratorio', 'Diabetes',
+]
+
+# Principio activo, categoría, presentaciones y si requiere receta
+MEDICINES = [
+    ('Acetaminofén', 'Analgésicos', ['500mg', '650mg', '1g'], False),
+    ('Ibuprofeno', 'Analgésicos', ['200mg', '400mg', '600mg'], False),
+    ('Diclofenac', 'Analgésicos', ['50mg', '75mg'], False),
+    ('Naproxeno', 'Analgésicos', ['250mg', '550mg'], False),
+    ('Amoxicilina', 'Antibióticos', ['250mg', '500mg', '875mg'], True),
+    ('Azitromicina', 'Antibióticos', ['500mg'], True),
+    ('Ciprofloxacina', 'Antibióticos', ['500mg'], True),
+    ('Cefalexina', 'Antibióticos', ['500mg'], True),
+    ('Loratadina', 'Antialérgicos', ['10mg'], False),
+    ('Cetirizina', 'Antialérgicos', ['10mg'], False),
+    ('Desloratadina', 'Antialérgicos', ['5mg'], False),
+    ('Omeprazol', 'Antiácidos', ['20mg', '40mg'], False),
+    ('Esomeprazol', 'Antiácidos', ['20mg', '40mg'], False),
+    ('Ranitidina', 'Antiácidos', ['150mg'], False),
+    ('Losartán', 'Antihipertensivos', ['50mg', '100mg'], True),
+    ('Enalapril', 'Antihipertensivos', ['10mg', '20mg'], True),
+    ('Amlodipino', 'Antihipertensivos', ['5mg', '10mg'], True),
+    ('Vitamina C', 'Vitaminas', ['500mg', '1g'], False),
+    ('Complejo B', 'Vitaminas', ['Tabletas', 'Jarabe'], False),
+    ('Ácido Fólico', 'Vitaminas', ['1mg', '5mg'], False),
+    ('Clotrimazol', 'Dermatología', ['Crema 1%'], False),
+    ('Hidrocortisona', 'Dermatología', ['Crema 1%'], False),
+    ('Protector Solar', 'Cuidado Personal', ['FPS 30', 'FPS 50'], False),
+    ('Salbutamol', 'Respiratorio', ['Inhalador 100mcg', 'Jarabe'], True),
+    ('Ambroxol', 'Respiratorio', ['Jarabe 30mg', 'Gotas'], False),
+    ('Metformina', 'Diabetes', ['500mg', '850mg'], True),
+    ('Glibenclamida', 'Diabetes', ['5mg'], True),
+]
+PRESENTATIONS = ['x10', 'x20', 'x30', '']
+
+BRANDS = ['Genven', 'Calox', 'Leti', 'Elter', 'Vargas', 'Siegfried', 'Bayer', 'Pfizer', 'La Santé', 'Medifarm']
+
+ORDER_STATUSES = ['pending', 'paid', 'confirmed', 'preparing', 'delivered', 'delivered', 'delivered', 'cancelled']
+
+GENERATED_PREFIX = 'gen'
+
+
+def random_point(rng, latitude, longitude, radius_km):
+    """Punto aleatorio alrededor de un centro, más denso hacia el centro"""
+    distance = radius_km * rng.random() ** 0.5
+    north = rng.uniform(-1, 1) * distance
+    east = rng.uniform(-1, 1) * distance
+    lat = latitude + north / KM_PER_DEGREE
+    lng = longitude + east / KM_PER_DEGREE
+    return Decimal(f'{lat:.6f}'), Decimal(f'{lng:.6f}')
+
+
+class Command(BaseCommand):
+    help = 'Genera farmacias, productos, clientes, órdenes y reseñas sintéticos para pruebas de rendimiento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pharmacies', type=int, default=100,
+                            help='Farmacias nuevas; con 0 los productos se reparten entre las existentes')
+        parser.add_argument('--products', type=int, default=10000, help='Productos nuevos')
+        parser.add_argument('--clients', type=int, default=50, help='Clientes nuevos')
+        parser.add_argument('--orders', type=int, default=500, help='Órdenes nuevas')
+        parser.add_argument('--seed', type=int, default=None, help='Semilla para datos reproducibles')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--password', default='farmaya123', help='Contraseña de los usuarios generados')
+        parser.add_argument('--skip-index', action='store_true',
+                            help='No reconstruir el índice de búsqueda ni los productos canónicos al terminar')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.password = make_password(options['password'])
+        # Sufijo único por ejecución para usuarios, SKU y números de orden
+        self.run_id = f'{timezone.now():%y%m%d%H%M%S}{self.rng.randrange(1000):03d}'
+
+        categories = self.create_categories()
+        pharmacies = self.create_pharmacies(options['pharmacies'])
+        if not pharmacies:
+            pharmacies = list(PharmacyProfile.objects.values_list('id', 'pharmacy_name'))
+        if not pharmacies and options['products']:
+            self.stderr.write('No hay farmacias a las que asignar productos')
+            return
+
+        self.create_products(options['products'], pharmacies, categories)
+        clients = self.create_clients(options['clients'])
+        self.create_orders(options['orders'], clients)
+
+        # bulk_create no emite señales: invalidar lo derivado del catálogo a mano
+        for name in (PRODUCT_CATALOG_VERSION, PHARMACY_GEO_VERSION, AUTOCOMPLETE_VERSION):
+            bump_version(name)
+        if not options['skip_index']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+            call_command('rebuild_canonical_products', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Catálogo: {PharmacyProfile.objects.count()} farmacias, {Product.objects.count()} productos, '
+            f'{Order.objects.count()} órdenes'
+        ))
+
+    def create_categories(self):
+        categories = {}
+        for name in CATEGORIES:
+            category, _ = Category.objects.get_or_create(name=name, defaults={'slug': slugify(name)})
+            categories[name] = category.id
+        return categories
+
+    def create_users(self, user_type, count):
+        users = [
+            CustomUser(
+                username=f'{GENERATED_PREFIX}_{user_type}_{self.run_id}_{i}',
+                email=f'{GENERATED_PREFIX}_{user_type}_{self.run_id}_{i}@example.com',
+                user_type=user_type,
+                password=self.password,
+                phone_number=f'+58414{self.rng.randrange(10 ** 7):07d}',
+            )
+            for i in range(count)
+        ]
+        CustomUser.objects.bulk_create(users, batch_size=self.batch_size)
+        return list(CustomUser.objects.filter(
+            username__startswith=f'{GENERATED_PREFIX}_{user_type}_{self.run_id}_'
+        ).values_list('id', flat=True))
+
+    @transaction.atomic
+    def create_pharmacies(self, count):
+        if count <= 0:
+            return []
+        user_ids = self.create_users('pharmacy', count)
+        pharmacies = []
+        for i, user_id in enumerate(user_ids):
+            city, state, lat, lng, radius = self.rng.choices(CITIES, weights=CITY_WEIGHTS)[0]
+            latitude, longitude = random_point(self.rng, lat, lng, radius)
+            name = f'{self.rng.choice(PHARMACY_CHAINS)} {city} {i + 1}'
+            opening = self.rng.choice([7, 8, 9])
+            pharmacies.append(PharmacyProfile(
+                user_id=user_id,
+                pharmacy_name=name,
+                # save() no se llama en bulk_create: claves derivadas a mano
+                search_name=normalize_search_text(name),
+                address=f'Av. Principal {self.rng.randrange(1, 200)}, {city}',
+                city=city,
+                state=state,
+                zip_code=f'{self.rng.randrange(1000, 9999)}',
+                latitude=latitude,
+                longitude=longitude,
+                geohash=encode_geohash(latitude, longitude),
+                is_verified=self.rng.random() < 0.8,
+                opening_time=time(opening, 0),
+                closing_time=time(self.rng.choice([18, 20, 22]), 0),
+            ))
+        PharmacyProfile.objects.bulk_create(pharmacies, batch_size=self.batch_size)
+        self.stdout.write(f'{count} farmacias creadas')
+        return list(PharmacyProfile.objects.filter(user_id__in=user_ids).values_list('id', 'pharmacy_name'))
+
+    def create_products(self, count, pharmacies, categories):
+        created = 0
+        while created < count:
+            size = min(self.batch_size, count - created)
+            products = [self.build_product(created + i, pharmacies, categories) for i in range(size)]
+            with transaction.atomic():
+                Product.objects.bulk_create(products, batch_size=self.batch_size)
+            created += size
+            self.stdout.write(f'{created}/{count} productos creados')
+
+    def build_product(self, index, pharmacies, categories):
+        pharmacy_id, pharmacy_name = self.rng.choice(pharmacies)
+        medicine, category, strengths, requires_prescription = self.rng.choice(MEDICINES)
+        brand = self.rng.choice(BRANDS)
+        name = ' '.join(filter(None, [medicine, self.rng.choice(strengths), self.rng.choice(PRESENTATIONS)]))
+        price = Decimal(f'{self.rng.lognormvariate(2, 0.7):.2f}') + Decimal('0.50')
+        original_price = None
+        discount = Decimal('0')
+        if self.rng.random() < 0.2:
+            original_price = (price * Decimal(self.rng.uniform(1.1, 1.5))).quantize(Decimal('0.01'))
+            discount = ((original_price - price) / original_price * 100).quantize(Decimal('0.01'))
+        return Product(
+            pharmacy_id=pharmacy_id,
+            category_id=categories[category],
+            name=name,
+            description=f'{medicine} {brand}',
+            brand=brand,
+            sku=f'{GENERATED_PREFIX.upper()}-{self.run_id}-{index}',
+            search_name=normalize_search_text(name),
+            search_brand=normalize_search_text(brand),
+            price=price,
+            original_price=original_price,
+            discount_percentage=discount,
+            stock_quantity=self.rng.choice([0, 5, 20, 50, 100, 200]),
+            requires_prescription=requires_prescription,
+            is_active=self.rng.random() < 0.95,
+            main_image='',
+        )
+
+    @transaction.atomic
+    def create_clients(self, count):
+        if count <= 0:
+            return list(ClientProfile.objects.values_list('id', flat=True))
+        user_ids = self.create_users('client', count)
+        clients = []
+        for i, user_id in enumerate(user_ids):
+            city, state, lat, lng, radius = self.rng.choices(CITIES, weights=CITY_WEIGHTS)[0]
+            latitude, longitude = random_point(self.rng, lat, lng, radius)
+            clients.append(ClientProfile(
+                user_id=user_id,
+                first_name=f'Cliente{i + 1}',
+                last_name='Sintético',
+                address=f'Calle {self.rng.randrange(1, 100)}, {city}',
+                city=city,
+                state=state,
+                latitude=latitude,
+                longitude=longitude,
+            ))
+        ClientProfile.objects.bulk_create(clients, batch_size=self.batch_size)
+        self.stdout.write(f'{count} clientes creados')
+        return list(ClientProfile.objects.filter(user_id__in=user_ids).values_list('id', flat=True))
+
+    @transaction.atomic
+    def create_orders(self, count, clients):
+        if count <= 0 or not clients:
+            return
+        # Muestra de productos en venta para armar los pedidos, desde un id al
+        # azar (ORDER BY RANDOM() recorrería toda la tabla)
+        for_sale = Product.objects.filter(is_active=True, stock_quantity__gt=0).order_by('id')
+        bounds = for_sale.aggregate(first=Min('id'), last=Max('id'))
+        start = self.rng.randint(bounds['first'], bounds['last']) if bounds['first'] is not None else 0
+        products = list(for_sale.filter(id__gte=start).values_list('id', 'pharmacy_id', 'price')[:5000])
+        if len(products) < 5000:
+            products += list(for_sale.filter(id__lt=start).values_list('id', 'pharmacy_id', 'price')[:5000 - len(products)])
+        if not products:
+            return
+
+        now = timezone.now()
+        master_orders = []
+        orders = []
+        items = []
+        for i in range(count):
+            client_id = self.rng.choice(clients)
+            product_id, pharmacy_id, price = self.rng.choice(products)
+            lines = [(product_id, price, self.rng.randint(1, 3))]
+            for product_id, line_pharmacy_id, price in self.rng.sample(products, min(2, len(products))):
+                if line_pharmacy_id == pharmacy_id and product_id != lines[0][0]:
+                    lines.append((product_id, price, self.rng.randint(1, 3)))
+            subtotal = sum(price * quantity for _, price, quantity in lines)
+            status = self.rng.choice(ORDER_STATUSES)
+
+            master_orders.append(MasterOrder(
+                client_id=client_id,
+                master_order_number=f'MGEN-{self.run_id}-{i}',
+                total_amount=subtotal,
+                payment_status='pending' if status == 'pending' else 'completed',
+            ))
+            orders.append(Order(
+                client_id=client_id,
+                pharmacy_id=pharmacy_id,
+                order_number=f'OGEN-{self.run_id}-{i}',
+                order_status=status,
+                payment_status='pending' if status == 'pending' else 'completed',
+                subtotal=subtotal,
+                total=subtotal,
+                delivery_type=self.rng.choice(['internal', 'external', 'pickup']),
+                payment_deadline=now + timedelta(hours=24),
+                delivered_at=now if status == 'delivered' else None,
+            ))
+            items.append(lines)
+
+        MasterOrder.objects.bulk_create(master_orders, batch_size=self.batch_size)
+        master_ids = dict(MasterOrder.objects.filter(
+            master_order_number__startswith=f'MGEN-{self.run_id}-'
+        ).values_list('master_order_number', 'id'))
+        for i, order in enumerate(orders):
+            order.master_order_id = master_ids[f'MGEN-{self.run_id}-{i}']
+        Order.objects.bulk_create(orders, batch_size=self.batch_size)
+        order_ids = dict(Order.objects.filter(
+            order_number__startswith=f'OGEN-{self.run_id}-'
+        ).values_list('order_number', 'id'))
+
+        order_items = []
+        reviews = []
+        for i, (order, lines) in enumerate(zip(orders, items)):
+            order_id = order_ids[order.order_number]
+            for product_id, price, quantity in lines:
+                order_items.append(OrderItem(
+                    order_id=order_id, product_id=product_id,
+                    quantity=quantity, unit_price=price, total_price=price * quantity,
+                ))
+            if order.order_status == 'delivered' and self.rng.random() < 0.6:
+                reviews.append(Review(
+                    order_id=order_id, client_id=order.client_id, pharmacy_id=order.pharmacy_id,
+                    rating=self.rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 3, 6, 8])[0],
+                ))
+        OrderItem.objects.bulk_create(order_items, batch_size=self.batch_size)
+        Review.objects.bulk_create(reviews, batch_size=self.batch_size)
+
+        # Review.save() actualiza la calificación; aquí se recalcula por farmacia de una vez
+        stats = Review.objects.filter(
+            pharmacy_id__in={review.pharmacy_id for review in reviews}
+        ).values('pharmacy_id').annotate(avg=Avg('rating'), total=Count('id'))
+        pharmacies = []
+        for row in stats:
+            pharmacies.append(PharmacyProfile(
+                id=row['pharmacy_id'], rating=Decimal(f"{row['avg']:.2f}"), total_reviews=row['total'],
+            ))
+        PharmacyProfile.objects.bulk_update(pharmacies, ['rating', 'total_reviews'], batch_size=self.batch_size)
+        self.stdout.write(f'{count} órdenes y {len(reviews)} reseñas creadas')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from products.canonical import rebuild_canonical_products
+from products.models import CanonicalProduct
+
+
+class Command(BaseCommand):
+    help = 'Reagrupa los productos en productos canónicos y recalcula sus rangos de precios (tras cargas masivas)'
+
+    def handle(self, *args, **options):
+        rebuild_canonical_products()
+        self.stdout.write(self.style.SUCCESS(f'{CanonicalProduct.objects.count()} productos canónicos'))
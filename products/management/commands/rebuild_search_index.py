@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.search import get_search_backend, rebuild_vocabulary
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos (tras cargas masivas o cambios de backend)'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.setup()
+        backend.rebuild()
+        rebuild_vocabulary()
+        self.stdout.write(self.style.SUCCESS(f'Índice reconstruido con {backend.__class__.__name__}'))
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:09
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize_search_text(text):
+    # Copia congelada de users.utils.normalize_search_text: la migración no
+    # debe cambiar de comportamiento si esa función cambia
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.lower().split())
+
+
+def populate_search_keys(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    batch = []
+    for product in Product.objects.only('id', 'name', 'brand').iterator():
+        product.search_name = normalize_search_text(product.name)
+        product.search_brand = normalize_search_text(product.brand)
+        batch.append(product)
+        if len(batch) >= 1000:
+            Product.objects.bulk_update(batch, ['search_name', 'search_brand'])
+            batch = []
+    Product.objects.bulk_update(batch, ['search_name', 'search_brand'])
+
+
+# SQL congelado (ver 0004): FTS5 indexa los textos originales; Postgres,
+# las claves normalizadas de producto y farmacia
+SQLITE_TABLE = 'products_product_fts'
+POSTGRES_TABLE = 'products_product_search'
+
+SQLITE_INDEX_SQL = f"""
+    INSERT INTO {SQLITE_TABLE} (rowid, name, description, brand, pharmacy_name)
+    SELECT p.id, p.name, p.description, p.brand, ph.pharmacy_name
+    FROM products_product p
+    INNER JOIN users_pharmacyprofile ph ON ph.id = p.pharmacy_id
+"""
+
+POSTGRES_INDEX_SQL = f"""
+    INSERT INTO {POSTGRES_TABLE} (product_id, document)
+    SELECT p.id,
+        setweight(to_tsvector('simple', coalesce(p.search_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(p.search_brand, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(ph.search_name, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(p.description, '')), 'D')
+    FROM products_product p
+    INNER JOIN users_pharmacyprofile ph ON ph.id = p.pharmacy_id
+"""
+
+
+def populate_search_index(apps, schema_editor):
+    # Única carga del índice creado en 0004, ya con todas las columnas que usa
+    tables = schema_editor.connection.introspection.table_names()
+    if SQLITE_TABLE in tables:
+        schema_editor.execute(f'DELETE FROM {SQLITE_TABLE}')
+        schema_editor.execute(SQLITE_INDEX_SQL)
+    elif POSTGRES_TABLE in tables:
+        schema_editor.execute(f'TRUNCATE {POSTGRES_TABLE}')
+        schema_editor.execute(POSTGRES_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+        ('users', '0005_pharmacyprofile_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_brand',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, verbose_name='Marca Normalizada'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200, verbose_name='Nombre Normalizado'),
+        ),
+        migrations.RunPython(populate_search_keys, migrations.RunPython.noop),
+        migrations.RunPython(populate_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:10
+
+import re
+
+import django.db.models.deletion
+from django.db import DatabaseError, migrations, models, transaction
+
+
+def enable_pg_trgm(apps, schema_editor):
+    # En Postgres la similitud usa pg_trgm si el usuario puede habilitarla;
+    # si no, se usa la lista de trigramas como en los demás motores
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic():
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            schema_editor.execute(
+                'CREATE INDEX IF NOT EXISTS products_searchterm_term_trgm '
+                'ON products_searchterm USING gin (term gin_trgm_ops)'
+            )
+    except DatabaseError:
+        pass
+
+
+# Copias congeladas de products.search.vocabulary_words y trigrams: la
+# migración no debe cambiar de comportamiento si ese módulo cambia
+VOCABULARY_MIN_LENGTH = 3
+
+
+def vocabulary_words(*texts):
+    words = set()
+    for text in texts:
+        words.update(
+            word for word in re.findall(r'\w+', text or '')
+            if VOCABULARY_MIN_LENGTH <= len(word) <= 100 and not word.isdigit()
+        )
+    return words
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def populate_vocabulary(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    SearchTerm = apps.get_model('products', 'SearchTerm')
+    SearchTermTrigram = apps.get_model('products', 'SearchTermTrigram')
+
+    words = set()
+    for search_name, search_brand in Product.objects.values_list('search_name', 'search_brand').distinct().iterator():
+        words |= vocabulary_words(search_name, search_brand)
+    words = sorted(words)
+    for start in range(0, len(words), 500):
+        terms = SearchTerm.objects.bulk_create([SearchTerm(term=word) for word in words[start:start + 500]])
+        SearchTermTrigram.objects.bulk_create([
+            SearchTermTrigram(term=term, trigram=trigram)
+            for term in terms
+            for trigram in trigrams(term.term)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_search_name_product_search_brand'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100, unique=True, verbose_name='Término')),
+            ],
+            options={
+                'verbose_name': 'Término de Búsqueda',
+                'verbose_name_plural': 'Términos de Búsqueda',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTermTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3, verbose_name='Trigrama')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='products.searchterm', verbose_name='Término')),
+            ],
+            options={
+                'verbose_name': 'Trigrama de Búsqueda',
+                'verbose_name_plural': 'Trigramas de Búsqueda',
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'term'), name='unique_search_term_trigram')],
+            },
+        ),
+        migrations.RunPython(enable_pg_trgm, migrations.RunPython.noop),
+        migrations.RunPython(populate_vocabulary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:18
+
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+# Copias congeladas de users.utils.normalize_search_text y de las reglas de
+# products.canonical: la migración no debe cambiar de comportamiento si esos
+# módulos cambian
+STRENGTH_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(mg|g|mcg|ug|ml|ui|%)(?:\s*/\s*(\d+(?:[.,]\d+)?)?\s*(ml))?(?![a-z0-9])')
+PACK_PATTERN = re.compile(r'\bx\s*\d+\b|\b\d+\s*(?:tabletas|tab|capsulas|caps|comprimidos|sobres|unidades|und)\b')
+UNIT_FACTORS = {'g': (Decimal(1000), 'mg'), 'ug': (Decimal(1), 'mcg')}
+
+
+def normalize_search_text(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.lower().split())
+
+
+def _number(text):
+    try:
+        return Decimal(text.replace(',', '.'))
+    except InvalidOperation:
+        return None
+
+
+def _format(value):
+    return format(value.normalize(), 'f')
+
+
+def extract_strength(text):
+    match = STRENGTH_PATTERN.search(normalize_search_text(text))
+    if not match:
+        return ''
+    amount, unit, per_amount, per_unit = match.groups()
+    value = _number(amount)
+    if value is None:
+        return ''
+    factor, unit = UNIT_FACTORS.get(unit, (Decimal(1), unit))
+    strength = f'{_format(value * factor)}{unit}'
+    if per_unit:
+        strength += f'/{_format(_number(per_amount or "1"))}{per_unit}'
+    return strength
+
+
+def canonical_parts(name, brand='', variant_names=()):
+    normalized = normalize_search_text(name)
+    strength = extract_strength(normalized)
+    if not strength:
+        strength = next(filter(None, (extract_strength(variant) for variant in variant_names)), '')
+    base = PACK_PATTERN.sub(' ', STRENGTH_PATTERN.sub(' ', normalized))
+    base = ' '.join(base.split())
+    return base or normalized, normalize_search_text(brand), strength
+
+
+def canonical_key(base, brand, strength):
+    return f'{base}|{brand}|{strength}'
+
+
+def populate_canonical_products(apps, schema_editor):
+    CanonicalProduct = apps.get_model('products', 'CanonicalProduct')
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+
+    variants = {}
+    for product_id, name in ProductVariant.objects.order_by('id').values_list('product_id', 'name').iterator():
+        variants.setdefault(product_id, []).append(name)
+
+    canonical_ids = {}
+    batch = []
+    for product in Product.objects.only('id', 'name', 'brand').iterator():
+        key = canonical_key(*canonical_parts(product.name, product.brand, variants.get(product.id, ())))
+        if key not in canonical_ids:
+            base, brand, strength = key.split('|')
+            canonical_ids[key] = CanonicalProduct.objects.create(key=key, name=base, brand=brand, strength=strength).id
+        product.canonical_product_id = canonical_ids[key]
+        batch.append(product)
+        if len(batch) >= 1000:
+            Product.objects.bulk_update(batch, ['canonical_product'])
+            batch = []
+    Product.objects.bulk_update(batch, ['canonical_product'])
+
+    stats = Product.objects.filter(is_active=True, stock_quantity__gt=0).values('canonical_product_id').annotate(
+        min_price=Min('price'), max_price=Max('price'), offer_count=Count('id'),
+    ).order_by()
+    for row in stats:
+        CanonicalProduct.objects.filter(id=row['canonical_product_id']).update(
+            min_price=row['min_price'], max_price=row['max_price'], offer_count=row['offer_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_searchterm_searchtermtrigram'),
+        ('users', '0005_pharmacyprofile_search_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanonicalProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=400, unique=True, verbose_name='Clave')),
+                ('name', models.CharField(max_length=200, verbose_name='Nombre')),
+                ('brand', models.CharField(blank=True, max_length=100, verbose_name='Marca')),
+                ('strength', models.CharField(blank=True, max_length=50, verbose_name='Concentración')),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Precio Mínimo (USD)')),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Precio Máximo (USD)')),
+                ('offer_count', models.PositiveIntegerField(default=0, verbose_name='Ofertas')),
+            ],
+            options={
+                'verbose_name': 'Producto Canónico',
+                'verbose_name_plural': 'Productos Canónicos',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='canonical_product',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='products.canonicalproduct', verbose_name='Producto Canónico'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['canonical_product', 'price'], name='product_canonical_price_idx'),
+        ),
+        migrations.RunPython(populate_canonical_products, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from users.models import PharmacyProfile
+from users.utils import normalize_search_text, remember_saved_values
 
 
 class Category(models.Model):
@@ -17,15 +18,46 @@ class Category(models.Model):
         return self.name
 
 
+class CanonicalProduct(models.Model):
+    """
+    Producto equivalente entre farmacias: mismo nombre base, marca y
+    concentración normalizados. Guarda el rango de precios de sus ofertas
+    vigentes, actualizado al guardar cada producto (ver products.canonical).
+    """
+    key = models.CharField(max_length=400, unique=True, verbose_name='Clave')
+    name = models.CharField(max_length=200, verbose_name='Nombre')
+    brand = models.CharField(max_length=100, blank=True, verbose_name='Marca')
+    strength = models.CharField(max_length=50, blank=True, verbose_name='Concentración')
+
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='Precio Mínimo (USD)')
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='Precio Máximo (USD)')
+    offer_count = models.PositiveIntegerField(default=0, verbose_name='Ofertas')
+
+    class Meta:
+        verbose_name = 'Producto Canónico'
+        verbose_name_plural = 'Productos Canónicos'
+
+    def __str__(self):
+        return ' '.join(filter(None, [self.name, self.strength, self.brand]))
+
+
 class Product(models.Model):
     pharmacy = models.ForeignKey(PharmacyProfile, on_delete=models.CASCADE, related_name='products', verbose_name='Farmacia')
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products', verbose_name='Categoría')
+    canonical_product = models.ForeignKey(
+        CanonicalProduct, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='products', verbose_name='Producto Canónico',
+    )
 
     name = models.CharField(max_length=200, verbose_name='Nombre del Producto')
     description = models.TextField(blank=True, verbose_name='Descripción')
     brand = models.CharField(max_length=100, blank=True, verbose_name='Marca')
     sku = models.CharField(max_length=100, unique=True, verbose_name='SKU')
 
+    # Claves de búsqueda normalizadas (minúsculas, sin acentos), mantenidas en save()
+    search_name = models.CharField(max_length=200, blank=True, db_index=True, editable=False, verbose_name='Nombre Normalizado')
+    search_brand = models.CharField(max_length=100, blank=True, db_index=True, editable=False, verbose_name='Marca Normalizada')
+
     # Pricing
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Precio (USD)')
     original_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='Precio Original (USD)')
@@ -49,10 +81,21 @@ class Product(models.Model):
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['-created_at']
+        indexes = [
+            # Ofertas de un producto canónico, la más barata primero
+            models.Index(fields=['canonical_product', 'price'], name='product_canonical_price_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.pharmacy.pharmacy_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores tal como se cargaron, para detectar cambios al guardar
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     @property
     def is_available(self):
         self._is_available = self.stock_quantity > 0
@@ -82,7 +125,14 @@ class Product(models.Model):
             unique_suffix = str(uuid.uuid4())[:8].upper()
             self.sku = f"{base_sku}-{unique_suffix}"
 
+        self.search_name = normalize_search_text(self.name)
+        self.search_brand = normalize_search_text(self.brand)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'name', 'brand'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'search_name', 'search_brand'}
+
         super().save(*args, **kwargs)
+        remember_saved_values(self, kwargs.get('update_fields'))
 
 
 class ProductImage(models.Model):
@@ -117,3 +167,31 @@ class ProductVariant(models.Model):
     @property
     def final_price(self):
         return self.product.price + self.price_modifier
+
+
+class SearchTerm(models.Model):
+    """Palabra del vocabulario de nombres y marcas, para la búsqueda tolerante a errores"""
+    term = models.CharField(max_length=100, unique=True, verbose_name='Término')
+
+    class Meta:
+        verbose_name = 'Término de Búsqueda'
+        verbose_name_plural = 'Términos de Búsqueda'
+
+    def __str__(self):
+        return self.term
+
+
+class SearchTermTrigram(models.Model):
+    """Lista de publicación trigrama -> término"""
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE, related_name='trigrams', verbose_name='Término')
+    trigram = models.CharField(max_length=3, verbose_name='Trigrama')
+
+    class Meta:
+        verbose_name = 'Trigrama de Búsqueda'
+        verbose_name_plural = 'Trigramas de Búsqueda'
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'term'], name='unique_search_term_trigram'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram} -> {self.term.term}"
@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from farmaya.cursors import decode_cursor, encode_cursor
+from farmaya.pagination import KeysetPage, KeysetPaginator
+from farmaya.versioning import get_version
+from users.geo import PHARMACY_GEO_VERSION
+from .facets import PRODUCT_CATALOG_VERSION, listing_cache_key
+from .models import Product
+
+RESULT_CACHE_TIMEOUT = 60 * 10
+# Ids guardados por listado (100 páginas de 12); las páginas más profundas se consultan directo
+RESULT_CACHE_MAX_IDS = 1200
+
+
+def get_product_results(filters, sort_by, build):
+    """
+    Resultado de un listado: ids ordenados, sugerencia de búsqueda y facetas.
+
+    Se guarda en cache bajo los filtros canónicos y el orden, con las
+    versiones del catálogo y de las coordenadas de farmacias en la clave.
+    Solo si no está en cache se llama a ``build()``, que debe devolver
+    (queryset filtrado y ordenado, sugerencia, facetas).
+
+    Returns:
+        dict: Con 'ids', 'count', 'suggestion' y 'facets'
+    """
+    key = listing_cache_key(
+        'product_results', {**filters, 'sort': sort_by},
+        get_version(PRODUCT_CATALOG_VERSION), get_version(PHARMACY_GEO_VERSION),
+    )
+    results = cache.get(key)
+    if results is None:
+        products, suggestion, facets = build()
+        ids = list(products.values_list('id', flat=True)[:RESULT_CACHE_MAX_IDS + 1])
+        count = len(ids) if len(ids) <= RESULT_CACHE_MAX_IDS else products.count()
+        results = {
+            'ids': ids[:RESULT_CACHE_MAX_IDS],
+            'count': count,
+            'suggestion': suggestion,
+            'facets': facets,
+        }
+        cache.set(key, results, RESULT_CACHE_TIMEOUT)
+    return results
+
+
+class ProductResultList:
+    """
+    Paginación por cursor sobre los ids cacheados de un listado.
+
+    Solo se consultan los productos de la página pedida. Pasado el último id
+    guardado, la navegación sigue por clave sobre el queryset que devuelve
+    ``fallback()``.
+    """
+
+    def __init__(self, results, per_page, distances=None, fallback=None):
+        self.ids = results['ids']
+        self.total = results['count']
+        self.per_page = per_page
+        self.distances = distances
+        self.fallback = fallback
+
+    def __len__(self):
+        return self.total
+
+    def keyset_paginator(self):
+        products = self.fallback().select_related('pharmacy', 'category')
+        return KeysetPaginator(products, products.query.order_by, self.per_page)
+
+    def page(self, cursor=None):
+        """
+        Página que sigue al token dado; un token inválido o de un resultado
+        ya invalidado devuelve la primera página.
+        """
+        try:
+            position = decode_cursor(cursor)
+        except ValueError:
+            position = None
+        if isinstance(position, dict) and 'k' in position and self.fallback is not None:
+            return self.keyset_paginator().get_page(cursor)
+
+        try:
+            index = self.ids.index(position['i'])
+            start = max(0, index - self.per_page) if position.get('p') else index + 1
+        except (TypeError, KeyError, ValueError):
+            start = 0
+        end = start + self.per_page
+
+        page_ids = self.ids[start:end]
+        next_cursor = previous_cursor = None
+        if end < len(self.ids):
+            next_cursor = encode_cursor({'i': self.ids[end - 1]})
+        elif page_ids and self.total > len(self.ids) and self.fallback is not None:
+            # Última página cacheada: el siguiente token continúa por clave
+            paginator = self.keyset_paginator()
+            next_cursor = paginator.cursor_for(paginator.queryset.get(pk=page_ids[-1]))
+        if start > 0:
+            previous_cursor = encode_cursor({'i': self.ids[start], 'p': True})
+        return KeysetPage(self.hydrate(page_ids), next_cursor, previous_cursor)
+
+    def hydrate(self, ids):
+        products = Product.objects.select_related('pharmacy', 'category').in_bulk(ids)
+        page = [products[product_id] for product_id in ids if product_id in products]
+        if self.distances is not None:
+            for product in page:
+                product.distance = self.distances.get(product.pharmacy_id)
+        return page
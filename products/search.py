@@ -0,0 +1,416 @@
+import re
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from users.utils import normalize_search_text
+
+# Máximo de ids que devuelve una búsqueda (ya filtrada por el listado); suficiente para muchas páginas
+SEARCH_MAX_RESULTS = 500
+
+# Columnas indexadas: producto y nombre de la farmacia que lo vende
+INDEX_SELECT_SQL = """
+    SELECT p.id, p.name, p.description, p.brand, ph.pharmacy_name
+    FROM products_product p
+    INNER JOIN users_pharmacyprofile ph ON ph.id = p.pharmacy_id
+"""
+
+# Mismas columnas, usando las claves normalizadas donde existen
+NORMALIZED_INDEX_SELECT_SQL = """
+    SELECT p.id, p.search_name, p.description, p.search_brand, ph.search_name
+    FROM products_product p
+    INNER JOIN users_pharmacyprofile ph ON ph.id = p.pharmacy_id
+"""
+
+
+# Búsqueda tolerante a errores: similitud mínima y candidatos evaluados por palabra
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+TRIGRAM_MAX_CANDIDATES = 50
+# Palabras más cortas no aportan trigramas útiles
+VOCABULARY_MIN_LENGTH = 3
+
+
+def search_terms(query):
+    """Palabras normalizadas de la consulta, sin caracteres con significado especial para los motores"""
+    return re.findall(r'\w+', normalize_search_text(query))
+
+
+def trigrams(word):
+    """Trigramas de una palabra con el mismo relleno que pg_trgm ("  ab " -> "  a", " ab", "ab ")"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(first, second):
+    """Coeficiente de Jaccard entre los trigramas de dos palabras"""
+    first, second = trigrams(first), trigrams(second)
+    return len(first & second) / len(first | second)
+
+
+def vocabulary_words(*texts):
+    """Palabras de textos ya normalizados que forman parte del vocabulario"""
+    words = set()
+    for text in texts:
+        words.update(
+            word for word in re.findall(r'\w+', text or '')
+            if VOCABULARY_MIN_LENGTH <= len(word) <= 100 and not word.isdigit()
+        )
+    return words
+
+
+def within_sql(within, column):
+    """Condición SQL ``AND column IN (...)`` con la subconsulta de ids de un queryset de productos"""
+    if within is None:
+        return '', []
+    sql, params = within.order_by().values('id').query.sql_with_params()
+    return f' AND {column} IN ({sql})', list(params)
+
+
+class SearchBackend:
+    """
+    Índice de búsqueda de productos.
+
+    Cada backend mantiene su propia estructura en la base de datos y devuelve
+    ids de productos ordenados por relevancia.
+    """
+
+    def setup(self):
+        """Crea las estructuras del índice"""
+
+    def teardown(self):
+        """Elimina las estructuras del índice"""
+
+    def index_products(self, product_ids):
+        """Indexa (o reindexa) los productos indicados"""
+
+    def index_pharmacy(self, pharmacy_id):
+        """Reindexa todos los productos de una farmacia"""
+
+    def remove_products(self, product_ids):
+        """Quita productos del índice"""
+
+    def rebuild(self):
+        """Reconstruye el índice completo"""
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS, within=None):
+        """
+        Busca productos.
+
+        Args:
+            query: Texto buscado
+            limit: Máximo de ids devueltos
+            within: Queryset de productos al que se restringe la búsqueda (los
+                filtros del listado); el límite se aplica después de filtrar
+
+        Returns:
+            list: Ids de productos, el más relevante primero
+        """
+        raise NotImplementedError
+
+    def index_terms(self, words):
+        """Agrega palabras al vocabulario con su lista de trigramas"""
+        from .models import SearchTerm, SearchTermTrigram
+
+        words = set(words)
+        if not words:
+            return
+        existing = set(SearchTerm.objects.filter(term__in=words).values_list('term', flat=True))
+        new_terms = SearchTerm.objects.bulk_create(
+            [SearchTerm(term=word) for word in sorted(words - existing)],
+            ignore_conflicts=True,
+        )
+        # Con ignore_conflicts no todos los backends devuelven ids: releerlos
+        new_terms = SearchTerm.objects.filter(term__in=[term.term for term in new_terms])
+        SearchTermTrigram.objects.bulk_create(
+            [
+                SearchTermTrigram(term=term, trigram=trigram)
+                for term in new_terms
+                for trigram in trigrams(term.term)
+            ],
+            ignore_conflicts=True,
+        )
+
+    def similar_terms(self, word, limit=5):
+        """
+        Términos del vocabulario parecidos a una palabra.
+
+        Los candidatos salen de la lista de trigramas (los que comparten más
+        trigramas primero) y se ordenan por similitud de Jaccard.
+
+        Returns:
+            list: Tuplas (similitud, término), la más parecida primero
+        """
+        from django.db.models import Count
+        from .models import SearchTermTrigram
+
+        candidates = SearchTermTrigram.objects.filter(
+            trigram__in=trigrams(word)
+        ).values_list('term__term').annotate(shared=Count('id')).order_by('-shared')[:TRIGRAM_MAX_CANDIDATES]
+        scored = sorted(
+            ((trigram_similarity(word, term), term) for term, _ in candidates),
+            key=lambda item: (-item[0], item[1]),
+        )
+        return [item for item in scored if item[0] >= TRIGRAM_SIMILARITY_THRESHOLD][:limit]
+
+    def suggest(self, query):
+        """
+        Consulta corregida ("¿quisiste decir?") para una búsqueda sin resultados.
+
+        Cada palabra que no está en el vocabulario se reemplaza por el término
+        más parecido.
+
+        Returns:
+            str o None si no hay ninguna corrección
+        """
+        from .models import SearchTerm
+
+        words = search_terms(query)
+        known = set(SearchTerm.objects.filter(term__in=words).values_list('term', flat=True))
+        corrected = []
+        for word in words:
+            if word in known or len(word) < VOCABULARY_MIN_LENGTH or word.isdigit():
+                corrected.append(word)
+                continue
+            similar = self.similar_terms(word, limit=1)
+            corrected.append(similar[0][1] if similar else word)
+        if corrected == words:
+            return None
+        return ' '.join(corrected)
+
+
+class DatabaseSearchBackend(SearchBackend):
+    """
+    Búsqueda sin índice propio, sobre las claves normalizadas.
+
+    Usa prefijo en nombre de producto y farmacia e igualdad en marca, todas
+    consultas por rango o igualdad que aprovechan los índices de las columnas.
+    """
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS, within=None):
+        from .models import Product
+
+        key = normalize_search_text(query)
+        if not key:
+            return []
+        upper = key + '\uffff'
+        products = (Product.objects.all() if within is None else within).filter(
+            Q(search_name__gte=key, search_name__lt=upper) |
+            Q(search_brand=key) |
+            Q(pharmacy__search_name__gte=key, pharmacy__search_name__lt=upper)
+        )
+        return list(products.order_by('search_name', 'id').values_list('id', flat=True)[:limit])
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Tabla virtual FTS5 con rowid igual al id del producto, ordenada por bm25"""
+
+    table = 'products_product_fts'
+    # Pesos bm25 por columna: nombre, descripción, marca, farmacia
+    weights = (10.0, 1.0, 5.0, 3.0)
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "name, description, brand, pharmacy_name, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def teardown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def _index_where(self, where, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN (SELECT p.id FROM products_product p WHERE {where})', params)
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description, brand, pharmacy_name) '
+                f'{INDEX_SELECT_SQL} WHERE {where}',
+                params,
+            )
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            self._index_where(f'p.id IN ({placeholders})', product_ids)
+
+    def index_pharmacy(self, pharmacy_id):
+        self._index_where('p.pharmacy_id = %s', [pharmacy_id])
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', product_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(f'INSERT INTO {self.table} (rowid, name, description, brand, pharmacy_name) {INDEX_SELECT_SQL}')
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS, within=None):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # Cada término como prefijo entre comillas; FTS5 los combina con AND
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        filter_sql, filter_params = within_sql(within, 'rowid')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s{filter_sql} '
+                f'ORDER BY bm25({self.table}, {weights}) LIMIT %s',
+                [match, *filter_params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Tabla con tsvector ponderado por columna e índice GIN, ordenada por ts_rank.
+
+    Indexa las claves normalizadas, así la búsqueda ignora acentos sin
+    depender de la extensión unaccent.
+    """
+
+    table = 'products_product_search'
+    config = 'simple'
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'product_id bigint PRIMARY KEY REFERENCES products_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_document_gin ON {self.table} USING gin (document)')
+
+    def teardown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def _document_sql(self):
+        return (
+            f"setweight(to_tsvector('{self.config}', coalesce(name, '')), 'A') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(brand, '')), 'B') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(pharmacy_name, '')), 'C') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(description, '')), 'D')"
+        )
+
+    def _index_where(self, where, params):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (product_id, document) '
+                f'SELECT id, {self._document_sql()} FROM ({NORMALIZED_INDEX_SELECT_SQL} {where}) AS source '
+                '(id, name, description, brand, pharmacy_name) '
+                'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+                params,
+            )
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            self._index_where('WHERE p.id = ANY(%s)', [product_ids])
+
+    def index_pharmacy(self, pharmacy_id):
+        self._index_where('WHERE p.pharmacy_id = %s', [pharmacy_id])
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table} WHERE product_id = ANY(%s)', [product_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+        self._index_where('', [])
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS, within=None):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        filter_sql, filter_params = within_sql(within, 'product_id')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_id FROM {self.table}, to_tsquery('{self.config}', %s) AS query "
+                f'WHERE document @@ query{filter_sql} ORDER BY ts_rank(document, query) DESC, product_id LIMIT %s',
+                [tsquery, *filter_params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def rebuild_vocabulary():
+    """Reconstruye el vocabulario de la búsqueda tolerante a errores desde los productos"""
+    from .models import Product, SearchTerm
+
+    SearchTerm.objects.all().delete()
+    words = set()
+    for search_name, search_brand in Product.objects.values_list('search_name', 'search_brand').distinct().iterator():
+        words |= vocabulary_words(search_name, search_brand)
+    words = sorted(words)
+    backend = get_search_backend()
+    for start in range(0, len(words), 500):
+        backend.index_terms(words[start:start + 500])
+
+
+class PostgresTrigramSearchBackend(PostgresSearchBackend):
+    """
+    Igual que PostgresSearchBackend, con la similitud de términos resuelta por
+    pg_trgm sobre un índice GIN del vocabulario en lugar de la lista de trigramas.
+    """
+
+    def index_terms(self, words):
+        from .models import SearchTerm
+
+        SearchTerm.objects.bulk_create([SearchTerm(term=word) for word in set(words)], ignore_conflicts=True)
+
+    def similar_terms(self, word, limit=5):
+        from .models import SearchTerm
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT similarity(term, %s) AS score, term FROM {SearchTerm._meta.db_table} '
+                'WHERE term %% %s ORDER BY score DESC, term LIMIT %s',
+                [word, word, limit],
+            )
+            return [(score, term) for score, term in cursor.fetchall() if score >= TRIGRAM_SIMILARITY_THRESHOLD]
+
+
+def postgres_has_trigram():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def sqlite_has_fts5():
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Backend de búsqueda para la base de datos configurada.
+
+    Se puede forzar con el setting PRODUCT_SEARCH_BACKEND (ruta a la clase).
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        if backend_path:
+            backend_class = import_string(backend_path)
+        elif connection.vendor == 'sqlite' and sqlite_has_fts5():
+            backend_class = SQLiteSearchBackend
+        elif connection.vendor == 'postgresql':
+            backend_class = PostgresTrigramSearchBackend if postgres_has_trigram() else PostgresSearchBackend
+        else:
+            backend_class = DatabaseSearchBackend
+        _backend = backend_class()
+    return _backend
@@ -0,0 +1,117 @@
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from farmaya.versioning import bump_version
+from users.models import PharmacyProfile
+from users.utils import fields_changed
+from .autocomplete import record_listing_change
+from .canonical import assign_canonical_product, refresh_canonical_stats
+from .facets import PRODUCT_CATALOG_VERSION
+from .models import Category, Product, ProductVariant
+from .search import get_search_backend, vocabulary_words
+
+
+def listed_name(values):
+    """Nombre con el que un producto aparece en el autocompletado, o None si no está listado"""
+    if any(values.get(field, DEFERRED) is DEFERRED for field in ('name', 'is_active', 'stock_quantity')):
+        return None
+    if values['is_active'] and values['stock_quantity'] > 0:
+        return values['name']
+    return None
+
+
+def current_values(product):
+    return {
+        'name': product.name,
+        'is_active': product.is_active,
+        'stock_quantity': product.stock_quantity,
+    }
+
+
+# Campos que forman parte del índice de búsqueda de un producto
+SEARCH_INDEX_FIELDS = {'name', 'brand', 'description', 'category', 'search_name', 'search_brand', 'pharmacy'}
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, created, update_fields=None, **kwargs):
+    """Mantiene el índice de búsqueda y el vocabulario al crear o editar un producto"""
+    if not created and not fields_changed(instance, SEARCH_INDEX_FIELDS, update_fields):
+        return
+    product_id = instance.pk
+    words = vocabulary_words(instance.search_name, instance.search_brand)
+
+    def index():
+        backend = get_search_backend()
+        backend.index_products([product_id])
+        backend.index_terms(words)
+    transaction.on_commit(index)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Quita del índice de búsqueda un producto eliminado"""
+    product_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_products([product_id]))
+
+
+@receiver(post_save, sender=PharmacyProfile)
+def index_pharmacy_products(sender, instance, created, update_fields=None, **kwargs):
+    """El nombre de la farmacia forma parte del índice de sus productos"""
+    if created or not fields_changed(instance, {'pharmacy_name'}, update_fields):
+        return
+    pharmacy_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().index_pharmacy(pharmacy_id))
+
+
+@receiver(post_save, sender=Product)
+def update_autocomplete(sender, instance, created, **kwargs):
+    """Actualiza el autocompletado de forma incremental"""
+    old_name = None if created else listed_name(getattr(instance, '_loaded_values', {}))
+    new_values = current_values(instance)
+    new_name = listed_name(new_values)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **new_values}
+    transaction.on_commit(lambda: record_listing_change(old_name, new_name))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_autocomplete(sender, instance, **kwargs):
+    old_name = listed_name(getattr(instance, '_loaded_values', current_values(instance)))
+    transaction.on_commit(lambda: record_listing_change(old_name, None))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=PharmacyProfile)
+@receiver(post_delete, sender=PharmacyProfile)
+def invalidate_catalog(sender, **kwargs):
+    """Invalida en todos los procesos los datos cacheados derivados del catálogo"""
+    transaction.on_commit(lambda: bump_version(PRODUCT_CATALOG_VERSION))
+
+
+# Campos que afectan la agrupación canónica o los precios de las ofertas
+CANONICAL_FIELDS = {'name', 'brand', 'price', 'is_active', 'stock_quantity'}
+
+
+@receiver(post_save, sender=Product)
+def update_canonical_product(sender, instance, update_fields=None, **kwargs):
+    """Mantiene el producto canónico del producto y su rango de precios"""
+    if update_fields is not None and not CANONICAL_FIELDS & set(update_fields):
+        return
+    assign_canonical_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_canonical_offer(sender, instance, **kwargs):
+    refresh_canonical_stats({instance.canonical_product_id})
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def update_variant_canonical_product(sender, instance, **kwargs):
+    """La concentración puede venir de las variantes cuando el nombre no la indica"""
+    product = Product.objects.filter(pk=instance.product_id).first()
+    if product is not None:
+        assign_canonical_product(product)
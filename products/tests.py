@@ -1,3 +1,224 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from farmaya.pagination import KeysetPaginator
+from users.models import CustomUser, PharmacyProfile
+from .autocomplete import AutocompleteIndex
+from .canonical import canonical_parts
+from .facets import compute_facets
+from .models import Category, Product
+from .results import ProductResultList
+from .search import DatabaseSearchBackend, SQLiteSearchBackend, get_search_backend, sqlite_has_fts5, trigram_similarity
 
-# Create your tests here.
+
+def create_pharmacy(name, latitude='10.48', longitude='-66.90'):
+    user = CustomUser.objects.create_user(username=name.lower().replace(' ', '_'), password='clave', user_type='pharmacy')
+    return PharmacyProfile.objects.create(
+        user=user, pharmacy_name=name, address='Av. Principal', city='Caracas',
+        state='Distrito Capital', zip_code='1010', latitude=Decimal(latitude), longitude=Decimal(longitude),
+    )
+
+
+def create_product(pharmacy, name='Acetaminofén 500mg', price='2.50', stock=5, **fields):
+    return Product.objects.create(
+        pharmacy=pharmacy, name=name, brand=fields.pop('brand', 'Genvén'), price=Decimal(price), stock_quantity=stock, **fields,
+    )
+
+
+class AutocompleteIndexTests(SimpleTestCase):
+
+    def build(self):
+        listings = [('atamel forte', 'Atamel Forte', 2), ('acetaminofen 500mg', 'Acetaminofén 500mg', 1)]
+        return AutocompleteIndex(listings, [('acetaminofen 500mg', 10)], version=1)
+
+    def test_completes_any_word_by_popularity(self):
+        index = self.build()
+
+        self.assertEqual(index.complete('A'), ['Acetaminofén 500mg', 'Atamel Forte'])
+        self.assertEqual(index.complete('fort'), ['Atamel Forte'])
+        self.assertEqual(index.complete('acetaminofén', limit=1), ['Acetaminofén 500mg'])
+
+    def test_changes_are_applied_to_a_copy(self):
+        index = self.build()
+        index.complete('a')
+
+        updated = index.with_changes([('Atamel Forte', None), ('Atamel Forte', None), (None, 'Aspirina')], version=4)
+
+        self.assertEqual(updated.version, 4)
+        self.assertEqual(updated.complete('a'), ['Acetaminofén 500mg', 'Aspirina'])
+        self.assertEqual(index.complete('a'), ['Acetaminofén 500mg', 'Atamel Forte'])
+        self.assertEqual(index.version, 1)
+
+
+class SearchIndexSignalTests(TestCase):
+
+    def setUp(self):
+        self.pharmacy = create_pharmacy('Farmacia Central')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = create_product(self.pharmacy)
+
+    def search(self, query):
+        return get_search_backend().search(query)
+
+    def test_renamed_product_is_reindexed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.product.name = 'Ibuprofeno 400mg'
+            self.product.save()
+            self.assertEqual(self.search('ibuprofeno'), [])
+
+        self.assertTrue(callbacks)
+        self.assertEqual(self.search('ibuprofeno'), [self.product.pk])
+        self.assertEqual(self.search('acetaminofen'), [])
+
+    def test_saves_without_indexed_fields_do_not_reindex(self):
+        product = Product.objects.get(pk=self.product.pk)
+        with mock.patch('products.signals.get_search_backend') as backend:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.stock_quantity = 3
+                product.save()
+                product.save(update_fields=['price'])
+                pharmacy = PharmacyProfile.objects.get(pk=self.pharmacy.pk)
+                pharmacy.rating = Decimal('4.50')
+                pharmacy.save()
+
+        backend.assert_not_called()
+
+    def test_renamed_pharmacy_reindexes_its_products(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pharmacy.pharmacy_name = 'Farmacia Bolívar'
+            self.pharmacy.save(update_fields=['pharmacy_name'])
+
+        self.assertEqual(self.search('bolivar'), [self.product.pk])
+
+
+class SearchBackendTests(TestCase):
+
+    def setUp(self):
+        pharmacy = create_pharmacy('Farmacia Central')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acetaminophen = create_product(pharmacy)
+            self.ibuprofen = create_product(pharmacy, 'Ibuprofeno 400mg', brand='Bayer', description='Alivia el dolor')
+            self.syrup = create_product(pharmacy, 'Jarabe para la tos', brand='Calox', description='Con acetaminofén')
+
+    def test_sqlite_full_text_search(self):
+        if connection.vendor != 'sqlite' or not sqlite_has_fts5():
+            self.skipTest('SQLite sin FTS5')
+        backend = SQLiteSearchBackend()
+
+        # El nombre pesa más que la descripción; sin distinguir acentos ni mayúsculas
+        self.assertEqual(backend.search('ACETAMINOFÉN'), [self.acetaminophen.pk, self.syrup.pk])
+        self.assertEqual(backend.search('ibupro 400'), [self.ibuprofen.pk])
+        self.assertEqual(backend.search('acetaminofen', limit=1), [self.acetaminophen.pk])
+        self.assertEqual(backend.search('acetaminofen', within=Product.objects.filter(brand='Calox')), [self.syrup.pk])
+        self.assertEqual(backend.search('"*'), [])
+
+    def test_database_search_uses_normalized_keys(self):
+        backend = DatabaseSearchBackend()
+
+        self.assertEqual(backend.search('Acetaminofén'), [self.acetaminophen.pk])
+        self.assertEqual(backend.search('BAYER'), [self.ibuprofen.pk])
+        self.assertEqual(len(backend.search('farmacia cen')), 3)
+        self.assertEqual(backend.search('farmacia', within=Product.objects.filter(brand='Calox')), [self.syrup.pk])
+        self.assertEqual(backend.search('  '), [])
+
+
+class SimilarTermsTests(TestCase):
+
+    def setUp(self):
+        pharmacy = create_pharmacy('Farmacia Central')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product(pharmacy)
+            create_product(pharmacy, 'Ibuprofeno 400mg', brand='Bayer')
+        self.backend = get_search_backend()
+
+    def test_similar_terms_come_from_the_vocabulary(self):
+        (similarity, term), *_ = self.backend.similar_terms('acetaminofem')
+
+        self.assertEqual(term, 'acetaminofen')
+        self.assertAlmostEqual(similarity, trigram_similarity('acetaminofem', 'acetaminofen'))
+        self.assertEqual(self.backend.similar_terms('xyzzy'), [])
+
+    def test_suggest_corrects_unknown_words(self):
+        self.assertEqual(self.backend.suggest('ibuprofenno 400'), 'ibuprofeno 400')
+        self.assertEqual(self.backend.suggest('Ibuprofeno'), None)
+
+
+class FacetTests(TestCase):
+
+    def test_counts_for_each_facet(self):
+        central = create_pharmacy('Farmacia Central')
+        norte = create_pharmacy('Farmacia Norte')
+        analgesics = Category.objects.create(name='Analgésicos', slug='analgesicos')
+        create_product(central, 'Aspirina', price='3.00', brand='Bayer', category=analgesics)
+        create_product(norte, 'Aspirina', price='4.00', brand='BAYER', category=analgesics)
+        create_product(norte, 'Amoxicilina', price='12.00', brand='', requires_prescription=True)
+
+        facets = compute_facets(Product.objects.all())
+
+        def counts(facet):
+            return [(entry['label'], entry['count']) for entry in facets[facet]]
+
+        self.assertEqual(counts('category'), [('Analgésicos', 2)])
+        self.assertEqual([entry['count'] for entry in facets['brand']], [2])
+        self.assertEqual(counts('pharmacy'), [('Farmacia Norte', 2), ('Farmacia Central', 1)])
+        self.assertEqual(counts('requires_prescription'), [('Venta libre', 2), ('Requiere receta', 1)])
+        self.assertEqual(counts('price'), [('$0 - $5', 2), ('$10 - $25', 1)])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        pharmacy = create_pharmacy('Farmacia Central')
+        self.products = [create_product(pharmacy, f'Producto {i}', price=f'{i}.00') for i in range(1, 8)]
+
+    def ids(self, page):
+        return [product.pk for product in page]
+
+    def test_next_and_previous_cursors(self):
+        paginator = KeysetPaginator(Product.objects.all(), ['price'], 3)
+
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        last = paginator.page(second.next_cursor)
+
+        self.assertEqual(self.ids(first) + self.ids(second) + self.ids(last), [product.pk for product in self.products])
+        self.assertFalse(first.has_previous())
+        self.assertFalse(last.has_next())
+        self.assertEqual(self.ids(paginator.page(second.previous_cursor)), self.ids(first))
+        self.assertEqual(self.ids(paginator.page(last.previous_cursor)), self.ids(second))
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Product.objects.all(), ['-price'], 3)
+
+        with self.assertRaises(ValueError):
+            paginator.page('no-es-un-cursor')
+        self.assertEqual(self.ids(paginator.get_page('no-es-un-cursor')), [product.pk for product in self.products[:-4:-1]])
+
+    def test_result_list_continues_past_the_cached_ids(self):
+        ids = [product.pk for product in self.products]
+        results = ProductResultList({'ids': ids[:4], 'count': 7}, 3, fallback=lambda: Product.objects.order_by('price'))
+
+        first = results.page()
+        second = results.page(first.next_cursor)
+        last = results.page(second.next_cursor)
+
+        self.assertEqual(self.ids(first), ids[:3])
+        self.assertEqual(self.ids(second), ids[3:4])
+        self.assertEqual(self.ids(last), ids[4:])
+        self.assertFalse(last.has_next())
+        self.assertEqual(self.ids(results.page(second.previous_cursor)), ids[:3])
+        self.assertEqual(self.ids(results.page(last.previous_cursor)), ids[1:4])
+
+
+class CanonicalPartsTests(SimpleTestCase):
+
+    def test_listings_of_the_same_product_share_a_key(self):
+        self.assertEqual(canonical_parts('Acetaminofén 1 g x10', 'Genvén'), ('acetaminofen', 'genven', '1000mg'))
+        self.assertEqual(canonical_parts('ACETAMINOFEN 1000MG 10 tabletas', 'GENVEN'), ('acetaminofen', 'genven', '1000mg'))
+
+    def test_strength_forms(self):
+        self.assertEqual(canonical_parts('Ambroxol Jarabe 30mg/5ml'), ('ambroxol jarabe', '', '30mg/5ml'))
+        self.assertEqual(canonical_parts('Vitamina C 0,5g')[2], '500mg')
+        self.assertEqual(canonical_parts('Loratadina', 'Calox', ['Caja x 10', '10 mg']), ('loratadina', 'calox', '10mg'))
+        self.assertEqual(canonical_parts('Loratadina')[2], '')
@@ -7,11 +7,15 @@ urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('category/<slug:category_slug>/', views.product_list, name='product_list_by_category'),
     path('search/', views.product_search, name='product_search'),
+    path('api/products/', views.product_list_api, name='product_list_api'),
     path('<int:product_id>/', views.product_detail, name='product_detail'),
+    path('compare/<int:canonical_id>/', views.product_compare, name='product_compare'),
+    path('api/compare/<int:canonical_id>/', views.product_compare_api, name='product_compare_api'),
     path('create/', views.product_create, name='product_create'),
     path('<int:product_id>/update/', views.product_update, name='product_update'),
     path('<int:product_id>/delete/', views.product_delete, name='product_delete'),
     path('pharmacy/products/', views.pharmacy_products, name='pharmacy_products'),
     path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('nearby-pharmacies/', views.nearby_pharmacies, name='nearby_pharmacies'),
+    path('pharmacy-clusters/', views.pharmacy_clusters_view, name='pharmacy_clusters'),
 ]
\ No newline at end of file
@@ -1,82 +1,244 @@
+from bisect import bisect_right
+from math import isfinite
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.forms import inlineformset_factory
-from django.db.models import Q, F
-from django.core.paginator import Paginator
+from django.db.models import Q, F, Case, When, Value, FloatField, IntegerField, Max
+from django.db.models.functions import Cast
 from django.http import JsonResponse
-from django.views.decorators.cache import cache_page
 from django.views.decorators.http import require_GET
 from django.conf import settings
-from .models import Product, Category
+from farmaya.cursors import encode_cursor, decode_cursor
+from farmaya.pagination import KeysetPaginator, page_links
+from .models import CanonicalProduct, Product, Category
 from .forms import ProductForm, ProductVariantFormSet, ProductImageFormSet
+from .autocomplete import get_autocomplete_index
+from .canonical import canonical_offers
+from .facets import get_facets, listing_filters
+from .results import ProductResultList, get_product_results
+from .search import get_search_backend
+from users.counters import get_pharmacy_counters
 from users.models import PharmacyProfile
 from users.decorators import pharmacy_required
-from users.utils import calculate_distance
+from users.geo import nearby_pharmacy_distances, nearest_pharmacies, pharmacy_clusters
 
 
 def apply_search_filter(products, request):
     """Aplica filtro de búsqueda de texto a un queryset de productos"""
     search_query = request.GET.get('q', '')
+    suggestion = None
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__icontains=search_query) |
-            Q(pharmacy__pharmacy_name__icontains=search_query)
+        # El índice devuelve ids ordenados por relevancia entre los productos que
+        # ya pasan los filtros del listado (el tope de resultados se aplica
+        # después de filtrar); la consulta final solo filtra por id
+        backend = get_search_backend()
+        ranked_ids = backend.search(search_query, within=products)
+        if not ranked_ids:
+            # Sin resultados: corregir la consulta y buscar en la misma petición
+            suggestion = backend.suggest(search_query)
+            if suggestion:
+                ranked_ids = backend.search(suggestion, within=products)
+        products = products.filter(id__in=ranked_ids)
+        products = products.annotate(
+            search_rank=Case(
+                *[When(id=product_id, then=Value(rank)) for rank, product_id in enumerate(ranked_ids)],
+                default=Value(len(ranked_ids)),
+                output_field=IntegerField(),
+            )
         )
-    return products, search_query
+    return products, search_query, suggestion
 
 
-def apply_location_filter(products, request):
-    """Aplica filtro de ubicación a un queryset de productos"""
-    user_lat = request.GET.get('lat') or request.session.get('user_lat')
-    user_lng = request.GET.get('lng') or request.session.get('user_lng')
-    max_distance = request.GET.get('distance') or request.session.get('max_distance', 10)  # Default 10km
+def annotate_distance(products, distances):
+    """Anota en cada producto la distancia (km) a su farmacia según un mapa {pharmacy_id: distancia}"""
+    whens = [When(pharmacy_id=pharmacy_id, then=Value(distance)) for pharmacy_id, distance in distances.items()]
+    return products.annotate(
+        distance=Case(*whens, default=Value(None), output_field=FloatField())
+    )
 
-    if user_lat and user_lng:
-        try:
-            user_lat = float(user_lat)
-            user_lng = float(user_lng)
-            max_distance = float(max_distance)
 
-            print("-------------")
-            print(f"{max_distance}")
+# Radio por defecto de los listados por ubicación
+DEFAULT_MAX_DISTANCE_KM = 10
+
+
+def _to_float(value):
+    """Número de un parámetro de la petición o NaN si no es válido"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return float('nan')
+
 
-            # Filter pharmacies within the specified distance
-            nearby_pharmacies = []
-            for pharmacy in PharmacyProfile.objects.filter(latitude__isnull=False, longitude__isnull=False):
-                distance = calculate_distance(user_lat, user_lng, pharmacy.latitude, pharmacy.longitude)
-                if distance <= max_distance:
-                    nearby_pharmacies.append(pharmacy.id)
+def valid_radius(radius_km):
+    return isfinite(radius_km) and radius_km > 0
 
-            products = products.filter(pharmacy_id__in=nearby_pharmacies)
-        except (ValueError, TypeError):
-            pass  # Ignore invalid coordinates
+
+def valid_location(latitude, longitude):
+    """True si las coordenadas son números finitos dentro de rango"""
+    return isfinite(latitude) and isfinite(longitude) and -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def get_location(request):
+    """
+    Ubicación del usuario desde la petición o, si no viene, desde la sesión.
+
+    Returns:
+        tuple: (lat, lng, distancia máxima, True si las coordenadas son válidas)
+    """
+    user_lat = request.GET.get('lat') or request.session.get('user_lat')
+    user_lng = request.GET.get('lng') or request.session.get('user_lng')
+    max_distance = _to_float(request.GET.get('distance') or request.session.get('max_distance', DEFAULT_MAX_DISTANCE_KM))
+
+    # NaN, infinitos o radios no positivos romperían el cálculo de celdas: se
+    # ignoran (sin filtro por ubicación) igual que las coordenadas mal escritas
+    has_location = False
+    if user_lat and user_lng and valid_radius(max_distance):
+        lat, lng = _to_float(user_lat), _to_float(user_lng)
+        if valid_location(lat, lng):
+            user_lat, user_lng = lat, lng
+            has_location = True
+    if not has_location:
+        # Los valores inválidos no se guardan en la sesión, que otras vistas
+        # (p. ej. el optimizador del carrito) vuelven a leer
+        user_lat = user_lng = None
+    if not valid_radius(max_distance):
+        max_distance = DEFAULT_MAX_DISTANCE_KM
 
     request.session['user_lat'] = user_lat
     request.session['user_lng'] = user_lng
     request.session['max_distance'] = max_distance
+    return user_lat, user_lng, max_distance, has_location
+
+
+def apply_location_filter(products, request):
+    """Aplica filtro de ubicación a un queryset de productos"""
+    user_lat, user_lng, max_distance, has_location = get_location(request)
+
+    if has_location:
+        # Filter pharmacies within the specified distance
+        nearby_pharmacies = nearby_pharmacy_distances(user_lat, user_lng, max_distance)
+
+        products = products.filter(pharmacy_id__in=nearby_pharmacies)
+        # Distancia de cada farmacia calculada una sola vez, disponible para ordenar
+        products = annotate_distance(products, nearby_pharmacies)
+
     return products, user_lat, user_lng, max_distance
 
 
+# Pesos del puntaje "mejor valor" (menor es mejor)
+VALUE_SCORE_PRICE_WEIGHT = 0.5
+VALUE_SCORE_DISTANCE_WEIGHT = 0.3
+VALUE_SCORE_RATING_WEIGHT = 0.2
+
+
+def annotate_value_score(products, request, has_distance):
+    """
+    Anota un puntaje combinado de precio, distancia y calificación.
+
+    Cada término se normaliza a [0, 1]: el precio contra el máximo del
+    listado, la distancia contra el radio de búsqueda y la calificación
+    contra 5 estrellas. Sin ubicación se ignora el término de distancia.
+    """
+    max_price = products.aggregate(max_price=Max('price'))['max_price'] or 1
+    score = (
+        Cast('price', FloatField()) / Value(float(max_price)) * Value(VALUE_SCORE_PRICE_WEIGHT)
+        + (Value(1.0) - Cast('pharmacy__rating', FloatField()) / Value(5.0)) * Value(VALUE_SCORE_RATING_WEIGHT)
+    )
+    if has_distance:
+        max_distance = float(request.session.get('max_distance') or 1)
+        score += F('distance') / Value(max_distance) * Value(VALUE_SCORE_DISTANCE_WEIGHT)
+    return products.annotate(value_score=score)
+
+
+def get_sort_by(request, has_rank):
+    """Orden pedido, recordado en la sesión"""
+    # En una búsqueda sin orden explícito se ordena por relevancia
+    sort_by = request.GET.get('sort') or ('relevance' if has_rank else request.session.get('sort_by', 'name'))
+    request.session['sort_by'] = sort_by
+    return sort_by
+
+
 def apply_sorting(products, request):
     """Aplica ordenamiento a un queryset de productos"""
-    sort_by = request.GET.get('sort') or request.session.get('sort_by', 'name')
+    has_distance = 'distance' in products.query.annotations
+    has_rank = 'search_rank' in products.query.annotations
+    sort_by = get_sort_by(request, has_rank)
 
     if sort_by == 'price_low':
-        products = products.order_by('price')
+        products = products.order_by('price', 'id')
     elif sort_by == 'price_high':
-        products = products.order_by('-price')
+        products = products.order_by('-price', 'id')
     elif sort_by == 'rating':
-        products = products.order_by('-pharmacy__rating')
+        products = products.order_by('-pharmacy__rating', 'id')
+    elif sort_by == 'nearest' and has_distance:
+        products = products.order_by('distance', 'price', 'id')
+    elif sort_by == 'relevance' and has_rank:
+        products = products.order_by('search_rank', 'id')
+    elif sort_by == 'best_value':
+        products = annotate_value_score(products, request, has_distance).order_by('value_score', 'id')
     else:
-        products = products.order_by('name')
+        products = products.order_by('name', 'id')
 
-    request.session['sort_by'] = sort_by
     return products, sort_by
 
 
+def get_listing(request, products, category=None):
+    """
+    Filtra, ordena y pagina un listado de productos.
+
+    El resultado (ids ordenados, sugerencia y facetas) se cachea por filtros
+    canónicos, así una búsqueda repetida solo consulta los productos de la
+    página mostrada.
+    """
+    search_query = request.GET.get('q', '')
+    user_lat, user_lng, max_distance, has_location = get_location(request)
+    sort_by = get_sort_by(request, has_rank=bool(search_query))
+
+    if has_location:
+        filters = listing_filters(search_query, category, user_lat, user_lng, max_distance)
+    else:
+        filters = listing_filters(search_query, category)
+
+    def build():
+        # Aplicar filtros usando las funciones helper (siempre aplicados juntos);
+        # la ubicación va primero para que la búsqueda ya la tenga en cuenta
+        filtered, *_ = apply_location_filter(products, request)
+        filtered, _, suggestion = apply_search_filter(filtered, request)
+        facets = get_facets(filtered, filters)
+        filtered, _ = apply_sorting(filtered, request)
+        return filtered, suggestion, facets
+
+    results = get_product_results(filters, sort_by, build)
+    distances = nearby_pharmacy_distances(user_lat, user_lng, max_distance) if has_location else None
+    product_results = ProductResultList(results, 12, distances, fallback=lambda: build()[0])  # 12 productos por página
+
+    # Paginación por cursor: enlaces siguiente/anterior en lugar de números de página
+    page_obj = product_results.page(request.GET.get('cursor'))
+
+    return {
+        'page_obj': page_obj,
+        'result_count': len(product_results),
+        **page_links(request, page_obj),
+        'search_query': search_query,
+        'search_suggestion': results['suggestion'],
+        'facets': results['facets'],
+        'sort_by': sort_by,
+        'user_lat': user_lat,
+        'user_lng': user_lng,
+        'max_distance': max_distance,
+    }
+
+
+def annotate_category_counts(categories, facets):
+    """Conteo de resultados por categoría para el menú lateral"""
+    category_counts = {entry['value']: entry['count'] for entry in facets['category']}
+    for cat in categories:
+        cat.facet_count = category_counts.get(cat.id, 0)
+    return categories
+
+
 def get_common_context(request):
     """Retorna variables comunes del contexto para las vistas de productos"""
     is_client = request.user.is_authenticated and request.user.user_type == 'client'
@@ -98,27 +260,14 @@ def product_list(request, category_slug=None):
         category = get_object_or_404(Category, slug=category_slug)
         products = products.filter(category=category)
 
-    # Aplicar filtros usando las funciones helper (siempre aplicados juntos)
-    products, search_query = apply_search_filter(products, request)
-    products, user_lat, user_lng, max_distance = apply_location_filter(products, request)
-    products, sort_by = apply_sorting(products, request)
-
-    # Paginación
-    paginator = Paginator(products, 12)  # 12 productos por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    listing = get_listing(request, products, category)
 
     # Variables calculadas para el template
     context = get_common_context(request)
+    context.update(listing)
     context.update({
         'category': category,
-        'categories': categories,
-        'page_obj': page_obj,
-        'search_query': search_query,
-        'sort_by': sort_by,
-        'user_lat': user_lat,
-        'user_lng': user_lng,
-        'max_distance': max_distance,
+        'categories': annotate_category_counts(categories, listing['facets']),
     })
     return render(request, 'products/product_list.html', context)
 
@@ -129,34 +278,66 @@ def product_search(request):
     categories = Category.objects.all()
     products = Product.objects.filter(is_active=True, stock_quantity__gt=0)
 
-    # Aplicar búsqueda (con query adicional para farmacias) - ahora usa la función helper
-    products, search_query = apply_search_filter(products, request)
-
-    # Aplicar filtros usando las funciones helper (siempre aplicados juntos)
-    products, user_lat, user_lng, max_distance = apply_location_filter(products, request)
-    products, sort_by = apply_sorting(products, request)
-
-    # Paginación
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    listing = get_listing(request, products)
 
     # Variables calculadas para el template
     context = get_common_context(request)
+    context.update(listing)
     context.update({
-        'page_obj': page_obj,
         'query': query,
-        'search_query': search_query,  # Para mantener consistencia con product_list
         'search_results': True,
-        'categories': categories,
-        'sort_by': sort_by,
-        'user_lat': user_lat,
-        'user_lng': user_lng,
-        'max_distance': max_distance,
+        'categories': annotate_category_counts(categories, listing['facets']),
     })
     return render(request, 'products/product_list.html', context)
 
 
+@require_GET
+def product_list_api(request):
+    """
+    API endpoint con el mismo listado que product_list/product_search.
+
+    Acepta los mismos filtros (``q``, ``category``, ``lat``, ``lng``,
+    ``distance``, ``sort``) y se pagina con ``cursor``; la respuesta trae
+    los tokens de la página siguiente y la anterior.
+    """
+    products = Product.objects.filter(is_active=True, stock_quantity__gt=0)
+    category = None
+    if request.GET.get('category'):
+        category = get_object_or_404(Category, slug=request.GET['category'])
+        products = products.filter(category=category)
+
+    listing = get_listing(request, products, category)
+    page = listing['page_obj']
+    results = []
+    for product in page:
+        distance = getattr(product, 'distance', None)
+        results.append({
+            'id': product.id,
+            'name': product.name,
+            'brand': product.brand,
+            'price': float(product.price),
+            'discounted_price': float(product.discounted_price),
+            'requires_prescription': product.requires_prescription,
+            'pharmacy': {
+                'id': product.pharmacy_id,
+                'name': product.pharmacy.pharmacy_name,
+                'rating': float(product.pharmacy.rating) if product.pharmacy.rating else 0,
+            },
+            'category': product.category.name if product.category else None,
+            'distance': round(distance, 2) if distance is not None else None,
+            'url': reverse('products:product_detail', args=[product.id]),
+        })
+
+    return JsonResponse({
+        'results': results,
+        'count': listing['result_count'],
+        'search_suggestion': listing['search_suggestion'],
+        'sort': listing['sort_by'],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
 def product_detail(request, product_id):
     """Vista detallada de un producto"""
     product = get_object_or_404(Product, id=product_id, is_active=True)
@@ -169,10 +350,79 @@ def product_detail(request, product_id):
     context = {
         'product': product,
         'related_products': related_products,
+        'canonical_product': product.canonical_product,
     }
     return render(request, 'products/product_detail.html', context)
 
 
+def get_compare_offers(request, canonical):
+    """Ofertas de un producto canónico según el orden pedido y la ubicación del usuario"""
+    sort_by = request.GET.get('sort', 'price')
+    user_lat, user_lng, max_distance, has_location = get_location(request)
+    if not has_location:
+        user_lat = user_lng = None
+    offers = canonical_offers(canonical, user_lat, user_lng, sort=sort_by)
+    return offers, sort_by, user_lat, user_lng
+
+
+def product_compare(request, canonical_id):
+    """Comparación de precios de un mismo producto entre farmacias"""
+    canonical = get_object_or_404(CanonicalProduct, id=canonical_id)
+    offers, sort_by, user_lat, user_lng = get_compare_offers(request, canonical)
+
+    context = get_common_context(request)
+    context.update({
+        'canonical_product': canonical,
+        'offers': offers,
+        'sort_by': sort_by,
+        'user_lat': user_lat,
+        'user_lng': user_lng,
+    })
+    return render(request, 'products/product_compare.html', context)
+
+
+@require_GET
+def product_compare_api(request, canonical_id):
+    """
+    API endpoint: farmacias que venden un producto canónico.
+
+    ``sort=price`` (por defecto) ordena de la más barata a la más cara;
+    ``sort=nearest`` con ``lat``/``lng`` ordena por distancia.
+    """
+    canonical = get_object_or_404(CanonicalProduct, id=canonical_id)
+    offers, sort_by, user_lat, user_lng = get_compare_offers(request, canonical)
+
+    return JsonResponse({
+        'canonical_product': {
+            'id': canonical.id,
+            'name': canonical.name,
+            'brand': canonical.brand,
+            'strength': canonical.strength,
+            'min_price': float(canonical.min_price) if canonical.min_price is not None else None,
+            'max_price': float(canonical.max_price) if canonical.max_price is not None else None,
+            'offer_count': canonical.offer_count,
+        },
+        'sort': sort_by,
+        'offers': [
+            {
+                'product_id': offer.id,
+                'name': offer.name,
+                'price': float(offer.price),
+                'discounted_price': float(offer.discounted_price),
+                'stock_quantity': offer.stock_quantity,
+                'pharmacy': {
+                    'id': offer.pharmacy_id,
+                    'name': offer.pharmacy.pharmacy_name,
+                    'rating': float(offer.pharmacy.rating) if offer.pharmacy.rating else 0,
+                },
+                'distance': round(offer.distance, 2) if offer.distance is not None else None,
+                'url': reverse('products:product_detail', args=[offer.id]),
+            }
+            for offer in offers
+        ],
+    })
+
+
 @pharmacy_required
 def product_create(request):
     """Vista para crear un nuevo producto (solo farmacias)"""
@@ -271,21 +521,22 @@ def pharmacy_products(request):
     """Vista para que las farmacias vean y gestionen sus productos"""
 
     pharmacy = get_object_or_404(PharmacyProfile, user=request.user)
-    products = Product.objects.filter(pharmacy=pharmacy).order_by('-created_at')
+    products = Product.objects.filter(pharmacy=pharmacy)
 
     # Estadísticas para el template
     active_products = pharmacy.products.filter(is_active=True).count()
-    low_stock_products = pharmacy.products.filter(stock_quantity__lte=10, is_active=True).count()
+    low_stock_products = get_pharmacy_counters(pharmacy.id)['low_stock']
     prescription_products = pharmacy.products.filter(requires_prescription=True, is_active=True).count()
     empty_stock_products = pharmacy.products.filter(stock_quantity=0, is_active=True).count()
 
-    # Paginación
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor sobre (-created_at, -id)
+    paginator = KeysetPaginator(products, ['-created_at'], 12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     context = {
         'page_obj': page_obj,
+        **page_links(request, page_obj),
+        'total_products': pharmacy.products.count(),
         'pharmacy': pharmacy,
         'active_products': active_products,
         'low_stock_products': low_stock_products,
@@ -297,7 +548,6 @@ def pharmacy_products(request):
 
 
 @require_GET
-@cache_page(60 * 15)  # Cache por 15 minutos
 def autocomplete(request):
     """Endpoint API para autocompletado de productos - solo nombres para completar la búsqueda"""
     query = request.GET.get('q', '').strip()
@@ -305,12 +555,8 @@ def autocomplete(request):
     if len(query) < 2:
         return JsonResponse({'results': []})
 
-    # Buscar nombres de productos únicos que coincidan con la query
-    product_names = Product.objects.filter(
-        Q(is_active=True) &
-        Q(stock_quantity__gt=0) &
-        Q(name__icontains=query)
-    ).values_list('name', flat=True).distinct()[:8]  # Máximo 8 resultados únicos
+    # Índice de prefijos en memoria, ordenado por volumen de pedidos (sin consultar la BD)
+    product_names = get_autocomplete_index().complete(query)
 
     results = []
     for name in product_names:
@@ -321,12 +567,24 @@ def autocomplete(request):
     return JsonResponse({'results': results})
 
 
+NEARBY_PHARMACIES_PAGE_SIZE = 100
+NEARBY_PHARMACIES_MAX_PAGE_SIZE = 500
+
+
 @require_GET
 def nearby_pharmacies(request):
-    """API endpoint to get nearby pharmacies for map display"""
+    """
+    API endpoint to get nearby pharmacies for map display.
+
+    Results are sorted by distance. ``k`` limits the search to the k nearest
+    pharmacies (without ``distance`` the radius grows until k are found),
+    ``limit`` sets the page size and ``cursor`` continues from a previous page.
+    """
     user_lat = request.GET.get('lat')
     user_lng = request.GET.get('lng')
-    max_distance = request.GET.get('distance', 10)
+    k = request.GET.get('k')
+    max_distance = request.GET.get('distance', None if k else 10)
+    limit = request.GET.get('limit', NEARBY_PHARMACIES_PAGE_SIZE)
 
     if not user_lat or not user_lng:
         return JsonResponse({'error': 'Latitude and longitude are required'}, status=400)
@@ -334,27 +592,48 @@ def nearby_pharmacies(request):
     try:
         user_lat = float(user_lat)
         user_lng = float(user_lng)
-        max_distance = float(max_distance)
-    except ValueError:
+        max_distance = float(max_distance) if max_distance is not None else None
+        k = int(k) if k else None
+        limit = min(int(limit), NEARBY_PHARMACIES_MAX_PAGE_SIZE)
+        cursor = decode_cursor(request.GET.get('cursor'))
+        if cursor is not None:
+            # El cursor es el par (distancia, id) del último resultado entregado
+            cursor = (float(cursor[0]), int(cursor[1]))
+    except (ValueError, TypeError, IndexError, KeyError):
         return JsonResponse({'error': 'Invalid coordinates or distance'}, status=400)
 
-    # Get nearby pharmacies
+    if not valid_location(user_lat, user_lng) or (max_distance is not None and not valid_radius(max_distance)):
+        return JsonResponse({'error': 'Invalid coordinates or distance'}, status=400)
+    if cursor is not None and not isfinite(cursor[0]):
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    if (k is not None and k < 1) or limit < 1:
+        return JsonResponse({'error': 'k and limit must be positive'}, status=400)
+
+    # Get nearby pharmacies, nearest first
+    ranked = nearest_pharmacies(user_lat, user_lng, k=k, radius_km=max_distance)
+    start = bisect_right(ranked, cursor) if cursor else 0
+    page = ranked[start:start + limit]
+    next_cursor = encode_cursor(page[-1]) if start + limit < len(ranked) else None
+
     nearby_pharmacies = []
-    for pharmacy in PharmacyProfile.objects.filter(latitude__isnull=False, longitude__isnull=False):
-        distance = calculate_distance(user_lat, user_lng, pharmacy.latitude, pharmacy.longitude)
-        if distance <= max_distance:
-            nearby_pharmacies.append({
-                'id': pharmacy.id,
-                'name': pharmacy.pharmacy_name,
-                'address': pharmacy.address,
-                'latitude': float(pharmacy.latitude),
-                'longitude': float(pharmacy.longitude),
-                'rating': float(pharmacy.rating) if pharmacy.rating else 0,
-                'distance': round(distance, 2),
-                'phone': pharmacy.user.phone_number if pharmacy.user.phone_number else '',
-                'opening_time': str(pharmacy.opening_time) if pharmacy.opening_time else '',
-                'closing_time': str(pharmacy.closing_time) if pharmacy.closing_time else '',
-            })
+    pharmacies = PharmacyProfile.objects.select_related('user').in_bulk([pharmacy_id for _, pharmacy_id in page])
+    for distance, pharmacy_id in page:
+        pharmacy = pharmacies.get(pharmacy_id)
+        if pharmacy is None:
+            continue
+        nearby_pharmacies.append({
+            'id': pharmacy.id,
+            'name': pharmacy.pharmacy_name,
+            'address': pharmacy.address,
+            'latitude': float(pharmacy.latitude),
+            'longitude': float(pharmacy.longitude),
+            'rating': float(pharmacy.rating) if pharmacy.rating else 0,
+            'distance': round(distance, 2),
+            'phone': pharmacy.user.phone_number if pharmacy.user.phone_number else '',
+            'opening_time': str(pharmacy.opening_time) if pharmacy.opening_time else '',
+            'closing_time': str(pharmacy.closing_time) if pharmacy.closing_time else '',
+        })
 
     return JsonResponse({
         'pharmacies': nearby_pharmacies,
@@ -362,5 +641,48 @@ def nearby_pharmacies(request):
             'latitude': user_lat,
             'longitude': user_lng
         },
-        'search_radius': max_distance
+        'search_radius': max_distance,
+        'k': k,
+        'next_cursor': next_cursor,
+    })
+
+
+@require_GET
+def pharmacy_clusters_view(request):
+    """
+    API endpoint con farmacias agrupadas para el mapa.
+
+    Recibe ``bbox=min_lng,min_lat,max_lng,max_lat`` (el orden de Mapbox) y
+    ``zoom``; devuelve grupos con cantidad y centroide en lugar de un
+    marcador por farmacia.
+    """
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in request.GET.get('bbox', '').split(','))
+        zoom = float(request.GET.get('zoom', 0))
+    except ValueError:
+        return JsonResponse({'error': 'bbox (min_lng,min_lat,max_lng,max_lat) and zoom are required'}, status=400)
+
+    if not all(isfinite(value) for value in (min_lng, min_lat, max_lng, max_lat, zoom)):
+        return JsonResponse({'error': 'Invalid bbox or zoom'}, status=400)
+
+    # Mapbox puede enviar latitudes más allá de ±85 y longitudes fuera de ±180 al desplazarse
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    zoom = int(zoom)
+    if min_lat > max_lat or not 0 <= zoom <= 24:
+        return JsonResponse({'error': 'Invalid bbox or zoom'}, status=400)
+
+    if max_lng < min_lng:
+        max_lng += 360
+    if max_lng - min_lng >= 360:
+        min_lng, max_lng = -180.0, 180.0
+    else:
+        # Llevar la caja al rango [-180, 180) conservando su ancho
+        shift = (min_lng + 180.0) % 360.0 - 180.0 - min_lng
+        min_lng, max_lng = min_lng + shift, max_lng + shift
+
+    clusters = pharmacy_clusters(min_lat, max_lat, min_lng, max_lng, zoom)
+    return JsonResponse({
+        'clusters': clusters,
+        'zoom': zoom,
+        'total': sum(cluster['count'] for cluster in clusters),
     })
@@ -0,0 +1,100 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+from .models import PharmacyProfile
+
+# Productos activos con esta cantidad o menos se consideran con stock bajo
+LOW_STOCK_THRESHOLD = 10
+
+PHARMACY_COUNTERS_TIMEOUT = 60 * 60
+# Sin datos de farmacia (usuario de tipo farmacia sin perfil)
+NO_PHARMACY = 'none'
+
+
+def identity_key(user_id):
+    return f'pharmacy_identity:{user_id}'
+
+
+def counters_key(pharmacy_id):
+    return f'pharmacy_counters:{pharmacy_id}'
+
+
+def get_pharmacy_identity(user_id):
+    """
+    Id y nombre de la farmacia de un usuario, cacheados.
+
+    Returns:
+        tuple: (pharmacy_id, pharmacy_name), o None si el usuario no tiene farmacia
+    """
+    identity = cache.get(identity_key(user_id))
+    if identity is None:
+        row = PharmacyProfile.objects.filter(user_id=user_id).values_list('id', 'pharmacy_name').first()
+        identity = row or NO_PHARMACY
+        cache.set(identity_key(user_id), identity, PHARMACY_COUNTERS_TIMEOUT)
+    return None if identity == NO_PHARMACY else tuple(identity)
+
+
+def get_pharmacy_counters(pharmacy_id):
+    """
+    Contadores de la farmacia para la barra de navegación y el dashboard,
+    cacheados hasta que cambie una orden o el stock de un producto suyo.
+
+    Returns:
+        dict: 'pending_orders' (órdenes pagadas por confirmar) y 'low_stock' (productos con stock bajo)
+    """
+    from orders.models import Order
+    from products.models import Product
+
+    counters = cache.get(counters_key(pharmacy_id))
+    if counters is None:
+        counters = {
+            'pending_orders': Order.objects.filter(pharmacy_id=pharmacy_id, order_status='paid').count(),
+            'low_stock': Product.objects.filter(
+                pharmacy_id=pharmacy_id, stock_quantity__lte=LOW_STOCK_THRESHOLD, is_active=True,
+            ).count(),
+        }
+        cache.set(counters_key(pharmacy_id), counters, PHARMACY_COUNTERS_TIMEOUT)
+    return counters
+
+
+def invalidate_pharmacy_counters(pharmacy_ids):
+    """Descarta los contadores de las farmacias dadas (tras el commit de la transacción actual)"""
+    keys = [counters_key(pharmacy_id) for pharmacy_id in set(pharmacy_ids) if pharmacy_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_pharmacy_identity(user_id):
+    transaction.on_commit(lambda: cache.delete(identity_key(user_id)))
+
+
+class PharmacyNavCounters:
+    """
+    Datos de la farmacia del usuario para las plantillas, resueltos solo
+    cuando una plantilla los lee y a lo sumo una vez por petición.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    @cached_property
+    def identity(self):
+        return get_pharmacy_identity(self.user_id)
+
+    @cached_property
+    def counters(self):
+        if self.identity is None:
+            return {'pending_orders': 0, 'low_stock': 0}
+        return get_pharmacy_counters(self.identity[0])
+
+    def is_pharmacy(self):
+        return self.identity is not None
+
+    def pharmacy_name(self):
+        return self.identity[1] if self.identity else ''
+
+    def pending_orders_count(self):
+        return self.counters['pending_orders']
+
+    def low_stock_count(self):
+        return self.counters['low_stock']
@@ -0,0 +1,260 @@
+import threading
+from array import array
+from bisect import bisect_left
+from django.core.cache import cache
+from farmaya.versioning import get_version
+from .models import PharmacyProfile
+from .utils import (
+    GEOHASH_PRECISION, bounding_box, calculate_distances,
+    geohash_cells_around, geohash_cells_in_box, geohash_precision_for_box, np,
+)
+
+PHARMACY_GEO_VERSION = 'pharmacy_geo'
+
+# Radio inicial y máximo (media circunferencia terrestre) de la búsqueda de k vecinos
+NEAREST_INITIAL_RADIUS_KM = 2
+NEAREST_MAX_RADIUS_KM = 20038
+
+# Agrupación para el mapa: cada tile (celda geohash gruesa) se cachea por separado
+CLUSTER_TILE_LEVELS = 2
+CLUSTER_MAX_TILES = 64
+# Celdas de agrupación visibles como máximo en una caja
+CLUSTER_MAX_CELLS = 4096
+CLUSTER_CACHE_TIMEOUT = 60 * 60
+
+
+class PharmacySnapshot:
+    """
+    Instantánea en memoria de las farmacias geolocalizadas.
+
+    Guarda ids y coordenadas en arreglos paralelos ordenados por geohash,
+    de modo que las celdas que cubren un radio se resuelven con búsquedas
+    binarias sin consultar la base de datos.
+    """
+
+    def __init__(self, rows, version):
+        rows = sorted(rows, key=lambda row: row[3])
+        self.version = version
+        self.geohashes = [row[3] for row in rows]
+        self.ids = array('q', (row[0] for row in rows))
+        self.latitudes = array('d', (float(row[1]) for row in rows))
+        self.longitudes = array('d', (float(row[2]) for row in rows))
+        if np is not None:
+            # Vistas sin copia sobre los mismos buffers
+            self.ids = np.frombuffer(self.ids, dtype=np.int64)
+            self.latitudes = np.frombuffer(self.latitudes, dtype=np.float64)
+            self.longitudes = np.frombuffer(self.longitudes, dtype=np.float64)
+
+    @classmethod
+    def build(cls, version):
+        rows = PharmacyProfile.objects.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).values_list('id', 'latitude', 'longitude', 'geohash')
+        return cls(rows, version)
+
+    def __len__(self):
+        return len(self.geohashes)
+
+    def prefix_range(self, prefix):
+        """Rango [inicio, fin) de posiciones cuyo geohash empieza por el prefijo"""
+        return bisect_left(self.geohashes, prefix), bisect_left(self.geohashes, prefix + '~')
+
+    def candidate_indexes(self, latitude, longitude, radius_km):
+        """Posiciones de las farmacias en las celdas que cubren el radio indicado"""
+        indexes = []
+        for prefix in geohash_cells_around(latitude, longitude, radius_km):
+            start, end = self.prefix_range(prefix)
+            indexes.extend(range(start, end))
+        return indexes
+
+    def distances(self, latitude, longitude, radius_km):
+        """
+        Distancias a las farmacias dentro del radio indicado.
+
+        Returns:
+            dict: {pharmacy_id: distancia en km}
+        """
+        indexes = self.candidate_indexes(latitude, longitude, radius_km)
+        if not indexes:
+            return {}
+
+        # Descartar con la caja envolvente antes del cálculo exacto; la
+        # longitud se compara de forma modular por si la caja cruza ±180°
+        min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+        lng_span = max_lng - min_lng
+
+        if np is not None:
+            indexes = np.asarray(indexes, dtype=np.intp)
+            lats = self.latitudes[indexes]
+            lngs = self.longitudes[indexes]
+            in_box = (lats >= min_lat) & (lats <= max_lat) & ((lngs - min_lng) % 360 <= lng_span)
+            indexes, lats, lngs = indexes[in_box], lats[in_box], lngs[in_box]
+            distances = calculate_distances(latitude, longitude, lats, lngs)
+            inside = distances <= radius_km
+            return dict(zip(self.ids[indexes[inside]].tolist(), distances[inside].tolist()))
+
+        indexes = [
+            i for i in indexes
+            if min_lat <= self.latitudes[i] <= max_lat and (self.longitudes[i] - min_lng) % 360 <= lng_span
+        ]
+        distances = calculate_distances(
+            latitude, longitude,
+            [self.latitudes[i] for i in indexes],
+            [self.longitudes[i] for i in indexes],
+        )
+        return {
+            self.ids[i]: distance
+            for i, distance in zip(indexes, distances)
+            if distance <= radius_km
+        }
+
+    def nearest(self, latitude, longitude, k=None, radius_km=None):
+        """
+        Farmacias ordenadas por distancia.
+
+        Con ``k`` se devuelven solo las k más cercanas; si además no se indica
+        radio, la búsqueda se amplía duplicando el radio hasta reunir k
+        farmacias, así solo se evalúan las celdas necesarias.
+
+        Returns:
+            list: Tuplas (distancia en km, pharmacy_id) en orden ascendente
+        """
+        if radius_km is None and k is None:
+            radius_km = NEAREST_MAX_RADIUS_KM
+
+        if radius_km is not None:
+            distances = self.distances(latitude, longitude, radius_km)
+        else:
+            radius = NEAREST_INITIAL_RADIUS_KM
+            while True:
+                distances = self.distances(latitude, longitude, radius)
+                if len(distances) >= k or len(distances) == len(self) or radius >= NEAREST_MAX_RADIUS_KM:
+                    break
+                radius *= 2
+
+        ranked = sorted((distance, pharmacy_id) for pharmacy_id, distance in distances.items())
+        return ranked[:k] if k is not None else ranked
+
+    def clusters(self, tile, precision):
+        """
+        Agrupa las farmacias de un tile en celdas geohash de la precisión dada.
+
+        Como los arreglos están ordenados por geohash, cada celda es un tramo
+        contiguo y basta un recorrido lineal del rango del tile.
+
+        Returns:
+            list: Diccionarios con celda, cantidad y centroide de cada grupo
+        """
+        start, end = self.prefix_range(tile)
+        clusters = []
+        i = start
+        while i < end:
+            cell = self.geohashes[i][:precision]
+            j = i
+            lat_sum = lng_sum = 0.0
+            while j < end and self.geohashes[j].startswith(cell):
+                lat_sum += float(self.latitudes[j])
+                lng_sum += float(self.longitudes[j])
+                j += 1
+            count = j - i
+            cluster = {
+                'geohash': cell,
+                'count': count,
+                'latitude': lat_sum / count,
+                'longitude': lng_sum / count,
+            }
+            if count == 1:
+                cluster['pharmacy_id'] = int(self.ids[i])
+            clusters.append(cluster)
+            i = j
+        return clusters
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_pharmacy_snapshot():
+    """
+    Instantánea vigente de coordenadas de farmacias para este proceso.
+
+    Se reconstruye de forma perezosa cuando la versión compartida en cache
+    cambia (ver users.signals), así todos los procesos detectan los cambios.
+    """
+    global _snapshot
+    version = get_version(PHARMACY_GEO_VERSION)
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _snapshot = PharmacySnapshot.build(version)
+    return snapshot
+
+
+def nearby_pharmacy_distances(latitude, longitude, radius_km):
+    """
+    Distancias a las farmacias dentro del radio indicado.
+
+    Returns:
+        dict: {pharmacy_id: distancia en km}
+    """
+    return get_pharmacy_snapshot().distances(latitude, longitude, radius_km)
+
+
+def nearest_pharmacies(latitude, longitude, k=None, radius_km=None):
+    """
+    Farmacias más cercanas a un punto, ordenadas por distancia.
+
+    Returns:
+        list: Tuplas (distancia en km, pharmacy_id) en orden ascendente
+    """
+    return get_pharmacy_snapshot().nearest(latitude, longitude, k=k, radius_km=radius_km)
+
+
+def cluster_precision(zoom):
+    """Precisión geohash de los grupos para un nivel de zoom del mapa (~8 grupos por tile del mapa)"""
+    return max(1, min(GEOHASH_PRECISION, round((zoom + 3) * 2 / 5)))
+
+
+def pharmacy_clusters(min_lat, max_lat, min_lng, max_lng, zoom):
+    """
+    Grupos de farmacias visibles en una caja para un nivel de zoom.
+
+    Los grupos se calculan por tile y se guardan en cache con la versión de
+    la instantánea en la clave, de modo que cualquier cambio de coordenadas
+    los invalida sin borrado explícito.
+
+    Returns:
+        list: Diccionarios con celda, cantidad y centroide de cada grupo
+    """
+    snapshot = get_pharmacy_snapshot()
+    # Las precisiones salen del tamaño de la caja antes de enumerar celdas: un
+    # zoom que no corresponde a la caja (p. ej. una caja de un país a zoom 19)
+    # no puede generar millones de celdas
+    precision = min(
+        cluster_precision(zoom),
+        geohash_precision_for_box(min_lat, max_lat, min_lng, max_lng, CLUSTER_MAX_CELLS),
+    )
+
+    # Tiles algo más gruesos que los grupos; si la caja es muy grande se
+    # engrosan más para acotar la cantidad de claves de cache
+    tile_precision = geohash_precision_for_box(
+        min_lat, max_lat, min_lng, max_lng, CLUSTER_MAX_TILES, max_precision=max(1, precision - CLUSTER_TILE_LEVELS),
+    )
+    tiles = geohash_cells_in_box(min_lat, max_lat, min_lng, max_lng, tile_precision)
+
+    keys = {f'pharmacy_clusters:{snapshot.version}:{precision}:{tile}': tile for tile in tiles}
+    cached = cache.get_many(keys)
+    missing = {key: snapshot.clusters(tile, precision) for key, tile in keys.items() if key not in cached}
+    if missing:
+        cache.set_many(missing, CLUSTER_CACHE_TIMEOUT)
+        cached.update(missing)
+
+    lng_span = max_lng - min_lng
+    return [
+        cluster
+        for key in keys
+        for cluster in cached[key]
+        if min_lat <= cluster['latitude'] <= max_lat and (cluster['longitude'] - min_lng) % 360 <= lng_span
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:03
+
+from django.db import migrations, models
+
+# Copia congelada de users.utils.encode_geohash: la migración no debe cambiar
+# de comportamiento si esa función cambia
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=9):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True  # Los bits pares codifican longitud
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(geohash)
+
+
+def populate_geohash(apps, schema_editor):
+    PharmacyProfile = apps.get_model('users', 'PharmacyProfile')
+    pharmacies = PharmacyProfile.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for pharmacy in pharmacies.iterator():
+        pharmacy.geohash = encode_geohash(pharmacy.latitude, pharmacy.longitude)
+        pharmacy.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_clientprofile_latitude_clientprofile_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pharmacyprofile',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, verbose_name='Geohash'),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:09
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize_search_text(text):
+    # Copia congelada de users.utils.normalize_search_text: la migración no
+    # debe cambiar de comportamiento si esa función cambia
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.lower().split())
+
+
+def populate_search_name(apps, schema_editor):
+    PharmacyProfile = apps.get_model('users', 'PharmacyProfile')
+    for pharmacy in PharmacyProfile.objects.only('id', 'pharmacy_name').iterator():
+        pharmacy.search_name = normalize_search_text(pharmacy.pharmacy_name)
+        pharmacy.save(update_fields=['search_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_pharmacyprofile_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pharmacyprofile',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200, verbose_name='Nombre Normalizado'),
+        ),
+        migrations.RunPython(populate_search_name, migrations.RunPython.noop),
+    ]
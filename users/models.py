@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
+from .utils import encode_geohash, normalize_search_text, remember_saved_values
 
 
 class CustomUser(AbstractUser):
@@ -60,6 +61,7 @@ class ClientProfile(models.Model):
 class PharmacyProfile(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='pharmacy_profile')
     pharmacy_name = models.CharField(max_length=200, verbose_name='Nombre de la Farmacia')
+    search_name = models.CharField(max_length=200, blank=True, db_index=True, editable=False, verbose_name='Nombre Normalizado')
     description = models.TextField(blank=True, verbose_name='Descripción')
     address = models.TextField(verbose_name='Dirección')
     city = models.CharField(max_length=100, verbose_name='Ciudad')
@@ -68,6 +70,7 @@ class PharmacyProfile(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name='Latitud')
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name='Longitud')
     google_maps_link = models.URLField(blank=True, verbose_name='Enlace de Google Maps')
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False, verbose_name='Geohash')
 
     # Verification and reputation
     is_verified = models.BooleanField(default=False, verbose_name='Verificada')
@@ -90,6 +93,32 @@ class PharmacyProfile(models.Model):
     def __str__(self):
         return self.pharmacy_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores tal como se cargaron, para detectar cambios al guardar
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Mantener la celda geohash sincronizada con las coordenadas
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        self.search_name = normalize_search_text(self.pharmacy_name)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'latitude', 'longitude'} & update_fields:
+                update_fields.add('geohash')
+            if 'pharmacy_name' in update_fields:
+                update_fields.add('search_name')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        remember_saved_values(self, kwargs.get('update_fields'))
+
     def update_rating(self):
         """Update pharmacy rating based on reviews"""
         from orders.models import Review
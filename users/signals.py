@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from farmaya.versioning import bump_version
+from .counters import invalidate_pharmacy_counters, invalidate_pharmacy_identity
+from .geo import PHARMACY_GEO_VERSION
+from .models import PharmacyProfile
+from .utils import fields_changed
+
+
+# Campos que guarda la instantánea de coordenadas
+PHARMACY_GEO_FIELDS = {'latitude', 'longitude', 'geohash'}
+
+
+@receiver(post_save, sender=PharmacyProfile)
+@receiver(post_delete, sender=PharmacyProfile)
+def invalidate_pharmacy_geo(sender, instance, created=False, update_fields=None, signal=None, **kwargs):
+    """Invalida la instantánea de coordenadas de farmacias en todos los procesos"""
+    # Una reseña o una edición del perfil no mueve la farmacia
+    if signal is post_save and not created and not fields_changed(instance, PHARMACY_GEO_FIELDS, update_fields):
+        return
+    # Tras el commit, para que ningún proceso reconstruya con datos sin confirmar
+    transaction.on_commit(lambda: bump_version(PHARMACY_GEO_VERSION))
+
+
+@receiver(post_save, sender=PharmacyProfile)
+@receiver(post_delete, sender=PharmacyProfile)
+def invalidate_pharmacy_nav_identity(sender, instance, **kwargs):
+    invalidate_pharmacy_identity(instance.user_id)
+
+
+@receiver(post_save, sender='orders.Order')
+@receiver(post_delete, sender='orders.Order')
+def invalidate_order_counters(sender, instance, **kwargs):
+    """Las órdenes pendientes de confirmación cambian con el estado de cada orden"""
+    invalidate_pharmacy_counters([instance.pharmacy_id])
+
+
+@receiver(post_save, sender='products.Product')
+@receiver(post_delete, sender='products.Product')
+def invalidate_stock_counters(sender, instance, update_fields=None, **kwargs):
+    """El conteo de stock bajo solo depende del stock y de si el producto está activo"""
+    if update_fields is not None and not {'stock_quantity', 'is_active'} & set(update_fields):
+        return
+    invalidate_pharmacy_counters([instance.pharmacy_id])
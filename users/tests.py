@@ -1,3 +1,146 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from farmaya.versioning import get_version
+from . import geo, utils
+from .geo import PHARMACY_GEO_VERSION, PharmacySnapshot
+from .models import CustomUser, PharmacyProfile
+from .utils import (
+    GEOHASH_MAX_CELLS, calculate_distance, encode_geohash, geohash_cell_count,
+    geohash_cells_in_box, geohash_precision_for_box,
+)
 
-# Create your tests here.
+
+def create_pharmacy(name, latitude='10.48', longitude='-66.90'):
+    user = CustomUser.objects.create_user(username=name.lower().replace(' ', '_'), password='clave', user_type='pharmacy')
+    return PharmacyProfile.objects.create(
+        user=user, pharmacy_name=name, address='Av. Principal', city='Caracas',
+        state='Distrito Capital', zip_code='1010', latitude=Decimal(latitude), longitude=Decimal(longitude),
+    )
+
+
+class PharmacyGeoInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def save_changes_version(self, pharmacy, **kwargs):
+        version = get_version(PHARMACY_GEO_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            pharmacy.save(**kwargs)
+        return get_version(PHARMACY_GEO_VERSION) != version
+
+    def test_create_and_delete_invalidate(self):
+        version = get_version(PHARMACY_GEO_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            pharmacy = create_pharmacy('Farmacia Central')
+        self.assertNotEqual(get_version(PHARMACY_GEO_VERSION), version)
+
+        version = get_version(PHARMACY_GEO_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            pharmacy.delete()
+        self.assertNotEqual(get_version(PHARMACY_GEO_VERSION), version)
+
+    def test_only_coordinate_changes_invalidate(self):
+        pharmacy = PharmacyProfile.objects.get(pk=create_pharmacy('Farmacia Central').pk)
+
+        pharmacy.rating = Decimal('4.50')
+        pharmacy.total_reviews = 3
+        self.assertFalse(self.save_changes_version(pharmacy))
+        self.assertFalse(self.save_changes_version(pharmacy, update_fields=['rating']))
+
+        pharmacy.latitude = Decimal('10.50')
+        self.assertTrue(self.save_changes_version(pharmacy))
+        self.assertFalse(self.save_changes_version(pharmacy))
+
+        pharmacy.longitude = Decimal('-66.80')
+        self.assertTrue(self.save_changes_version(pharmacy, update_fields=['longitude']))
+
+
+class GeohashBoxTests(SimpleTestCase):
+
+    def test_box_across_the_antimeridian_covers_both_sides(self):
+        cells = geohash_cells_in_box(-1, 1, 179, 181, 3)
+
+        self.assertIn(encode_geohash(0, 179.5, 3), cells)
+        self.assertIn(encode_geohash(0, -179.5, 3), cells)
+        self.assertNotIn(encode_geohash(0, 0, 3), cells)
+
+    def test_latitudes_are_clamped_at_the_poles(self):
+        self.assertEqual(geohash_cells_in_box(-100, 100, 0, 1, 1), geohash_cells_in_box(-90, 90, 0, 1, 1))
+
+    def test_boxes_wider_than_the_world_cover_every_longitude(self):
+        self.assertEqual(geohash_cells_in_box(-1, 1, -500, 500, 1), geohash_cells_in_box(-1, 1, -180, 180, 1))
+
+    def test_boxes_needing_too_many_cells_are_rejected(self):
+        self.assertGreater(geohash_cell_count(-90, 90, -180, 180, 5), GEOHASH_MAX_CELLS)
+        with self.assertRaises(ValueError):
+            geohash_cells_in_box(-90, 90, -180, 180, 5)
+        with self.assertRaises(ValueError):
+            geohash_cells_in_box(float('nan'), 1, 0, 1, 1)
+
+        precision = geohash_precision_for_box(-90, 90, -180, 180, GEOHASH_MAX_CELLS)
+        self.assertLessEqual(len(geohash_cells_in_box(-90, 90, -180, 180, precision)), GEOHASH_MAX_CELLS)
+
+
+class PharmacySnapshotTests(SimpleTestCase):
+    # Farmacias en Caracas, en Maracaibo y a ambos lados del antimeridiano
+    POINTS = [(1, 10.48, -66.90), (2, 10.50, -66.85), (3, 10.65, -71.64), (4, 0.0, 179.99), (5, 0.0, -179.99)]
+
+    def snapshot(self):
+        return PharmacySnapshot([(id, lat, lng, encode_geohash(lat, lng)) for id, lat, lng in self.POINTS], version=1)
+
+    def test_distances_within_radius(self):
+        distances = self.snapshot().distances(10.48, -66.90, 10)
+
+        self.assertEqual(set(distances), {1, 2})
+        self.assertAlmostEqual(distances[1], 0, places=6)
+        self.assertAlmostEqual(distances[2], calculate_distance(10.48, -66.90, 10.50, -66.85), places=6)
+
+    def test_distances_across_the_antimeridian(self):
+        self.assertEqual(set(self.snapshot().distances(0.0, 179.995, 5)), {4, 5})
+
+    def test_nearest_widens_the_search_until_k_are_found(self):
+        snapshot = self.snapshot()
+
+        self.assertEqual([id for _, id in snapshot.nearest(10.48, -66.90, k=3)], [1, 2, 3])
+        self.assertEqual([id for _, id in snapshot.nearest(10.48, -66.90, radius_km=10)], [1, 2])
+        self.assertEqual(len(snapshot.nearest(10.48, -66.90)), 5)
+
+    def test_clusters_group_cells_of_a_tile(self):
+        snapshot = self.snapshot()
+
+        (cluster,) = snapshot.clusters('d9', 3)
+        self.assertEqual((cluster['geohash'], cluster['count']), ('d9b', 2))
+        self.assertAlmostEqual(cluster['latitude'], 10.49)
+        self.assertAlmostEqual(cluster['longitude'], -66.875)
+        self.assertEqual(snapshot.clusters('d3', 3), [
+            {'geohash': 'd3v', 'count': 1, 'latitude': 10.65, 'longitude': -71.64, 'pharmacy_id': 3},
+        ])
+
+    def test_numpy_and_pure_python_give_the_same_results(self):
+        if utils.np is None:
+            self.skipTest('NumPy no está instalado')
+        queries = [(10.48, -66.90), (0.0, 179.995), (10.6, -70.0)]
+
+        def results():
+            snapshot = self.snapshot()
+            return [
+                (sorted(snapshot.distances(lat, lng, 500).items()), snapshot.nearest(lat, lng, k=2), snapshot.clusters('', 2))
+                for lat, lng in queries
+            ]
+
+        with_numpy = results()
+        with mock.patch.object(utils, 'np', None), mock.patch.object(geo, 'np', None):
+            pure_python = results()
+
+        for (numpy_distances, numpy_nearest, numpy_clusters), (distances, nearest, clusters) in zip(with_numpy, pure_python):
+            self.assertEqual([id for id, _ in numpy_distances], [id for id, _ in distances])
+            for (_, expected), (_, distance) in zip(numpy_distances, distances):
+                self.assertAlmostEqual(expected, distance, places=6)
+            self.assertEqual([id for _, id in numpy_nearest], [id for _, id in nearest])
+            self.assertEqual(
+                [(cluster['geohash'], cluster['count']) for cluster in numpy_clusters],
+                [(cluster['geohash'], cluster['count']) for cluster in clusters],
+            )
@@ -1,5 +1,19 @@
 import re
-from math import radians, sin, cos, sqrt, atan2
+import unicodedata
+from math import radians, sin, cos, sqrt, atan2, isfinite
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional; se usa la versión en Python puro
+    np = None
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.195
+# Tope de celdas que se enumeran para una caja
+GEOHASH_MAX_CELLS = 4096
+
 
 def extract_coords(url):
     """
@@ -20,6 +34,67 @@ def extract_coords(url):
     else:
         return None
 
+
+def normalize_search_text(text):
+    """
+    Normalize text for search: lowercase, without diacritics and with
+    collapsed whitespace ("  Acetaminofén  500mg" -> "acetaminofen 500mg").
+
+    Args:
+        text (str): Text to normalize
+
+    Returns:
+        str: Normalized text
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.lower().split())
+
+
+def fields_changed(instance, field_names, update_fields=None):
+    """
+    Whether saving a model instance may have changed any of the given fields.
+
+    Uses update_fields when the save passed them and otherwise compares with
+    the values loaded from the database (instance._loaded_values, see the
+    model's from_db). An instance without loaded values counts as changed.
+
+    Args:
+        instance: Model instance being saved
+        field_names: Names of the fields of interest
+        update_fields: update_fields of the save, or None
+
+    Returns:
+        bool: False only when none of the fields can have changed
+    """
+    attnames = {instance._meta.get_field(name).attname for name in field_names}
+    if update_fields is not None:
+        attnames &= {instance._meta.get_field(name).attname for name in update_fields}
+        if not attnames:
+            return False
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return True
+    for attname in attnames:
+        # Un campo diferido que no se asignó no está en __dict__ y no se guardó
+        if attname in instance.__dict__ and (attname not in loaded or loaded[attname] != instance.__dict__[attname]):
+            return True
+    return False
+
+
+def remember_saved_values(instance, update_fields=None):
+    """Record the saved values as the new baseline for fields_changed"""
+    saved = None if update_fields is None else {instance._meta.get_field(name).attname for name in update_fields}
+    instance._loaded_values = {
+        **getattr(instance, '_loaded_values', {}),
+        **{
+            field.attname: instance.__dict__[field.attname]
+            for field in instance._meta.concrete_fields
+            if field.attname in instance.__dict__ and (saved is None or field.attname in saved)
+        },
+    }
+
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Calculate the great circle distance between two points
@@ -41,4 +116,201 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     c = 2 * atan2(sqrt(a), sqrt(1-a))
     r = 6371  # Radius of earth in kilometers
-    return r * c
\ No newline at end of file
+    return r * c
+
+
+def calculate_distances(lat, lon, latitudes, longitudes):
+    """
+    Calculate the great circle distance from one point to many points.
+
+    Uses NumPy when it is installed and falls back to a pure Python loop
+    otherwise, so callers can always pass whole candidate sets at once.
+
+    Args:
+        lat, lon: Latitude and longitude of the origin
+        latitudes, longitudes: Sequences with the coordinates of the destinations
+
+    Returns:
+        Sequence of distances in kilometers, in the same order as the destinations
+    """
+    if np is not None:
+        lat1 = np.radians(float(lat))
+        lon1 = np.radians(float(lon))
+        lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+        lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    lat1 = radians(float(lat))
+    lon1 = radians(float(lon))
+    cos_lat1 = cos(lat1)
+    distances = []
+    for lat2, lon2 in zip(latitudes, longitudes):
+        lat2 = radians(float(lat2))
+        lon2 = radians(float(lon2))
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+        distances.append(EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a)))
+    return distances
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encode a point as a geohash string.
+
+    Args:
+        latitude, longitude: Coordinates in decimal degrees
+        precision (int): Number of characters of the resulting hash
+
+    Returns:
+        str: Geohash of the cell containing the point
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True  # Los bits pares codifican longitud
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(geohash)
+
+
+def geohash_cell_size(precision):
+    """
+    Size of a geohash cell at the given precision.
+
+    Returns:
+        tuple: (height, width) in degrees of latitude and longitude
+    """
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Bounding box of a circle around a point.
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lng, max_lng) in decimal degrees
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    delta_lat = radius_km / KM_PER_DEGREE
+    # Cerca de los polos el coseno tiende a cero; se acota para no dividir entre cero
+    delta_lng = radius_km / (KM_PER_DEGREE * max(cos(radians(latitude)), 0.01))
+    return (
+        max(latitude - delta_lat, -90.0),
+        min(latitude + delta_lat, 90.0),
+        longitude - delta_lng,
+        longitude + delta_lng,
+    )
+
+
+def geohash_cells_around(latitude, longitude, radius_km, max_cells=9):
+    """
+    Geohash prefixes whose cells cover a circle around a point.
+
+    The finest precision whose covering needs at most ``max_cells`` cells
+    is chosen, so callers get a handful of prefixes to look up regardless
+    of the radius.
+
+    Args:
+        latitude, longitude: Center of the circle in decimal degrees
+        radius_km (float): Radius of the circle in kilometers
+        max_cells (int): Upper bound on the number of prefixes returned
+
+    Returns:
+        list: Sorted geohash prefixes, all of the same length
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    precision = geohash_precision_for_box(min_lat, max_lat, min_lng, max_lng, max_cells)
+    return geohash_cells_in_box(min_lat, max_lat, min_lng, max_lng, precision)
+
+
+def geohash_cell_count(min_lat, max_lat, min_lng, max_lng, precision):
+    """
+    Upper bound of the number of cells of the given precision that cover a
+    bounding box, computed without listing them.
+    """
+    height, width = geohash_cell_size(precision)
+    rows = int((min(max_lat, 90.0) - max(min_lat, -90.0)) / height) + 2
+    cols = int(min(max_lng - min_lng, 360.0) / width) + 2
+    return rows * cols
+
+
+def geohash_precision_for_box(min_lat, max_lat, min_lng, max_lng, max_cells, max_precision=GEOHASH_PRECISION):
+    """
+    Finest precision (up to ``max_precision``) whose covering of a bounding
+    box needs at most ``max_cells`` cells; 1 if none does.
+    """
+    for precision in range(max_precision, 0, -1):
+        if geohash_cell_count(min_lat, max_lat, min_lng, max_lng, precision) <= max_cells:
+            return precision
+    return 1
+
+
+def geohash_cells_in_box(min_lat, max_lat, min_lng, max_lng, precision):
+    """
+    Geohash cells of the given precision that cover a bounding box.
+
+    Latitudes are clamped to ±90 and a box 360° wide or more covers every
+    longitude. Callers choose the precision with geohash_precision_for_box;
+    a box that would need more than GEOHASH_MAX_CELLS cells is rejected
+    instead of being enumerated.
+
+    Raises:
+        ValueError: If a coordinate is not finite or the box needs too many cells
+
+    Returns:
+        list: Sorted geohash strings
+    """
+    if not all(isfinite(value) for value in (min_lat, max_lat, min_lng, max_lng)):
+        raise ValueError('Bounding box coordinates must be finite')
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    if max_lng - min_lng >= 360:
+        min_lng, max_lng = -180.0, 180.0
+    if geohash_cell_count(min_lat, max_lat, min_lng, max_lng, precision) > GEOHASH_MAX_CELLS:
+        raise ValueError(f'Bounding box needs more than {GEOHASH_MAX_CELLS} cells at precision {precision}')
+
+    height, width = geohash_cell_size(precision)
+    cells = set()
+    lat = min_lat
+    while True:
+        lng = min_lng
+        while True:
+            # Normalizar longitud al rango [-180, 180)
+            cells.add(encode_geohash(lat, (lng + 180.0) % 360.0 - 180.0, precision))
+            if lng >= max_lng:
+                break
+            lng = min(lng + width, max_lng)
+        if lat >= max_lat:
+            break
+        lat = min(lat + height, max_lat)
+
+    return sorted(cells)
@@ -4,6 +4,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from .models import CustomUser, PharmacyProfile, ClientProfile
+from .counters import get_pharmacy_counters
 from .forms import UserRegistrationForm, PharmacyProfileForm, ClientProfileForm
 from .decorators import pharmacy_required
 
@@ -111,11 +112,10 @@ def pharmacy_dashboard(request):
         created_at__date=today
     ).count()
 
-    # Órdenes pendientes de confirmación
-    pending_orders = Order.objects.filter(
-        pharmacy=pharmacy,
-        order_status='paid'
-    ).count()
+    # Órdenes pendientes de confirmación y productos con stock bajo (los mismos
+    # contadores cacheados de la barra de navegación)
+    counters = get_pharmacy_counters(pharmacy.id)
+    pending_orders = counters['pending_orders']
 
     # Órdenes en preparación
     preparing_orders = Order.objects.filter(
@@ -129,11 +129,7 @@ def pharmacy_dashboard(request):
         order_status='ready_for_delivery'
     ).count()
 
-    # Productos con stock bajo (< 10 unidades)
-    low_stock_products = pharmacy.products.filter(
-        stock_quantity__lte=10,
-        is_active=True
-    ).count()
+    low_stock_products = counters['low_stock']
 
     # Ventas del mes
     monthly_sales = Order.objects.filter(